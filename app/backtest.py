@@ -0,0 +1,308 @@
+"""
+Офлайн-бэктест стратегий по истории свечей из CandleStore.
+
+Тик за тиком по симулированным часам проходит тот же путь, что и бот:
+сборка данных промпта (CSVAnalyzerGPT) -> модель -> extract_signal_info -> проверка TP/SL -> PnL.
+Модель подключается заменой клиента: детерминированная заглушка или записанные ответы
+из ResponseCache в режиме replay (ответ находится по задаче, монете и времени свечи, а не
+по тексту промпта). Монеты обрабатываются параллельно в отдельных процессах.
+
+Запуск:
+    python -m app.backtest --store /path/to/store --start 2025-01-01 --end 2025-04-01 --llm stub
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import numpy as np
+import prompts
+from app.candle_store import CandleStore
+from app.candles import CandleFrame, TIMEFRAME_SECONDS
+from app.data_sources.base import candle_file_name
+from app.features import FeatureEngine, ema
+from app.gpt import CSVAnalyzerGPT
+from app.llm_cache import ResponseCache
+from app.position_monitor import calc_pnl, first_hits, is_short, OUTCOME_NONE, OUTCOME_TP
+from app.text_utils import extract_signal_info, extract_answer_text
+
+
+# Стратегии как в SIGNAL_JOBS_15_MIN и SIGNAL_JOBS_1_HOUR:
+# имя -> (таблица, промпт, модель, таймфреймы файлов). Анализ выполняется раз в свечу
+# основного (первого) таймфрейма, как у 15-минутного и часового расписаний бота.
+STRATEGIES = {
+    "RR3/M15": ("RR3", prompts.prompt_M15_RR3, "o1", ("M15", "H1", "H4")),
+    "RR5/M15": ("RR5", prompts.prompt_H1_RR3, "o1", ("M15", "H1", "H4")),
+    "RR3/H1": ("RR3", prompts.prompt_M15_RR5, "o1", ("H1", "H4", "D1")),
+    "RR5/H1": ("RR5", prompts.prompt_H1_RR5, "o1", ("H1", "H4", "D1")),
+}
+
+
+class StoreSnapshot:
+    """
+    Хранилище свечей на момент as_of: видны только свечи, закрывшиеся к этому времени.
+    Повторяет интерфейс CandleStore для чтения (meta, read), поэтому подставляется
+    в CSVAnalyzerGPT и FeatureEngine вместо настоящего хранилища.
+    """
+
+    def __init__(self, store, as_of=0):
+        self.store = store
+        self.as_of = as_of
+        self._times = {}
+
+    def _rows(self, coin, timeframe):
+        key = (coin, timeframe)
+        if key not in self._times:
+            frame = self.store.read(coin, timeframe)
+            self._times[key] = None if frame is None else frame["time"]
+        times = self._times[key]
+        if times is None:
+            return None
+        return int(np.searchsorted(times, self.as_of - TIMEFRAME_SECONDS[timeframe], side="right"))
+
+    def meta(self, coin, timeframe):
+        meta = self.store.meta(coin, timeframe)
+        rows = self._rows(coin, timeframe)
+        if meta is None or rows is None:
+            return None
+        return {"columns": meta["columns"], "rows": rows, "fetched_at": self.as_of}
+
+    def read(self, coin, timeframe, bars=None):
+        rows = self._rows(coin, timeframe)
+        if rows is None:
+            return None
+        frame = self.store.read(coin, timeframe)
+        start = 0 if bars is None else max(rows - bars, 0)
+        return CandleFrame({name: values[start:rows] for name, values in frame.columns.items()})
+
+
+class StubClient:
+    """
+    Детерминированная замена AsyncOpenAI для бэктеста.
+    Сигнал - пересечение EMA20 и EMA50 на закрытых свечах M15, SL - за 1.5 среднего диапазона
+    свечи, TP - на RR из вопроса ('RR не менее 1:N'). Ответ в формате, который просит промпт.
+    """
+
+    def __init__(self, snapshot, coin, timeframe="M15", history=300):
+        self.snapshot = snapshot
+        self.coin = coin
+        self.timeframe = timeframe
+        self.history = history
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def answer(self, question):
+        frame = self.snapshot.read(self.coin, self.timeframe, self.history)
+        if frame is None or len(frame) < 60:
+            return "{Сигнал: нет}"
+        close = np.asarray(frame["close"], dtype=np.float64)
+        fast, slow = ema(close, 2 / 21), ema(close, 2 / 51)
+        crossed_up = fast[-2] <= slow[-2] and fast[-1] > slow[-1]
+        crossed_down = fast[-2] >= slow[-2] and fast[-1] < slow[-1]
+        if not (crossed_up or crossed_down):
+            return "{Сигнал: нет}"
+
+        rr_match = re.search(r"RR не менее 1:(\d+)", question)
+        rr = int(rr_match.group(1)) if rr_match else 3
+        entry = close[-1]
+        risk = 1.5 * float(np.mean(frame["high"][-14:] - frame["low"][-14:]))
+        direction = 1 if crossed_up else -1
+        return (f"{{Сигнал: {'лонг' if crossed_up else 'шорт'}, Вход: {entry:.2f}, "
+                f"SL: {entry - direction * risk:.2f}, TP: {entry + direction * rr * risk:.2f}, RR: 1:{rr}}}")
+
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        content = self.answer(messages[-1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _parse_date(value):
+    return int(datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp())
+
+
+async def _replay(coin, params):
+    store = CandleStore(params["store_dir"])
+    snapshot = StoreSnapshot(store)
+    if params["llm"] == "stub":
+        client, cache = StubClient(snapshot, coin), None
+    else:
+        client, cache = None, ResponseCache(params["cache_path"], mode="replay")
+    analyzer = CSVAnalyzerGPT(
+        api_key=None, store=snapshot, cache=cache, client=client, compact=params["compact"],
+        features=FeatureEngine(snapshot) if params["features"] else None,
+        features_max_row=params["features_max_row"])
+
+    # Свечи для проверки TP/SL - вся история, как у PositionMonitor
+    bars = store.read(coin, params["bar_timeframe"])
+    if bars is None:
+        logging.warning(f"{coin}: нет свечей {params['bar_timeframe']} в хранилище, пропускаем.")
+        return []
+    bar_period = TIMEFRAME_SECONDS[params["bar_timeframe"]]
+
+    trades = []
+    busy_until = {name: 0 for name in params["strategies"]}
+    misses = 0
+    step = params["step"]
+    first_tick = (params["start"] // step + 1) * step
+    for tick in range(first_tick, params["end"], step):
+        snapshot.as_of = tick
+        for name, (table, question, model_name, timeframes) in params["strategies"].items():
+            if tick % TIMEFRAME_SECONDS[timeframes[0]]:
+                continue  # Расписание стратегии не срабатывает на этом тике
+            if tick < busy_until[name]:
+                continue  # Позиция стратегии ещё открыта - анализ пропускается, как в боте
+            file_names = [candle_file_name(coin, timeframe) for timeframe in timeframes]
+            try:
+                answer = await analyzer.ask_gpt_about_csvs(file_names, question, model_name, params["max_row"])
+            except LookupError:
+                misses += 1
+                continue
+            format_text = extract_answer_text(answer)
+            if not format_text:
+                continue
+            _, db_data = extract_signal_info(format_text, timeframes[0], coin, "3")
+            if db_data["signal"] is None or None in (db_data["open"], db_data["SL"], db_data["TP"]):
+                continue
+
+            # Первое срабатывание TP/SL по свечам, открывшимся после входа
+            start = int(np.searchsorted(bars["time"], tick, side="left"))
+            short = is_short(db_data["signal"])
+            outcomes, indexes = first_hits(
+                bars["high"], bars["low"], [start], [short], [db_data["TP"]], [db_data["SL"]])
+            closed_at = int(bars["time"][indexes[0]]) + bar_period if outcomes[0] != OUTCOME_NONE else None
+            busy_until[name] = closed_at or params["end"]
+            trades.append(dict(db_data, table=table, strategy=name, opened_at=tick, closed_at=closed_at,
+                               outcome=int(outcomes[0]), short=short))
+
+    if misses:
+        logging.warning(f"{coin}: {misses} запросов без записанного ответа пропущено.")
+    return trades
+
+
+def replay_symbol(coin, params):
+    """Прогон одной монеты, выполняется в отдельном процессе."""
+    started = time.perf_counter()
+    trades = asyncio.run(_replay(coin, params))
+    print(f"{coin}: {len(trades)} сделок за {time.perf_counter() - started:.1f} с.")
+    return trades
+
+
+def compute_pnl(trades):
+    """Считает PnL закрытых сделок одним векторным вызовом calc_pnl."""
+    closed = [trade for trade in trades if trade["outcome"] != OUTCOME_NONE]
+    if not closed:
+        return trades
+    is_tp = np.array([trade["outcome"] == OUTCOME_TP for trade in closed])
+    exit_price = np.where(is_tp, [trade["TP"] for trade in closed], [trade["SL"] for trade in closed])
+    pnl = calc_pnl(np.array([trade["short"] for trade in closed]),
+                   np.array([trade["open"] for trade in closed]), exit_price, is_tp)
+    for trade, value in zip(closed, np.atleast_1d(pnl)):
+        trade["pnl"] = float(value)
+    return trades
+
+
+def build_report(trades):
+    """
+    Отчёт по стратегиям: число сделок, TP/SL, винрейт, кумулятивный PnL и максимальная просадка.
+    """
+    report = {}
+    for strategy in sorted({trade["strategy"] for trade in trades}):
+        table_trades = sorted((trade for trade in trades if trade["strategy"] == strategy),
+                              key=lambda trade: trade["closed_at"] or float("inf"))
+        pnl = np.array([trade["pnl"] for trade in table_trades if trade["outcome"] != OUTCOME_NONE])
+        equity = np.cumsum(pnl)
+        drawdown = float(np.max(np.maximum.accumulate(np.concatenate(([0], equity)))[1:] - equity)) if len(pnl) else 0.0
+        wins = int(np.sum(pnl > 0))
+        report[strategy] = {
+            "trades": len(table_trades),
+            "tp": wins,
+            "sl": int(np.sum(pnl < 0)),
+            "open": len(table_trades) - len(pnl),
+            "win_rate": round(wins / len(pnl) * 100, 1) if len(pnl) else 0.0,
+            "cumulative_pnl": round(float(equity[-1]), 3) if len(pnl) else 0.0,
+            "max_drawdown": round(drawdown, 3),
+        }
+    return report
+
+
+def run_backtest(store_dir, coins, start, end, llm="stub", cache_path="", strategies=None,
+                 max_row=200, compact=True, features=False, features_max_row=60,
+                 bar_timeframe="M15", step=900, workers=None):
+    """
+    Прогоняет стратегии по истории.
+    :param store_dir: Директория CandleStore.
+    :param coins: Монеты, каждая обрабатывается в отдельном процессе.
+    :param start: Начало периода (unix).
+    :param end: Конец периода (unix).
+    :param llm: "stub" - детерминированная заглушка, "replay" - записанные ответы из кэша.
+    :param cache_path: Файл ResponseCache для режима replay.
+    :param strategies: Словарь стратегий как STRATEGIES, по умолчанию все.
+    :param step: Шаг симулированных часов в секундах (не больше свечи самого короткого расписания).
+    :return: Кортеж (сделки, отчёт по таблицам).
+    """
+    params = {
+        "store_dir": store_dir, "start": start, "end": end, "llm": llm, "cache_path": cache_path,
+        "strategies": strategies or STRATEGIES, "max_row": max_row, "compact": compact,
+        "features": features, "features_max_row": features_max_row,
+        "bar_timeframe": bar_timeframe, "step": step,
+    }
+    trades = []
+    with ProcessPoolExecutor(max_workers=workers or len(coins)) as executor:
+        for coin_trades in executor.map(replay_symbol, coins, [params] * len(coins)):
+            trades.extend(coin_trades)
+    compute_pnl(trades)
+    return trades, build_report(trades)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-бэктест стратегий по хранилищу свечей.")
+    parser.add_argument("--store", required=True, help="Директория CandleStore")
+    parser.add_argument("--coins", default="BTC,ETH,SOL")
+    parser.add_argument("--start", required=True, help="Начало периода, YYYY-MM-DD (UTC)")
+    parser.add_argument("--end", required=True, help="Конец периода, YYYY-MM-DD (UTC)")
+    parser.add_argument("--llm", choices=("stub", "replay"), default="stub",
+                        help="stub - сигналы по пересечению EMA, replay - ответы, записанные ботом "
+                             "в кэш (LLM_CACHE_PATH) для тех же задач, монет и свечей")
+    parser.add_argument("--cache", default="", help="Файл кэша ответов для --llm replay")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES),
+                        help=f"Стратегии через запятую: {', '.join(STRATEGIES)} "
+                             f"(M15 - 15-минутное расписание, H1 - часовое)")
+    parser.add_argument("--max-row", type=int, default=200)
+    parser.add_argument("--raw", action="store_true", help="Строки CSV вместо компактного формата")
+    parser.add_argument("--features", action="store_true", help="Добавлять сводку индикаторов")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--json", default="", help="Файл для сохранения сделок и отчёта")
+    args = parser.parse_args()
+    if args.llm == "replay" and not args.cache:
+        parser.error("для --llm replay нужен --cache")
+
+    # Сборка промпта на каждом тике пишет подробные логи - в бэктесте нужны только предупреждения
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    started = time.perf_counter()
+    unknown = set(args.strategies.split(",")) - set(STRATEGIES)
+    if unknown:
+        parser.error(f"неизвестные стратегии: {', '.join(sorted(unknown))}")
+    trades, report = run_backtest(
+        args.store, args.coins.split(","), _parse_date(args.start), _parse_date(args.end),
+        llm=args.llm, cache_path=args.cache, max_row=args.max_row, compact=not args.raw,
+        strategies={name: STRATEGIES[name] for name in args.strategies.split(",")},
+        features=args.features, workers=args.workers)
+
+    print(f"{'стратегия':<9} {'сделок':>7} {'TP':>5} {'SL':>5} {'откр.':>6} {'винрейт':>8} {'PnL, %':>9} {'просадка':>9}")
+    for strategy, row in report.items():
+        print(f"{strategy:<9} {row['trades']:>7} {row['tp']:>5} {row['sl']:>5} {row['open']:>6} "
+              f"{row['win_rate']:>7.1f}% {row['cumulative_pnl']:>9.3f} {row['max_drawdown']:>9.3f}")
+    print(f"Бэктест выполнен за {time.perf_counter() - started:.1f} с.")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"report": report, "trades": trades}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
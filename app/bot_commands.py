@@ -0,0 +1,21 @@
+from aiogram import Router
+from aiogram.filters import Command
+
+
+def create_router(snapshot):
+    """
+    Команды бота, которые отвечают из TradingSnapshot без запросов к базе.
+    :param snapshot: TradingSnapshot.
+    :return: aiogram Router.
+    """
+    router = Router()
+
+    @router.message(Command("positions"))
+    async def positions_command(message):
+        await message.answer(snapshot.positions_text())
+
+    @router.message(Command("stats"))
+    async def stats_command(message):
+        await message.answer(snapshot.stats_text())
+
+    return router
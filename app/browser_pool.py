@@ -0,0 +1,168 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from app.tradingview import TradingViewButtonClicker, CHART_URL
+from app.metrics import metrics
+
+
+def _children_map():
+    """Возвращает словарь {pid родителя: [pid потомков]} по данным /proc."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Имя процесса может содержать пробелы, поэтому берём поля после ')'
+        fields = stat.rsplit(")", 1)[1].split()
+        children.setdefault(int(fields[1]), []).append(int(entry))
+    return children
+
+
+def process_rss_mb(pid=None):
+    """Возвращает RSS процесса в мегабайтах (0, если процесс недоступен), по умолчанию текущего."""
+    try:
+        with open(f"/proc/{pid or os.getpid()}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0
+
+
+def children_rss_mb(pid=None):
+    """
+    Суммарная память (RSS) всех дочерних процессов, т.е. драйвера Playwright и Chromium.
+    :param pid: Корневой процесс, по умолчанию текущий.
+    :return: Память в мегабайтах. Вне Linux возвращает 0.
+    """
+    if not os.path.isdir("/proc"):
+        return 0
+    children = _children_map()
+    stack = list(children.get(pid or os.getpid(), []))
+    total = 0
+    while stack:
+        child = stack.pop()
+        total += process_rss_mb(child)
+        stack.extend(children.get(child, []))
+    return total
+
+
+class BrowserPool:
+    """
+    Долгоживущий браузер с пулом загруженных вкладок графика.
+    Запускается один раз при старте бота, между циклами вкладки переиспользуются:
+    мёртвые вкладки пересоздаются, устаревшие перезагружаются, а весь контекст
+    перезапускается после restart_every циклов или при превышении memory_limit_mb.
+    """
+
+    def __init__(self, user_data_dir, downloads_dir, cookies_file, tabs_count=9,
+                 restart_every=96, memory_limit_mb=3000, tab_max_age=3600, chart_url=CHART_URL,
+                 step_timeouts=None):
+        self.user_data_dir = user_data_dir
+        self.downloads_dir = downloads_dir
+        self.cookies_file = cookies_file
+        self.tabs_count = tabs_count
+        self.restart_every = restart_every
+        self.memory_limit_mb = memory_limit_mb
+        self.tab_max_age = tab_max_age
+        self.chart_url = chart_url
+        self.step_timeouts = step_timeouts
+
+        self.clicker = None
+        self.cycles = 0
+        self.loaded_at = []  # Время загрузки каждой вкладки (time.monotonic)
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        """Запускает браузер и открывает вкладки."""
+        started = time.monotonic()
+        self.clicker = TradingViewButtonClicker(
+            self.user_data_dir, self.downloads_dir, self.cookies_file, self.chart_url,
+            self.step_timeouts)
+        await self.clicker.open_browser()
+        await self.clicker.open_tabs(self.tabs_count)
+        self.loaded_at = [time.monotonic()] * len(self.clicker.pages)
+        self.cycles = 0
+        logging.info(
+            f"Пул браузера запущен: {self.tabs_count} вкладок за {time.monotonic() - started:.1f} с.")
+
+    async def stop(self):
+        """Закрывает браузер."""
+        if self.clicker:
+            try:
+                await self.clicker.close_browser()
+            except Exception as e:
+                logging.error(f"Ошибка при закрытии браузера: {e}")
+            self.clicker = None
+            logging.info("Пул браузера остановлен.")
+
+    async def restart(self, reason):
+        """Полностью перезапускает контекст браузера."""
+        logging.info(f"Перезапуск браузера: {reason}")
+        await self.stop()
+        await self.start()
+
+    def _restart_reason(self):
+        """Возвращает причину для перезапуска контекста или None."""
+        if self.restart_every and self.cycles >= self.restart_every:
+            return f"выполнено {self.cycles} циклов"
+        if self.memory_limit_mb:
+            memory_mb = children_rss_mb()
+            if memory_mb > self.memory_limit_mb:
+                return f"память Chromium {memory_mb:.0f} МБ > {self.memory_limit_mb} МБ"
+        return None
+
+    async def _refresh_tabs(self):
+        """Проверяет вкладки: мёртвые пересоздаёт, устаревшие перезагружает."""
+        now = time.monotonic()
+        for index, page in enumerate(self.clicker.pages):
+            if not await self.clicker.is_page_alive(page):
+                logging.warning(f"Вкладка {index} не отвечает, пересоздаём.")
+                self.clicker.lookup.forget(page)
+                if not page.is_closed():
+                    await page.close()
+                self.clicker.pages[index] = await self.clicker.open_tab()
+                self.loaded_at[index] = time.monotonic()
+            elif self.tab_max_age and now - self.loaded_at[index] > self.tab_max_age:
+                logging.info(f"Вкладка {index} устарела, перезагружаем.")
+                self.clicker.lookup.forget(page)
+                with metrics.span("tab_load", reason="reload"):
+                    await page.reload(wait_until="domcontentloaded")
+                self.loaded_at[index] = time.monotonic()
+
+    async def _ensure_ready(self):
+        """Готовит браузер к очередному циклу."""
+        if self.clicker is None:
+            await self.start()
+            return
+
+        reason = self._restart_reason()
+        if reason:
+            await self.restart(reason)
+            return
+
+        try:
+            await self._refresh_tabs()
+        except Exception as e:
+            # Контекст браузера сломан целиком (например, упал Chromium)
+            await self.restart(f"ошибка при проверке вкладок: {e}")
+
+    @asynccontextmanager
+    async def session(self):
+        """
+        Выдаёт готовый к работе TradingViewButtonClicker на один цикл выгрузки.
+        Циклы выполняются строго по очереди.
+        """
+        async with self._lock:
+            await self._ensure_ready()
+            try:
+                yield self.clicker
+            finally:
+                self.cycles += 1
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+from app.candles import CandleFrame
+from app.data_sources.base import candle_file_name
+
+
+class CandleStore:
+    """
+    Колоночное хранилище свечей по (монета, таймфрейм).
+    Каждая колонка лежит в отдельном бинарном файле (time - int64, остальные - float64),
+    описание колонок и число свечей - в meta.json. Свежая выгрузка сливается с историей:
+    свечи с совпадающим временем перезаписываются, новые дописываются в конец,
+    поэтому история может быть намного длиннее одной выгрузки.
+    Чтение возвращает срезы np.memmap без копирования и без разбора CSV.
+    """
+
+    def __init__(self, root_dir):
+        """
+        :param root_dir: Директория хранилища.
+        """
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._meta_cache = {}  # {(монета, таймфрейм): (подпись meta.json, описание)}
+
+    def _series_dir(self, coin, timeframe):
+        return os.path.join(self.root_dir, os.path.splitext(candle_file_name(coin, timeframe))[0])
+
+    def _column_path(self, coin, timeframe, index):
+        return os.path.join(self._series_dir(coin, timeframe), f"{index}.bin")
+
+    @staticmethod
+    def _dtype(name):
+        return np.int64 if name == "time" else np.float64
+
+    def meta(self, coin, timeframe):
+        """
+        Возвращает описание ряда: {'columns': [...], 'rows': N, 'fetched_at': unix-время последней загрузки}.
+        Если ряда нет, возвращает None.
+        Файл перечитывается, когда он изменился: в режиме воркеров хранилище пополняет
+        другой процесс.
+        """
+        key = (coin, timeframe)
+        meta_path = os.path.join(self._series_dir(coin, timeframe), "meta.json")
+        try:
+            signature = _file_signature(meta_path)
+        except FileNotFoundError:
+            self._meta_cache.pop(key, None)
+            return None
+        cached = self._meta_cache.get(key)
+        if cached is None or cached[0] != signature:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                cached = (signature, json.load(f))
+            self._meta_cache[key] = cached
+        return cached[1]
+
+    def _write_meta(self, coin, timeframe, meta):
+        meta_path = os.path.join(self._series_dir(coin, timeframe), "meta.json")
+        tmp_path = meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, meta_path)
+        self._meta_cache[(coin, timeframe)] = (_file_signature(meta_path), meta)
+
+    def ingest(self, frame, coin, timeframe, fetched_at=None):
+        """
+        Сливает свежие свечи с хранилищем.
+        :param frame: CandleFrame из выгрузки.
+        :param fetched_at: Время загрузки (unix), по умолчанию текущее.
+        :return: Число новых свечей.
+        """
+        fetched_at = fetched_at or time.time()
+        columns = _dedupe(frame.columns)
+        if not len(columns["time"]):
+            return 0
+
+        meta = self.meta(coin, timeframe)
+        if meta is None:
+            names = list(columns)
+            keep_rows = 0
+            old_rows = 0
+        else:
+            # Колонки, которых нет в выгрузке или в истории, заполняются NaN: история не теряется
+            names = meta["columns"] + [name for name in columns if name not in meta["columns"]]
+            if set(names) != set(columns):
+                logging.warning(
+                    f"{timeframe} {coin}: набор колонок изменился, новые: "
+                    f"{[name for name in columns if name not in meta['columns']]}, "
+                    f"нет в выгрузке: {[name for name in meta['columns'] if name not in columns]}.")
+            old_rows = meta["rows"]
+            stored_time = self.read(coin, timeframe)["time"]
+            if old_rows and columns["time"][-1] < stored_time[-1]:
+                logging.warning(f"{timeframe} {coin}: выгрузка старее хранилища, пропускаем.")
+                return 0
+            keep_rows = int(np.searchsorted(stored_time, columns["time"][0], side="left"))
+            del stored_time  # Закрываем отображение файла
+
+        os.makedirs(self._series_dir(coin, timeframe), exist_ok=True)
+        new_rows = len(columns["time"])
+        for index, name in enumerate(names):
+            dtype = self._dtype(name)
+            path = self._column_path(coin, timeframe, index)
+            if name in columns:
+                values = np.ascontiguousarray(columns[name], dtype=dtype)
+            else:
+                values = np.full(new_rows, np.nan, dtype=dtype)
+            # Файл колонки не меняется на месте: читатели этого и других процессов держат
+            # np.memmap на старый файл, укорачивание отображённого файла завершает их по SIGBUS.
+            # Новая версия пишется рядом и подменяет старую через os.replace
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                if keep_rows:
+                    if meta is not None and name in meta["columns"]:
+                        with open(path, "rb") as stored:
+                            f.write(stored.read(keep_rows * values.itemsize))
+                    else:
+                        f.write(np.full(keep_rows, np.nan, dtype=dtype).tobytes())
+                f.write(values.tobytes())
+            os.replace(tmp_path, path)
+
+        rows = keep_rows + len(columns["time"])
+        self._write_meta(coin, timeframe, {"columns": names, "rows": rows, "fetched_at": fetched_at})
+        return max(rows - old_rows, 0)
+
+    def ingest_file(self, file_path, coin, timeframe, fetched_at=None):
+        """Сливает с хранилищем файл выгрузки TradingView."""
+        fetched_at = fetched_at or os.path.getmtime(file_path)
+        return self.ingest(CandleFrame.from_csv(file_path), coin, timeframe, fetched_at)
+
+    def ingest_frames(self, frames, fetched_at=None):
+        """
+        Сливает с хранилищем результат DataSource.fetch_many.
+        :param frames: Словарь {(монета, таймфрейм): CandleFrame}.
+        """
+        for (coin, timeframe), frame in frames.items():
+            try:
+                new_rows = self.ingest(frame, coin, timeframe, fetched_at)
+                logging.info(f"{timeframe} {coin}: добавлено {new_rows} новых свечей.")
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении свечей {timeframe} {coin}: {e}")
+
+    def read(self, coin, timeframe, bars=None):
+        """
+        Возвращает свечи из хранилища без копирования данных.
+        :param bars: Число последних свечей, по умолчанию вся история.
+        :return: CandleFrame со срезами np.memmap или None, если ряда нет.
+        """
+        meta = self.meta(coin, timeframe)
+        if meta is None:
+            return None
+
+        rows = meta["rows"]
+        paths = [self._column_path(coin, timeframe, index) for index in range(len(meta["columns"]))]
+        # Другой процесс может как раз переписывать колонки: читаем только свечи,
+        # которые целиком есть во всех файлах
+        available = min((_file_rows(path, self._dtype(name)) for path, name in zip(paths, meta["columns"])),
+                        default=0)
+        if available < rows:
+            logging.warning(f"{timeframe} {coin}: в файлах колонок {available} свечей из {rows}, "
+                            f"ряд дописывается.")
+            rows = available
+        start = 0 if bars is None else max(rows - bars, 0)
+        columns = {}
+        for path, name in zip(paths, meta["columns"]):
+            if rows:
+                values = np.memmap(path, dtype=self._dtype(name), mode="r", shape=(rows,))
+            else:
+                values = np.empty(0, dtype=self._dtype(name))
+            columns[name] = values[start:]
+        return CandleFrame(columns)
+
+    def last_time(self, coin, timeframe):
+        """Время открытия последней свечи (unix) или None."""
+        meta = self.meta(coin, timeframe)
+        if not meta or not meta["rows"]:
+            return None
+        return int(self.read(coin, timeframe, 1)["time"][-1])
+
+
+def _file_signature(path):
+    """Подпись файла для проверки, что он не изменился: inode, время изменения и размер."""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _file_rows(path, dtype):
+    """Число значений dtype, целиком записанных в файл колонки."""
+    try:
+        return os.path.getsize(path) // np.dtype(dtype).itemsize
+    except FileNotFoundError:
+        return 0
+
+
+def _dedupe(columns):
+    """Сортирует свечи по времени и оставляет последнюю из свечей с одинаковым временем."""
+    times = np.asarray(columns["time"])
+    if len(times) < 2 or np.all(np.diff(times) > 0):
+        return columns
+    order = np.argsort(times, kind="stable")
+    sorted_times = times[order]
+    keep = order[np.append(sorted_times[1:] != sorted_times[:-1], True)]
+    return {name: np.asarray(values)[keep] for name, values in columns.items()}
@@ -0,0 +1,120 @@
+import csv
+from datetime import datetime
+import numpy as np
+
+
+# Обязательные колонки свечного фрейма
+REQUIRED_COLUMNS = ("time", "open", "high", "low", "close")
+
+# Длительность свечи каждого таймфрейма в секундах
+TIMEFRAME_SECONDS = {"M15": 900, "H1": 3600, "H4": 14400, "D1": 86400}
+
+
+def parse_time(value):
+    """
+    Переводит время из выгрузки TradingView в unix-секунды.
+    Поддерживаются 'Временной шаг UNIX' (число) и 'Время в формате ISO'.
+    """
+    try:
+        return int(float(value))
+    except ValueError:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
+
+
+def parse_float(value):
+    """Переводит значение ячейки в float, пустые ячейки и 'NaN' становятся nan."""
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+class CandleFrame:
+    """
+    Свечи одного символа и таймфрейма в памяти: колонка 'time' (unix-секунды, int64)
+    и числовые колонки float64 (open, high, low, close, Volume и индикаторы из выгрузки).
+    Одинаково строится из файла выгрузки TradingView и из ответа API биржи.
+    """
+
+    def __init__(self, columns):
+        """
+        :param columns: Словарь {имя колонки: массив}, порядок ключей задаёт порядок колонок.
+        """
+        missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+        if missing:
+            raise ValueError(f"В свечах нет колонок: {', '.join(missing)}")
+
+        self.columns = {}
+        for name, values in columns.items():
+            dtype = np.int64 if name == "time" else np.float64
+            self.columns[name] = np.asarray(values, dtype=dtype)
+
+    @classmethod
+    def from_rows(cls, header, rows):
+        """Строит фрейм из заголовка и строк CSV (списков строк)."""
+        columns = {name: [] for name in header}
+        for row in rows:
+            if len(row) != len(header):
+                continue  # Обрезанная или пустая строка
+            for name, value in zip(header, row):
+                columns[name].append(parse_time(value) if name == "time" else parse_float(value))
+        return cls(columns)
+
+    @classmethod
+    def from_csv(cls, file_path):
+        """Читает выгрузку TradingView."""
+        with open(file_path, mode="r", encoding="utf-8", newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if header is None:
+                raise ValueError(f"Файл {file_path} пуст.")
+            return cls.from_rows(header, reader)
+
+    def to_lines(self):
+        """
+        Возвращает свечи в виде строк CSV (время в unix-секундах).
+        :return: Кортеж (заголовок, список строк).
+        """
+        names = list(self.columns)
+        rows = [",".join(self._format(name, self.columns[name][index]) for name in names)
+                for index in range(len(self))]
+        return ",".join(names), rows
+
+    def to_csv(self, file_path):
+        """Сохраняет свечи в формате выгрузки TradingView (время в unix-секундах)."""
+        header, rows = self.to_lines()
+        with open(file_path, mode="w", encoding="utf-8", newline="") as file:
+            file.write(header + "\n")
+            for row in rows:
+                file.write(row + "\n")
+
+    @staticmethod
+    def _format(name, value):
+        if name == "time":
+            return str(int(value))
+        if np.isnan(value):
+            return "NaN"
+        return repr(float(value))
+
+    def tail(self, bars):
+        """Возвращает фрейм с последними bars свечами (срезы без копирования)."""
+        start = max(len(self) - bars, 0)
+        return CandleFrame({name: values[start:] for name, values in self.columns.items()})
+
+    def bar_period(self):
+        """
+        Шаг свечей в секундах: медиана разностей времени, пропуски в истории на неё не влияют.
+        :return: Число секунд или None, если свечей меньше двух.
+        """
+        if len(self) < 2:
+            return None
+        return int(np.median(np.diff(self.columns["time"])))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns["time"])
+
+    def __repr__(self):
+        return f"CandleFrame({len(self)} свечей, колонки: {', '.join(self.columns)})"
@@ -1,87 +1,249 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
+from app.candles import CandleFrame
+from app.data_sources.base import split_candle_file_name
+from app.prompt_encoding import encode_frame, estimate_tokens, fit_rows
 
 
-def csvs_to_text(csv_file_names, downloads_dir, max_row):
+def read_tail_lines(file_path, max_row, block_size=65536):
+    """
+    Читает заголовок и последние строки CSV-файла, не читая файл целиком:
+    файл читается блоками с конца, пока не наберётся max_row строк.
+    :param file_path: Путь к CSV-файлу.
+    :param max_row: Сколько последних строк вернуть.
+    :param block_size: Размер блока чтения в байтах.
+    :return: Кортеж (заголовок, список последних строк) без символов перевода строки.
+    """
+    with open(file_path, mode="rb") as file:
+        header = file.readline()
+        data_start = file.tell()
+        position = file.seek(0, os.SEEK_END)
+
+        data = b""
+        # +1 строка на возможный обрезанный начальный кусок блока и +1 на перевод строки в конце файла
+        while position > data_start and data.count(b"\n") <= max_row + 1:
+            read_size = min(block_size, position - data_start)
+            position -= read_size
+            file.seek(position)
+            data = file.read(read_size) + data
+
+    lines = data.splitlines()
+    if position > data_start and lines:
+        lines = lines[1:]  # Первая строка блока может быть обрезана
+    lines = [line.decode("utf-8") for line in lines if line.strip()]
+    return header.decode("utf-8").strip(), lines[-max_row:] if max_row > 0 else []
+
+
+@lru_cache(maxsize=128)
+def header_index(header):
+    """
+    Возвращает словарь {имя колонки: индекс} для строки заголовка.
+    Результат кэшируется: у выгрузок одного графика заголовок не меняется между циклами.
+    """
+    return {name: index for index, name in enumerate(header.split(","))}
+
+
+def read_store_tail(store, file_name, max_row):
+    """
+    Читает последние строки ряда из хранилища свечей вместо CSV-файла.
+    :param store: CandleStore или None.
+    :param file_name: Имя файла выгрузки, например 'M15_BTC.csv'.
+    :return: Кортеж (заголовок, строки) или None, если ряда в хранилище нет.
+    """
+    if store is None:
+        return None
+    coin, timeframe = split_candle_file_name(file_name)
+    frame = store.read(coin, timeframe, max_row)
+    if frame is None or not len(frame):
+        return None
+    return frame.to_lines()
+
+
+class ContextCache:
+    """
+    LRU-кэш текстовых блоков для промпта.
+    Ключ включает версию данных (mtime и размер файла или версию ряда в хранилище) и max_row,
+    поэтому повторные запросы к тем же данным в одном тике не перестраивают текст,
+    а обновлённая выгрузка автоматически получает новый ключ.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, key, build):
+        """Возвращает значение по ключу, при промахе строит его через build()."""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+        value = build()
+        with self._lock:
+            self.misses += 1
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+context_cache = ContextCache()
+
+
+def _data_version(file_name, file_path, store):
+    """
+    Возвращает версию данных для ключа кэша или None, если данных нет.
+    Для ряда из хранилища - число свечей и время загрузки, для файла - mtime и размер.
+    """
+    if store is not None:
+        coin, timeframe = split_candle_file_name(file_name)
+        meta = store.meta(coin, timeframe)
+        if meta and meta["rows"]:
+            return ("store", id(store), meta["rows"], meta["fetched_at"])
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return ("file", stat.st_mtime_ns, stat.st_size)
+
+
+def _read_tail(file_name, file_path, max_row, store):
+    """Возвращает заголовок и последние строки ряда из хранилища или из CSV-файла."""
+    stored = read_store_tail(store, file_name, max_row)
+    if stored is not None:
+        return stored
+    # Читаем первую строку и последние max_row строк с конца файла
+    return read_tail_lines(file_path, max_row)
+
+
+def _build_block(file_name, file_path, max_row, store):
+    """Строит блок промпта для одного файла: заголовок и последние строки в фигурных скобках."""
+    first_line, last_100_lines = _read_tail(file_name, file_path, max_row, store)
+
+    # Оборачиваем первую строку и последние 100 строк в фигурные кавычки {}
+    wrapped_lines = [f"{{{first_line.strip()}}}"] + \
+                    [f"{{{line.strip()}}}" for line in last_100_lines]
+    return "\n".join(wrapped_lines)
+
+
+def _build_compact_block(file_name, file_path, max_row, store):
+    """Строит компактный блок промпта для одного файла (см. app/prompt_encoding.py)."""
+    coin, timeframe = split_candle_file_name(file_name)
+    frame = store.read(coin, timeframe, max_row) if store is not None else None
+    if frame is None or not len(frame):
+        header, lines = read_tail_lines(file_path, max_row)
+        frame = CandleFrame.from_rows(header.split(","), [line.split(",") for line in lines])
+    return encode_frame(frame, f"{timeframe}_{coin}")
+
+
+def csvs_to_text(csv_file_names, downloads_dir, max_row, store=None, dump_path=None,
+                 compact=False, token_budget=None):
     """
     Функция для преобразования CSV-файлов в текстовый формат.
     :param csv_file_names: Список имен CSV-файлов.
     :param downloads_dir: Путь к директории с файлами.
+    :param max_row: Максимум последних строк на файл.
+    :param store: CandleStore, если ряд есть в хранилище, CSV-файл не читается.
+    :param dump_path: Путь для отладочного сохранения результата, по умолчанию не сохраняется.
+    :param compact: Использовать компактное представление свечей вместо строк CSV.
+    :param token_budget: Бюджет токенов на данные, число строк уменьшается, пока текст не уложится.
     :return: Текстовое представление данных из CSV-файлов.
     """
-    csv_texts = []
+    files = []
     for i, file_name in enumerate(csv_file_names, start=1):
         file_path = downloads_dir / file_name  # Формируем полный путь
-        if not file_path.exists():  # Проверяем, существует ли файл
-            print(f"Файл {file_name} не найден, пропускаем.")
+        version = _data_version(file_name, file_path, store)
+        if version is None:  # Проверяем, существует ли файл
+            logging.warning(f"Файл {file_name} не найден, пропускаем.")
             continue
-
-        # Читаем первую строку и последние 100 строк
-        with open(file_path, mode="r", encoding="utf-8") as file:
-            first_line = file.readline()  # Читаем первую строку
-            lines = file.readlines()  # Читаем все оставшиеся строки
-
-        # Получаем последние 100 строк (или меньше, если файл маленький)
-        last_100_lines = lines[-max_row:] if len(lines) >= max_row else lines
-
-        # Оборачиваем первую строку и последние 100 строк в фигурные кавычки {}
-        wrapped_lines = [f"{{{first_line.strip()}}}"] + \
-                        [f"{{{line.strip()}}}" for line in last_100_lines]
-
-        # Добавляем результат в список
-        csv_texts.append(
-            f"Файл {i} ({file_name}):\n" + "\n".join(wrapped_lines))
-    if not csv_texts:  # Если ни один файл не был обработан
+        files.append((i, file_name, file_path, version))
+    if not files:  # Если ни один файл не был обработан
         return "Нет данных для анализа.", None
 
-    # Объединяем все строки в один текст
-    result_text = "\n".join(csv_texts)
-
-    # Синхронное сохранение результата в файл
-    with open("csv_output.txt", mode="w", encoding="utf-8") as f:
-        f.write(result_text)
+    def build_text(rows, use_compact):
+        builder = _build_compact_block if use_compact else _build_block
+        csv_texts = []
+        for i, file_name, file_path, version in files:
+            block = context_cache.get_or_build(
+                (str(file_path), version, rows, use_compact),
+                lambda: builder(file_name, file_path, rows, store))
+            csv_texts.append(f"Файл {i} ({file_name}):\n" + block)
+        # Объединяем все строки в один текст
+        return "\n".join(csv_texts)
+
+    rows, result_text = fit_rows(
+        lambda rows: build_text(rows, compact), max_row, token_budget)
+
+    # Сравнение с сырым форматом стоит ещё одной сборки текста - только если лог будет записан
+    if compact and logging.getLogger().isEnabledFor(logging.INFO):
+        raw_tokens = estimate_tokens(build_text(max_row, False))
+        compact_tokens = estimate_tokens(result_text)
+        logging.info(
+            f"Компактные данные: ~{compact_tokens} токенов вместо ~{raw_tokens} "
+            f"(сэкономлено ~{raw_tokens - compact_tokens}, строк на файл: {rows}).")
+
+    # Отладочное сохранение результата в файл конкретного запроса
+    if dump_path:
+        with open(dump_path, mode="w", encoding="utf-8") as f:
+            f.write(result_text)
 
     return result_text
 
 
-def get_last_high_low(file_name, downloads_dir):
+def get_last_high_low(file_name, downloads_dir, store=None):
     """
     Функция для получения значений high и low из последней строки CSV-файла.
     :param downloads_dir: Путь к директории с файлом.
     :param file_name: Имя CSV-файла.
+    :param store: CandleStore, если ряд есть в хранилище, CSV-файл не читается.
     :return: Кортеж (high, low) или None, если данные недоступны.
     """
+    if store is not None:
+        coin, timeframe = split_candle_file_name(file_name)
+        frame = store.read(coin, timeframe, 1)
+        if frame is not None and len(frame):
+            return float(frame["high"][-1]), float(frame["low"][-1])
+
     file_path = downloads_dir / file_name  # Формируем полный путь
 
     # Проверяем, существует ли файл и не является ли он директорией
     if not file_path.exists():
-        print(f"Файл {file_name} не найден в директории {downloads_dir}.")
+        logging.warning(f"Файл {file_name} не найден в директории {downloads_dir}.")
         return None
     if file_path.is_dir():  # Проверяем, что это не директория
-        print(f"Указанный путь {file_path} является директорией, а не файлом.")
+        logging.warning(f"Указанный путь {file_path} является директорией, а не файлом.")
+        return None
+
+    # Читаем заголовок и последнюю строку с конца файла
+    header, last_lines = read_tail_lines(file_path, 1)
+    if not header:  # Если файл пустой
+        logging.warning(f"Файл {file_name} пуст.")
+        return None
+
+    # Находим индексы столбцов high и low по закэшированному заголовку
+    columns = header_index(header)
+    if 'high' not in columns or 'low' not in columns:  # Проверяем наличие столбцов
+        logging.warning(f"Файл {file_name} не содержит столбцов high и low.")
+        return None
+    if not last_lines:
+        logging.warning(f"Файл {file_name} не содержит данных.")
         return None
 
-    # Читаем последнюю строку из файла
-    with open(file_path, mode="r", encoding="utf-8") as file:
-        lines = file.readlines()  # Читаем все строки
-        if not lines:  # Если файл пустой
-            print(f"Файл {file_name} пуст.")
-            return None
-
-        # Получаем заголовки (первую строку)
-        headers = lines[0].strip().split(",")
-        if 'high' not in headers or 'low' not in headers:  # Проверяем наличие столбцов
-            print(f"Файл {file_name} не содержит столбцов high и low.")
-            return None
-
-        # Получаем последнюю строку
-        last_line = lines[-1].strip().split(",")
-
-        # Находим индексы столбцов high и low
-        high_index = headers.index('high')
-        low_index = headers.index('low')
-
-        # Извлекаем значения high и low
-        high_value = last_line[high_index]
-        low_value = last_line[low_index]
+    # Извлекаем значения high и low из последней строки
+    last_line = last_lines[-1].split(",")
+    high_value = last_line[columns['high']]
+    low_value = last_line[columns['low']]
 
     return float(high_value), float(low_value)
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from collections import namedtuple
+
+
+# Запрос свечей: монета, таймфрейм ('M15', 'H1', 'H4', 'D1') и число последних свечей
+CandleRequest = namedtuple("CandleRequest", ["coin", "timeframe", "bars"])
+
+
+def candle_file_name(coin, timeframe):
+    """Имя файла со свечами в директории загрузок, например 'M15_BTC.csv'."""
+    return f"{timeframe}_{coin}.csv"
+
+
+def split_candle_file_name(file_name):
+    """Разбирает имя файла со свечами: 'M15_BTC.csv' -> ('BTC', 'M15')."""
+    timeframe, coin = file_name.rsplit(".", 1)[0].split("_", 1)
+    return coin, timeframe
+
+
+class DataSource:
+    """
+    Источник OHLCV-свечей для планировщика.
+    Реализация получает свечи для (монета, таймфрейм, N свечей), сохраняет их в директорию
+    загрузок в формате выгрузки TradingView и возвращает CandleFrame.
+    """
+
+    async def start(self):
+        """Подготавливает источник (браузер, пул соединений)."""
+
+    async def stop(self):
+        """Освобождает ресурсы источника."""
+
+    async def fetch(self, coin, timeframe, bars):
+        """
+        Возвращает последние bars свечей.
+        :return: CandleFrame.
+        """
+        frames = await self.fetch_many([CandleRequest(coin, timeframe, bars)])
+        return frames[(coin, timeframe)]
+
+    async def fetch_many(self, requests):
+        """
+        Получает свечи для нескольких запросов.
+        :param requests: Список CandleRequest.
+        :return: Словарь {(монета, таймфрейм): CandleFrame}, неудачные запросы пропускаются.
+        """
+        raise NotImplementedError
+
+    @staticmethod
+    async def _gather(requests, fetch_one):
+        """Выполняет fetch_one для каждого запроса параллельно и собирает успешные результаты."""
+        results = await asyncio.gather(
+            *(fetch_one(request) for request in requests), return_exceptions=True)
+        frames = {}
+        for request, result in zip(requests, results):
+            if isinstance(result, BaseException):
+                logging.error(
+                    f"Не удалось получить свечи {request.timeframe} {request.coin}: {result}")
+            else:
+                frames[(request.coin, request.timeframe)] = result
+        return frames
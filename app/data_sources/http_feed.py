@@ -0,0 +1,100 @@
+import os
+import asyncio
+import logging
+import aiohttp
+from app.candles import CandleFrame
+from app.data_sources.base import DataSource, candle_file_name
+from app.metrics import metrics
+
+
+# Интервалы свечей в API фьючерсов Binance
+FEED_INTERVALS = {"M15": "15m", "H1": "1h", "H4": "4h", "D1": "1d"}
+
+
+class HttpFeedSource(DataSource):
+    """
+    Свечи напрямую из REST API биржи (формат /fapi/v1/klines фьючерсов Binance).
+    Соединения переиспользуются через один aiohttp.ClientSession на всё время работы бота.
+    Свечи сохраняются в директорию загрузок в формате выгрузки TradingView, чтобы остальной
+    конвейер работал с ними так же, как с выгрузкой из браузера.
+    """
+
+    def __init__(self, base_url, symbols, downloads_dir, connections=8, timeout=15, retries=3):
+        """
+        :param base_url: Адрес API, например 'https://fapi.binance.com' или адрес локальной заглушки.
+        :param symbols: Словарь {монета: символ биржи}, например {'BTC': 'BTCUSDT'}.
+        :param downloads_dir: Директория, куда сохраняются файлы '<таймфрейм>_<монета>.csv'.
+        :param connections: Размер пула соединений.
+        :param timeout: Таймаут одного запроса в секундах.
+        :param retries: Число попыток на запрос.
+        """
+        self.base_url = base_url.rstrip("/")
+        self.symbols = symbols
+        self.downloads_dir = downloads_dir
+        self.connections = connections
+        self.timeout = timeout
+        self.retries = retries
+        self.session = None
+        os.makedirs(self.downloads_dir, exist_ok=True)
+
+    async def start(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+    async def stop(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def fetch_many(self, requests):
+        await self.start()
+        return await self._gather(requests, self._fetch_one)
+
+    async def _fetch_one(self, request):
+        with metrics.span("http_fetch", coin=request.coin, timeframe=request.timeframe):
+            klines = await self._get_klines(
+                self.symbols[request.coin], FEED_INTERVALS[request.timeframe], request.bars)
+        frame = klines_to_frame(klines)
+        file_path = os.path.join(
+            self.downloads_dir, candle_file_name(request.coin, request.timeframe))
+        await asyncio.to_thread(frame.to_csv, file_path)
+        return frame
+
+    async def _get_klines(self, symbol, interval, limit):
+        """Запрашивает свечи с повторными попытками при сетевых ошибках и ответах 429/5xx."""
+        params = {"symbol": symbol, "interval": interval, "limit": limit}
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with self.session.get(f"{self.base_url}/fapi/v1/klines", params=params) as response:
+                    if response.status != 429 and response.status < 500:
+                        response.raise_for_status()  # Остальные 4xx повторять бессмысленно
+                        return await response.json()
+                    error = f"HTTP {response.status}"
+            except aiohttp.ClientResponseError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = e
+            if attempt == self.retries:
+                raise RuntimeError(
+                    f"Не удалось получить свечи {symbol} {interval} за {self.retries} попыток: {error}")
+            logging.warning(
+                f"Попытка {attempt}: ошибка при запросе свечей {symbol} {interval}: {error}")
+            await asyncio.sleep(2 ** attempt)
+
+
+def klines_to_frame(klines):
+    """
+    Переводит ответ /fapi/v1/klines в CandleFrame.
+    Каждая свеча: [время открытия в мс, open, high, low, close, volume, ...].
+    """
+    return CandleFrame({
+        "time": [int(kline[0]) // 1000 for kline in klines],
+        "open": [float(kline[1]) for kline in klines],
+        "high": [float(kline[2]) for kline in klines],
+        "low": [float(kline[3]) for kline in klines],
+        "close": [float(kline[4]) for kline in klines],
+        "Volume": [float(kline[5]) for kline in klines],
+    })
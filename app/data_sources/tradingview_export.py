@@ -0,0 +1,58 @@
+import os
+import time
+import asyncio
+from app.candles import CandleFrame, TIMEFRAME_SECONDS
+from app.export_plan import ExportTask, run_export_plan
+from app.data_sources.base import DataSource, candle_file_name
+from app.metrics import metrics
+
+
+class TradingViewExportSource(DataSource):
+    """Свечи через диалог 'Экспорт данных графика…' в TradingView на пуле вкладок браузера."""
+
+    def __init__(self, browser_pool, symbol_selectors, timeframe_buttons):
+        """
+        :param browser_pool: BrowserPool с вкладками графика.
+        :param symbol_selectors: Словарь {монета: селектор символа в списке наблюдения}.
+        :param timeframe_buttons: Словарь {таймфрейм: селектор кнопки таймфрейма}.
+        """
+        self.browser_pool = browser_pool
+        self.symbol_selectors = symbol_selectors
+        self.timeframe_buttons = timeframe_buttons
+
+    async def start(self):
+        await self.browser_pool.start()
+
+    async def stop(self):
+        await self.browser_pool.stop()
+
+    async def fetch_many(self, requests):
+        plan = [ExportTask(
+            coin=request.coin,
+            timeframe=request.timeframe,
+            symbol_selector=self.symbol_selectors.get(request.coin),
+            timeframe_button=self.timeframe_buttons[request.timeframe],
+            file_name=candle_file_name(request.coin, request.timeframe),
+        ) for request in requests]
+
+        started = time.time()
+        async with self.browser_pool.session() as clicker:
+            await run_export_plan(clicker, plan)
+        downloads_dir = self.browser_pool.downloads_dir
+
+        async def read_export(request):
+            file_path = os.path.join(
+                downloads_dir, candle_file_name(request.coin, request.timeframe))
+            # Если выгрузка не удалась, в директории остался файл с прошлого цикла
+            if not os.path.exists(file_path) or os.path.getmtime(file_path) < started:
+                raise FileNotFoundError(f"Свежая выгрузка {file_path} не найдена")
+            with metrics.span("csv_parse", coin=request.coin, timeframe=request.timeframe):
+                frame = await asyncio.to_thread(CandleFrame.from_csv, file_path)
+            # Выгрузка, сделанная до переключения графика, содержит ряд другого таймфрейма
+            period = frame.bar_period()
+            if period is not None and period != TIMEFRAME_SECONDS[request.timeframe]:
+                raise ValueError(f"В выгрузке {file_path} шаг свечей {period} с, "
+                                 f"ожидался {TIMEFRAME_SECONDS[request.timeframe]} с")
+            return frame.tail(request.bars)
+
+        return await self._gather(requests, read_export)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.db.database_manager import DatabaseManager
+from app.metrics import metrics
+
+
+class AsyncDatabase:
+    """
+    Асинхронный фасад над DatabaseManager, не блокирующий цикл событий.
+    - Запись выполняет один поток со своим соединением. Операции, пришедшие почти одновременно
+      (например, от параллельных анализов одного тика), выполняются одной транзакцией с одним
+      коммитом; каждая операция обёрнута в SAVEPOINT, поэтому ошибка одной не откатывает остальные.
+    - Чтение идёт через отдельное соединение только для чтения в своём потоке: благодаря WAL
+      оно не ждёт записи и видит все закоммиченные изменения.
+    Вызывающий код ожидает результат через await.
+    """
+
+    def __init__(self, db_path, commit_window=0.01, max_batch=100):
+        """
+        :param db_path: Путь к файлу базы данных.
+        :param commit_window: Сколько секунд ждать следующих операций записи для общего коммита.
+        :param max_batch: Максимум операций в одной транзакции.
+        """
+        self.db_path = db_path
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._writer_thread = None
+        self._reader = None
+        self._reader_executor = None
+        self._ready = None
+        self._listeners = []
+        self.batches = 0
+        self.operations = 0
+
+    def add_listener(self, callback):
+        """
+        Подписывает callback(method, args, result) на успешные записи.
+        Вызывается в цикле событий после коммита, порядок вызовов совпадает с порядком записей.
+        """
+        self._listeners.append(callback)
+
+    async def start(self):
+        """Запускает поток записи (он же создаёт базу) и поток чтения."""
+        if self._writer_thread is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._ready = loop.create_future()
+        self._writer_thread = threading.Thread(
+            target=self._writer_loop, args=(loop,), name="db-writer", daemon=True)
+        self._writer_thread.start()
+        await self._ready  # Соединение записи открыто, база и таблица агрегатов существуют
+
+        self._reader_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-reader")
+        self._reader = DatabaseManager(self.db_path, read_only=True, check_same_thread=False)
+        await loop.run_in_executor(self._reader_executor, self._reader.connect)
+
+    async def close(self):
+        """Дожидается записи всех операций из очереди и закрывает соединения."""
+        if self._writer_thread is None:
+            return
+        self._queue.put(None)
+        await asyncio.get_running_loop().run_in_executor(None, self._writer_thread.join)
+        self._writer_thread = None
+        if self._reader_executor is not None:
+            await asyncio.get_running_loop().run_in_executor(self._reader_executor, self._reader.close)
+            self._reader_executor.shutdown()
+            self._reader_executor = None
+        logging.info(f"База данных: {self.operations} операций записи в {self.batches} транзакциях.")
+
+    def _writer_loop(self, loop):
+        manager = DatabaseManager(self.db_path)
+        try:
+            manager.connect()
+        except Exception as e:
+            loop.call_soon_threadsafe(self._ready.set_exception, e)
+            return
+        loop.call_soon_threadsafe(self._ready.set_result, None)
+
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Собираем операции, пришедшие в пределах окна, в одну транзакцию
+            deadline = time.monotonic() + self.commit_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._run_batch(manager, batch)
+        manager.close()
+
+    def _run_batch(self, manager, batch):
+        results = []
+        try:
+            # Блокировка записи берётся сразу: повышение блокировки чтения посреди группы
+            # может упасть с SQLITE_BUSY, если пишет другой процесс
+            manager.connection.execute("BEGIN IMMEDIATE")
+            with manager.transaction():
+                for method, args, future in batch:
+                    manager.connection.execute("SAVEPOINT operation")
+                    try:
+                        result = getattr(manager, method)(*args)
+                        manager.connection.execute("RELEASE operation")
+                        results.append((future, method, args, result, None))
+                    except Exception as e:
+                        manager.connection.execute("ROLLBACK TO operation")
+                        manager.connection.execute("RELEASE operation")
+                        results.append((future, method, args, None, e))
+        except Exception as e:
+            # Не удалось закоммитить - ошибка для всех операций группы
+            results = [(future, method, args, None, e) for method, args, future in batch]
+            if manager.connection.in_transaction:
+                try:
+                    manager.connection.rollback()
+                except Exception as rollback_error:
+                    logging.error(f"Не удалось откатить транзакцию записи: {rollback_error}")
+        self.batches += 1
+        self.operations += len(batch)
+
+        for future, method, args, result, error in results:
+            future.get_loop().call_soon_threadsafe(self._resolve, future, method, args, result, error)
+
+    def _resolve(self, future, method, args, result, error):
+        if error is None:
+            for callback in self._listeners:
+                try:
+                    callback(method, args, result)
+                except Exception as e:
+                    logging.error(f"Ошибка обработчика записи {method}: {e}")
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    async def write(self, method, *args):
+        """Выполняет метод DatabaseManager в потоке записи и ждёт коммита."""
+        future = asyncio.get_running_loop().create_future()
+        with metrics.span("db_write", op=method):
+            self._queue.put((method, args, future))
+            return await future
+
+    async def read(self, method, *args):
+        """Выполняет метод DatabaseManager на соединении только для чтения."""
+        with metrics.span("db_read", op=method):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._reader_executor, getattr(self._reader, method), *args)
+
+    async def create_table(self, table_name, columns):
+        return await self.write("create_table", table_name, columns)
+
+    async def insert_data(self, table_name, data):
+        return await self.write("insert_data", table_name, data)
+
+    async def update_status_and_pnl(self, table_name, timeframe, pnl, coin_name):
+        return await self.write("update_status_and_pnl", table_name, timeframe, pnl, coin_name)
+
+    async def close_positions(self, closes):
+        return await self.write("close_positions", closes)
+
+    async def has_status_zero(self, table_name, timeframe, coin_name):
+        return await self.read("has_status_zero", table_name, timeframe, coin_name)
+
+    async def get_total_pnl(self, table_name, timeframe=None):
+        return await self.read("get_total_pnl", table_name, timeframe)
+
+    async def get_open_positions(self, table_names):
+        return await self.read("get_open_positions", table_names)
+
+    async def get_stats(self, table_name=None):
+        return await self.read("get_stats", table_name)
+
+    async def get_recent_closes(self, table_names, limit=20):
+        return await self.read("get_recent_closes", table_names, limit)
@@ -1,50 +1,240 @@
 import sqlite3
 import os
+import time
+import logging
+from contextlib import contextmanager
 from db_config import TABLES
 
 
 class DatabaseManager:
-    def __init__(self, db_path):
+    # Таблица агрегатов PnL, обновляется в той же транзакции, что и закрытие сделки
+    STATS_TABLE = "pnl_stats"
+    # Время закрытия сделки (unix): колонка добавляется во все таблицы сделок, даже если её
+    # нет в db_config.py, - по ней процессы бота получают последние закрытия
+    CLOSED_AT_COLUMN = "closed_at"
+
+    # Тексты запросов по таблицам: одинаковая строка SQL берётся из кэша подготовленных выражений sqlite3
+    QUERIES = {
+        "open_position": """
+            SELECT SL, TP, signal, open
+            FROM {table}
+            WHERE status = 1 AND timeframe = ? AND coin_name = ?
+            LIMIT 1;
+        """,
+        "open_positions": """
+            SELECT id, timeframe, coin_name, signal, open, SL, TP, opened_at
+            FROM {table}
+            WHERE status = 1;
+        """,
+        "close_by_pair": """
+            UPDATE {table}
+            SET status = 0, pnl = ?, closed_at = ?
+            WHERE status = 1 AND timeframe = ? AND coin_name = ?;
+        """,
+        "close_by_id": """
+            UPDATE {table}
+            SET status = 0, pnl = ?, closed_at = ?
+            WHERE id = ? AND status = 1;
+        """,
+        "recent_closes": """
+            SELECT id, timeframe, coin_name, signal, open, SL, TP, opened_at, pnl, closed_at
+            FROM {table}
+            WHERE closed_at IS NOT NULL
+            ORDER BY closed_at DESC
+            LIMIT ?;
+        """,
+        "stats_add_by_id": """
+            INSERT INTO pnl_stats (table_name, timeframe, coin_name, trades, wins, total_pnl)
+            SELECT ?, timeframe, coin_name, 1, ? > 0, ? FROM {table} WHERE id = ?
+            ON CONFLICT (table_name, timeframe, coin_name) DO UPDATE SET
+                trades = trades + excluded.trades,
+                wins = wins + excluded.wins,
+                total_pnl = total_pnl + excluded.total_pnl;
+        """,
+        # OR IGNORE: несколько процессов (режим воркеров) могут одновременно увидеть пустые
+        # агрегаты и пересчитать их по одним и тем же сделкам, второй пересчёт ничего не меняет
+        "stats_rebuild": """
+            INSERT OR IGNORE INTO pnl_stats (table_name, timeframe, coin_name, trades, wins, total_pnl)
+            SELECT ?, timeframe, coin_name, COUNT(*), SUM(pnl > 0), COALESCE(SUM(pnl), 0)
+            FROM {table}
+            WHERE status = 0
+            GROUP BY timeframe, coin_name;
+        """,
+    }
+
+    STATS_ADD = """
+        INSERT INTO pnl_stats (table_name, timeframe, coin_name, trades, wins, total_pnl)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (table_name, timeframe, coin_name) DO UPDATE SET
+            trades = trades + excluded.trades,
+            wins = wins + excluded.wins,
+            total_pnl = total_pnl + excluded.total_pnl;
+    """
+
+    def __init__(self, db_path, cached_statements=256, read_only=False, check_same_thread=True):
         """
         Инициализация класса с путем к базе данных.
         :param db_path: Путь к файлу базы данных.
+        :param cached_statements: Размер кэша подготовленных выражений соединения.
+        :param read_only: Открыть соединение только для чтения (база должна уже существовать).
+        :param check_same_thread: Запрещать использование соединения из другого потока.
         """
         self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.read_only = read_only
+        self.check_same_thread = check_same_thread
         self.connection = None
         self.cursor = None
+        self._columns = {}  # Кэш схемы: {таблица: [колонки]}
+        self._queries = {}
+        self._transaction_depth = 0
 
     def connect(self):
         """
         Подключение к базе данных.
+        Соединение одно на всё время работы бота: журнал WAL позволяет читать во время записи,
+        а synchronous=NORMAL не ждёт fsync на каждом коммите.
+        Повторный вызов при открытом соединении ничего не делает.
         """
+        if self.connection:
+            return
+
+        if self.read_only:
+            self.connection = sqlite3.connect(
+                f"file:{self.db_path}?mode=ro", uri=True,
+                cached_statements=self.cached_statements, check_same_thread=self.check_same_thread)
+            self.cursor = self.connection.cursor()
+            self._load_schema()
+            logging.info(f"Подключение к базе данных '{self.db_path}' только для чтения установлено.")
+            return
+
         # Создаем директорию, если она не существует
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
 
         # Подключаемся к базе данных
-        self.connection = sqlite3.connect(self.db_path)
+        self.connection = sqlite3.connect(
+            self.db_path, cached_statements=self.cached_statements, check_same_thread=self.check_same_thread)
+        self.connection.execute("PRAGMA journal_mode=WAL;")
+        self.connection.execute("PRAGMA synchronous=NORMAL;")
         self.cursor = self.connection.cursor()
-        print(
+        self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.STATS_TABLE} (
+                table_name TEXT,
+                timeframe TEXT,
+                coin_name TEXT,
+                trades INTEGER,
+                wins INTEGER,
+                total_pnl REAL,
+                PRIMARY KEY (table_name, timeframe, coin_name)
+            );
+        """)
+        self._load_schema()
+        logging.info(
             f"Подключение к базе данных '{self.db_path}' успешно установлено.")
 
+    def _check_connection(self):
+        if not self.connection:
+            raise Exception(
+                "Сначала подключитесь к базе данных, используйте метод connect().")
+
+    def _load_schema(self):
+        """Читает колонки всех существующих таблиц один раз при подключении."""
+        self._columns = {}
+        tables = self.connection.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table';").fetchall()
+        for (table_name,) in tables:
+            self._columns[table_name] = [
+                column[1] for column in self.connection.execute(f"PRAGMA table_info({table_name});")]
+
+    def _query(self, name, table_name):
+        """Возвращает текст запроса для таблицы, строки создаются один раз."""
+        key = (name, table_name)
+        if key not in self._queries:
+            self._queries[key] = self.QUERIES[name].format(table=table_name)
+        return self._queries[key]
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """
+        Группирует несколько операций в одну транзакцию.
+        Вложенные вызовы присоединяются к внешней транзакции, коммит - при выходе из внешней,
+        при исключении изменения откатываются.
+        :param immediate: Начать транзакцию с BEGIN IMMEDIATE - блокировка записи берётся сразу
+            (с ожиданием по таймауту соединения), а не при первой записи после чтения, где другой
+            процесс может вызвать ошибку 'database is locked' без ожидания.
+        """
+        self._check_connection()
+        if immediate and not self._transaction_depth and not self.connection.in_transaction:
+            self.connection.execute("BEGIN IMMEDIATE;")
+        self._transaction_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                self.connection.rollback()
+            raise
+        else:
+            self._transaction_depth -= 1
+            if not self._transaction_depth:
+                try:
+                    self.connection.commit()
+                except Exception:
+                    # Неудачный коммит (например, SQLITE_BUSY) оставляет транзакцию открытой,
+                    # и следующий BEGIN на этом соединении упал бы
+                    self.connection.rollback()
+                    raise
+
     def create_table(self, table_name, columns):
         """
         Создание таблицы в базе данных.
         :param table_name: Имя таблицы (например, 'users')
         :param columns: Словарь с именами колонок и их типами (например, {'id': 'INTEGER PRIMARY KEY', 'name': 'TEXT', 'age': 'INTEGER'})
         """
-        if not self.connection:
-            raise Exception(
-                "Сначала подключитесь к базе данных, используйте метод connect().")
+        self._check_connection()
 
         # Формируем SQL-запрос для создания таблицы
         columns_with_types = [
             f"{col_name} {col_type}" for col_name, col_type in columns.items()]
         create_table_query = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(columns_with_types)});"
 
-        # Выполняем запрос
-        self.cursor.execute(create_table_query)
-        self.connection.commit()
-        print(f"Таблица '{table_name}' успешно создана.")
+        # Проверка агрегатов и их пересчёт - под блокировкой записи: воркеры, запущенные
+        # одновременно, выполняют их по очереди
+        with self.transaction(immediate=True):
+            # Выполняем запрос
+            self.cursor.execute(create_table_query)
+
+            # Добавляем колонки, которых нет в таблице, созданной по старой конфигурации
+            self.cursor.execute(f"PRAGMA table_info({table_name});")
+            existing_columns = [column[1] for column in self.cursor.fetchall()]
+            for col_name, col_type in columns.items():
+                if col_name not in existing_columns:
+                    self.cursor.execute(
+                        f"ALTER TABLE {table_name} ADD COLUMN {col_name} {col_type};")
+                    existing_columns.append(col_name)
+                    logging.info(f"В таблицу '{table_name}' добавлена колонка '{col_name}'.")
+
+            # Индекс для поиска открытой позиции по паре (таймфрейм, монета)
+            if {"status", "timeframe", "coin_name"} <= set(existing_columns):
+                self.cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table_name}_open "
+                    f"ON {table_name} (status, timeframe, coin_name);")
+                if self.CLOSED_AT_COLUMN not in existing_columns:
+                    self.cursor.execute(
+                        f"ALTER TABLE {table_name} ADD COLUMN {self.CLOSED_AT_COLUMN} INTEGER;")
+                    existing_columns.append(self.CLOSED_AT_COLUMN)
+                self.cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_{table_name}_closed "
+                    f"ON {table_name} ({self.CLOSED_AT_COLUMN});")
+
+            # Агрегаты для таблицы, закрытые сделки которой ещё не учтены (первый запуск с агрегатами)
+            has_stats = self.cursor.execute(
+                f"SELECT 1 FROM {self.STATS_TABLE} WHERE table_name = ? LIMIT 1;", (table_name,)).fetchone()
+            if not has_stats and "pnl" in existing_columns:
+                self.cursor.execute(self._query("stats_rebuild", table_name), (table_name,))
+
+        self._columns[table_name] = existing_columns
+        logging.info(f"Таблица '{table_name}' успешно создана.")
 
     def close(self):
         """
@@ -52,19 +242,20 @@ class DatabaseManager:
         """
         if self.connection:
             self.connection.close()
-            print(f"Соединение с базой данных '{self.db_path}' закрыто.")
+            self.connection = None
+            self.cursor = None
+            logging.info(f"Соединение с базой данных '{self.db_path}' закрыто.")
         else:
-            print("Соединение с базой данных уже закрыто.")
+            logging.info("Соединение с базой данных уже закрыто.")
 
     def insert_data(self, table_name, data):
         """
         Вставка данных в таблицу.
         :param table_name: Имя таблицы, в которую нужно вставить данные.
         :param data: Словарь с данными для вставки (ключи - имена колонок, значения - данные).
+        :return: id вставленной строки.
         """
-        if not self.connection:
-            raise Exception(
-                "Сначала подключитесь к базе данных, используйте метод connect().")
+        self._check_connection()
 
         # Проверяем, что таблица существует в конфигурации
         if table_name not in TABLES:
@@ -84,9 +275,11 @@ class DatabaseManager:
         insert_query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders});"
 
         # Выполняем запрос
-        self.cursor.execute(insert_query, tuple(data.values()))
-        self.connection.commit()
-        print(f"Данные успешно вставлены в таблицу '{table_name}'.")
+        with self.transaction():
+            self.cursor.execute(insert_query, tuple(data.values()))
+            row_id = self.cursor.lastrowid
+        logging.info(f"Данные успешно вставлены в таблицу '{table_name}'.")
+        return row_id
 
     def has_status_zero(self, table_name, timeframe, coin_name):
         """
@@ -97,26 +290,10 @@ class DatabaseManager:
         :param timeframe: Таймфрейм для фильтрации.
         :return: Словарь с ключами 'SL', 'TP', 'signal', если найдена запись с status = 0, иначе None.
         """
-        if not self.connection:
-            raise Exception(
-                "Сначала подключитесь к базе данных, используйте метод connect().")
-
-        # Проверяем, есть ли записи в таблице
-        self.cursor.execute(f"SELECT COUNT(*) FROM {table_name};")
-        row_count = self.cursor.fetchone()[0]
+        self._check_connection()
 
-        if row_count == 0:
-            print(f"Таблица '{table_name}' пустая.")
-            return False  # Если таблица пустая, возвращаем False
-
-        # Ищем запись с status = 0 и указанным timeframe
-        query = f"""
-            SELECT SL, TP, signal, open
-            FROM {table_name} 
-            WHERE status = 1 AND timeframe = ? AND coin_name = ?
-            LIMIT 1;
-        """
-        self.cursor.execute(query, (timeframe, coin_name))  # Передаем два параметра
+        # Ищем запись с status = 1 и указанным timeframe по индексу (status, timeframe, coin_name)
+        self.cursor.execute(self._query("open_position", table_name), (timeframe, coin_name))  # Передаем два параметра
         result = self.cursor.fetchone()
         if result:
             # Если запись найдена, возвращаем SL, TP и signal
@@ -126,6 +303,13 @@ class DatabaseManager:
             # Если запись не найдена, возвращаем None
             return False
 
+    def _ensure_pnl_column(self, table_name):
+        """Добавляет столбец pnl, если его нет; проверка идёт по кэшу схемы."""
+        if "pnl" not in self._columns.get(table_name, []):
+            self.cursor.execute(
+                f"ALTER TABLE {table_name} ADD COLUMN pnl REAL;")
+            self._columns.setdefault(table_name, []).append("pnl")
+
     def update_status_and_pnl(self, table_name, timeframe, pnl, coin_name):
         """
         Обновляет статус на 0 и записывает значение pnl для всех записей с status = 1 и указанным timeframe.
@@ -134,28 +318,20 @@ class DatabaseManager:
         :param pnl: Значение Profit and Loss (pnl), которое нужно записать.
         :return: Количество обновленных строк.
         """
-        if not self.connection:
-            raise Exception(
-                "Сначала подключитесь к базе данных, используйте метод connect().")
+        self._check_connection()
 
-        # Проверяем, существует ли столбец pnl, и если нет, добавляем его
-        self.cursor.execute(f"PRAGMA table_info({table_name});")
-        columns = [column[1] for column in self.cursor.fetchall()]
-        if "pnl" not in columns:
+        # Изменение структуры и данных - одна транзакция
+        with self.transaction():
+            self._ensure_pnl_column(table_name)
             self.cursor.execute(
-                f"ALTER TABLE {table_name} ADD COLUMN pnl REAL;")
-            self.connection.commit()  # Фиксируем изменения в структуре таблицы
-
-        update_query = f"""
-            UPDATE {table_name} 
-            SET status = 0, pnl = ? 
-            WHERE status = 1 AND timeframe = ? AND coin_name = ?;
-        """
-        self.cursor.execute(update_query, (pnl, timeframe, coin_name))
-        self.connection.commit()  # Фиксируем изменения в данных
+                self._query("close_by_pair", table_name), (pnl, int(time.time()), timeframe, coin_name))
+            updated = self.cursor.rowcount
+            if updated > 0:
+                self.cursor.execute(self.STATS_ADD, (
+                    table_name, timeframe, coin_name, updated, updated if pnl > 0 else 0, pnl * updated))
 
         # Возвращаем количество обновленных строк
-        return self.cursor.rowcount
+        return updated
 
     def get_total_pnl(self, table_name, timeframe=None):
         """
@@ -164,29 +340,100 @@ class DatabaseManager:
         :param timeframe: (опционально) Таймфрейм для фильтрации данных. Если None, суммируются все строки.
         :return: Сумма всех значений в столбце pnl. Если столбец отсутствует или таблица пуста, возвращает 0.
         """
-        if not self.connection:
-            raise Exception(
-                "Сначала подключитесь к базе данных, используйте метод connect().")
+        self._check_connection()
 
-        # Проверяем, существует ли столбец pnl
-        self.cursor.execute(f"PRAGMA table_info({table_name});")
-        columns = [column[1] for column in self.cursor.fetchall()]
-        if "pnl" not in columns:
-            print(f"Столбец 'pnl' отсутствует в таблице {table_name}.")
-            return 0
+        # Сумма берётся из агрегатов, а не пересчитывается по всей истории сделок
+        query = f"SELECT SUM(total_pnl) FROM {self.STATS_TABLE} WHERE table_name = ?"
+        params = (table_name,)
+        if timeframe:
+            query += " AND timeframe = ?"
+            params += (timeframe,)
+        self.cursor.execute(query + ";", params)
+        sum_pnl = self.cursor.fetchone()[0]  # Получаем сумму pnl
+
+        # Если сумма равна None (например, если сделок ещё не было), возвращаем 0
+        return sum_pnl or 0
 
-        # Базовый запрос для получения суммы всех значений в столбце pnl
-        sum_pnl_query = f"""
-            SELECT SUM(pnl) 
-            FROM {table_name}
+    def get_stats(self, table_name=None):
         """
+        Возвращает агрегаты закрытых сделок по (таблица, таймфрейм, монета).
+        :param table_name: (опционально) Имя таблицы стратегии, по умолчанию - все таблицы.
+        :return: Список словарей с ключами 'table', 'timeframe', 'coin_name', 'trades', 'wins',
+            'win_rate' (в процентах) и 'total_pnl'.
+        """
+        self._check_connection()
 
-        # Если передан таймфрейм, добавляем условие WHERE для фильтрации
-        if timeframe:
-            sum_pnl_query += f" WHERE timeframe = '{timeframe}'"
+        query = f"SELECT table_name, timeframe, coin_name, trades, wins, total_pnl FROM {self.STATS_TABLE}"
+        params = ()
+        if table_name:
+            query += " WHERE table_name = ?"
+            params = (table_name,)
+        stats = []
+        for table, timeframe, coin_name, trades, wins, total_pnl in self.cursor.execute(query + ";", params):
+            stats.append({
+                "table": table, "timeframe": timeframe, "coin_name": coin_name,
+                "trades": trades, "wins": wins,
+                "win_rate": round(wins / trades * 100, 1) if trades else 0.0,
+                "total_pnl": total_pnl,
+            })
+        return stats
 
-        self.cursor.execute(sum_pnl_query)
-        sum_pnl = self.cursor.fetchone()[0]  # Получаем сумму pnl
+    def get_open_positions(self, table_names):
+        """
+        Возвращает все открытые позиции (status = 1) из нескольких таблиц.
+        :param table_names: Имена таблиц стратегий.
+        :return: Список словарей с ключами 'table', 'id', 'timeframe', 'coin_name', 'signal',
+            'open', 'SL', 'TP', 'opened_at'.
+        """
+        self._check_connection()
+
+        positions = []
+        for table_name in table_names:
+            self.cursor.execute(self._query("open_positions", table_name))
+            for row in self.cursor.fetchall():
+                position = dict(zip(
+                    ("id", "timeframe", "coin_name", "signal", "open", "SL", "TP", "opened_at"), row))
+                position["table"] = table_name
+                positions.append(position)
+        return positions
+
+    def get_recent_closes(self, table_names, limit=20):
+        """
+        Возвращает последние закрытые сделки из нескольких таблиц, новые первыми.
+        :param table_names: Имена таблиц стратегий.
+        :param limit: Сколько закрытий вернуть.
+        :return: Список словарей с ключами 'table', 'id', 'timeframe', 'coin_name', 'signal',
+            'open', 'SL', 'TP', 'opened_at', 'pnl', 'closed_at'.
+        """
+        self._check_connection()
+
+        closes = []
+        for table_name in table_names:
+            self.cursor.execute(self._query("recent_closes", table_name), (limit,))
+            for row in self.cursor.fetchall():
+                close = dict(zip(
+                    ("id", "timeframe", "coin_name", "signal", "open", "SL", "TP", "opened_at",
+                     "pnl", "closed_at"), row))
+                close["table"] = table_name
+                closes.append(close)
+        closes.sort(key=lambda close: close["closed_at"], reverse=True)
+        return closes[:limit]
+
+    def close_positions(self, closes):
+        """
+        Закрывает несколько позиций одной транзакцией: status = 0 и значение pnl.
+        :param closes: Список кортежей (имя таблицы, id позиции, pnl).
+        :return: Количество обновленных строк.
+        """
+        self._check_connection()
 
-        # Если сумма равна None (например, если таблица пуста), возвращаем 0
-        return sum_pnl or 0
\ No newline at end of file
+        updated = 0
+        closed_at = int(time.time())
+        with self.transaction():  # Одна транзакция: либо закрыты все позиции вместе с агрегатами, либо ни одна
+            for table_name, position_id, pnl in closes:
+                self.cursor.execute(self._query("close_by_id", table_name), (pnl, closed_at, position_id))
+                if self.cursor.rowcount > 0:
+                    updated += 1
+                    self.cursor.execute(
+                        self._query("stats_add_by_id", table_name), (table_name, pnl, pnl, position_id))
+        return updated
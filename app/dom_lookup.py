@@ -0,0 +1,99 @@
+import logging
+import weakref
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+
+# Ищет видимый и доступный элемент по тексту целиком на стороне страницы и возвращает
+# CSS-путь до него. Сначала проверяется селектор из кэша, затем просматриваются все элементы tag.
+FIND_BY_TEXT_SCRIPT = """
+([tag, text, exact, cached]) => {
+    const matches = (el) => {
+        const value = (el.innerText || el.textContent || '').trim();
+        if (exact ? value !== text : !value.includes(text)) return false;
+        const rect = el.getBoundingClientRect();
+        const style = window.getComputedStyle(el);
+        if (!rect.width || !rect.height || style.visibility === 'hidden' || style.display === 'none') return false;
+        return !el.closest('[disabled], [aria-disabled="true"]');
+    };
+    const pathTo = (el) => {
+        const parts = [];
+        while (el && el.nodeType === 1 && el !== document.body) {
+            if (el.id) {
+                parts.unshift('#' + CSS.escape(el.id));
+                return parts.join(' > ');
+            }
+            const index = Array.prototype.indexOf.call(el.parentNode.children, el) + 1;
+            parts.unshift(el.tagName.toLowerCase() + ':nth-child(' + index + ')');
+            el = el.parentElement;
+        }
+        parts.unshift('body');
+        return parts.join(' > ');
+    };
+    if (cached) {
+        const el = document.querySelector(cached);
+        if (el && matches(el)) return cached;
+    }
+    for (const el of document.querySelectorAll(tag)) {
+        if (matches(el)) return pathTo(el);
+    }
+    return null;
+}
+"""
+
+
+class ElementLookup:
+    """
+    Поиск элементов по тексту за один вызов в странице вместо перебора всех span через Playwright.
+    Найденные селекторы кэшируются для каждой вкладки и переиспользуются между циклами,
+    медленный перебор используется только если быстрый поиск ничего не нашёл.
+    """
+
+    def __init__(self):
+        self._cache = weakref.WeakKeyDictionary()  # {вкладка: {(tag, text, exact): селектор}}
+        self.stats = {"hits": 0, "misses": 0, "slow": 0}
+
+    async def find_by_text(self, page, text, tag="span", exact=False, timeout=5000):
+        """
+        Дожидается видимого и доступного элемента с указанным текстом.
+        :param page: Вкладка браузера.
+        :param text: Текст элемента (подстрока, если exact=False).
+        :param tag: CSS-селектор кандидатов.
+        :param exact: Требовать точного совпадения текста.
+        :param timeout: Таймаут ожидания в миллисекундах.
+        :return: Locator или ElementHandle, на который можно нажать.
+        """
+        page_cache = self._cache.setdefault(page, {})
+        key = (tag, text, exact)
+        cached = page_cache.get(key)
+
+        try:
+            handle = await page.wait_for_function(
+                FIND_BY_TEXT_SCRIPT, arg=[tag, text, exact, cached], timeout=timeout)
+            selector = await handle.json_value()
+        except PlaywrightTimeoutError:
+            element = await self._slow_scan(page, text, tag, exact)
+            if element is None:
+                raise
+            return element
+
+        if selector == cached:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            page_cache[key] = selector
+        return page.locator(selector).first
+
+    async def _slow_scan(self, page, text, tag, exact):
+        """Перебирает элементы через Playwright: медленно, но не зависит от скрипта поиска."""
+        self.stats["slow"] += 1
+        logging.warning(f"Быстрый поиск '{text}' не сработал, перебираем элементы {tag}.")
+        for element in await page.query_selector_all(tag):
+            value = (await element.inner_text()).strip()
+            if (value == text) if exact else (text in value):
+                if await element.is_visible() and await element.is_enabled():
+                    return element
+        return None
+
+    def forget(self, page):
+        """Сбрасывает кэш селекторов вкладки (например, после её перезагрузки)."""
+        self._cache.pop(page, None)
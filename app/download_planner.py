@@ -0,0 +1,92 @@
+import logging
+import time
+from collections import namedtuple
+from app.candles import TIMEFRAME_SECONDS
+from app.data_sources.base import CandleRequest
+
+
+# План загрузки тика: что загружать, что уже свежее в хранилище и сколько запросов было всего
+DownloadPlan = namedtuple("DownloadPlan", ["fetch", "fresh", "requested"])
+
+
+class DownloadPlanner:
+    """
+    Планирование загрузки свечей на тик.
+    Запросы всех сработавших расписаний объединяются: каждая пара (монета, таймфрейм)
+    загружается не больше одного раза, с наибольшим из запрошенных числом свечей.
+    Пара не загружается, если ряд в хранилище уже свежий:
+    - загружен после начала текущей свечи таймфрейма, то есть содержит последнюю закрытую
+      свечу в окончательном виде;
+    - загружен не раньше, чем max_age секунд назад (незакрытая свеча устаревает);
+    - содержит не меньше запрошенного числа свечей.
+    """
+
+    def __init__(self, store, max_age=None):
+        """
+        :param store: CandleStore.
+        :param max_age: Словарь {таймфрейм: секунды}, сколько ряд считается свежим после загрузки.
+            Для таймфреймов, которых нет в словаре, ряд загружается на каждом тике.
+        """
+        self.store = store
+        self.max_age = max_age or {}
+        self.requested = 0
+        self.hits = 0
+
+    def is_fresh(self, request, now):
+        """Проверяет, можно ли взять ряд из хранилища без загрузки."""
+        max_age = self.max_age.get(request.timeframe, 0)
+        period = TIMEFRAME_SECONDS.get(request.timeframe)
+        if not max_age or not period:
+            return False
+        meta = self.store.meta(request.coin, request.timeframe)
+        if not meta or not meta.get("fetched_at") or meta["rows"] < request.bars:
+            return False
+
+        fetched_at = meta["fetched_at"]
+        boundary = now // period * period  # Начало текущей свечи (UTC)
+        if fetched_at < boundary or now - fetched_at > max_age:
+            return False
+        # Последняя закрытая свеча должна быть в ряду
+        last_time = self.store.last_time(request.coin, request.timeframe)
+        return last_time is not None and last_time >= boundary - period
+
+    def plan(self, requests, now=None):
+        """
+        :param requests: Список CandleRequest всех сработавших расписаний, возможно с повторами.
+        :param now: Текущее время (unix), по умолчанию time.time().
+        :return: DownloadPlan.
+        """
+        now = time.time() if now is None else now
+        needs = {}
+        for request in requests:
+            key = (request.coin, request.timeframe)
+            if key not in needs or needs[key].bars < request.bars:
+                needs[key] = CandleRequest(request.coin, request.timeframe, request.bars)
+
+        fetch, fresh = [], []
+        for request in needs.values():
+            (fresh if self.is_fresh(request, now) else fetch).append(request)
+
+        self.requested += len(needs)
+        self.hits += len(fresh)
+        plan = DownloadPlan(fetch=fetch, fresh=fresh, requested=len(requests))
+        self.log(plan)
+        return plan
+
+    def hit_ratio(self):
+        """Доля пар, взятых из хранилища без загрузки, за всё время работы."""
+        return self.hits / self.requested if self.requested else 0.0
+
+    def log(self, plan):
+        unique = len(plan.fetch) + len(plan.fresh)
+        logging.info(
+            f"План загрузки: {plan.requested} запросов, {unique} уникальных пар, "
+            f"загрузить {len(plan.fetch)}, свежие в хранилище {len(plan.fresh)} "
+            f"({len(plan.fresh) / unique * 100 if unique else 0:.0f}%, "
+            f"за всё время {self.hit_ratio() * 100:.0f}%).")
+        if plan.fetch:
+            logging.info("Загрузить: " + ", ".join(
+                f"{request.timeframe} {request.coin}" for request in plan.fetch))
+        if plan.fresh:
+            logging.info("Из хранилища: " + ", ".join(
+                f"{request.timeframe} {request.coin}" for request in plan.fresh))
@@ -0,0 +1,85 @@
+import time
+import asyncio
+import logging
+from collections import namedtuple
+from app.data_sources.base import candle_file_name
+from app.metrics import metrics
+
+
+# Одна выгрузка: какой символ и таймфрейм выбрать на графике и куда сохранить файл
+ExportTask = namedtuple(
+    "ExportTask", ["coin", "timeframe", "symbol_selector", "timeframe_button", "file_name"])
+
+
+def build_export_plan(coins, timeframes, symbol_selectors, timeframe_buttons):
+    """
+    Строит план выгрузки как произведение монет и таймфреймов.
+    :param coins: Список монет, например ['BTC', 'ETH'].
+    :param timeframes: Список таймфреймов, например ['M15', 'H1'].
+    :param symbol_selectors: Словарь {монета: селектор символа в списке наблюдения}.
+    :param timeframe_buttons: Словарь {таймфрейм: селектор кнопки таймфрейма}.
+    :return: Список ExportTask, файлы называются как '<таймфрейм>_<монета>.csv'.
+    """
+    plan = []
+    for coin in coins:
+        for timeframe in timeframes:
+            plan.append(ExportTask(
+                coin=coin,
+                timeframe=timeframe,
+                symbol_selector=symbol_selectors.get(coin),
+                timeframe_button=timeframe_buttons[timeframe],
+                file_name=candle_file_name(coin, timeframe),
+            ))
+    return plan
+
+
+async def run_export_plan(clicker, plan):
+    """
+    Выполняет план выгрузки на пуле открытых вкладок.
+    Задач может быть больше, чем вкладок: одновременно работает не больше K задач,
+    где K - число вкладок, каждая задача берёт свободную вкладку и возвращает её после выгрузки.
+    :param clicker: TradingViewButtonClicker с открытыми вкладками.
+    :param plan: Список ExportTask.
+    :return: Словарь {индекс вкладки: {'files': число выгрузок, 'seconds': суммарное время}}.
+    """
+    pages_count = len(clicker.pages)
+    if not pages_count:
+        raise RuntimeError("Нет открытых вкладок для выгрузки.")
+
+    semaphore = asyncio.Semaphore(pages_count)
+    free_tabs = asyncio.Queue()
+    for tab_index in range(pages_count):
+        free_tabs.put_nowait(tab_index)
+
+    stats = {tab_index: {"files": 0, "seconds": 0.0}
+             for tab_index in range(pages_count)}
+
+    async def run_task(task):
+        async with semaphore:
+            tab_index = free_tabs.get_nowait()
+            started = time.monotonic()
+            try:
+                with metrics.span("export", coin=task.coin, timeframe=task.timeframe):
+                    timings = await clicker.export_task(clicker.pages[tab_index], task)
+                for step, seconds in (timings or {}).items():
+                    metrics.observe("export_step_seconds", seconds, step=step)
+                stats[tab_index]["files"] += 1
+            except Exception as e:
+                logging.error(
+                    f"Ошибка при выгрузке {task.file_name} во вкладке {tab_index}: {e}")
+            finally:
+                stats[tab_index]["seconds"] += time.monotonic() - started
+                free_tabs.put_nowait(tab_index)
+
+    started = time.monotonic()
+    await asyncio.gather(*(run_task(task) for task in plan))
+    elapsed = time.monotonic() - started
+
+    for tab_index, tab_stats in stats.items():
+        if tab_stats["files"]:
+            logging.info(
+                f"Вкладка {tab_index}: {tab_stats['files']} файлов за {tab_stats['seconds']:.1f} с "
+                f"({tab_stats['seconds'] / tab_stats['files']:.1f} с/файл)")
+    logging.info(
+        f"План выгрузки: {len(plan)} файлов на {pages_count} вкладках за {elapsed:.1f} с.")
+    return stats
@@ -0,0 +1,212 @@
+from functools import lru_cache
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from app.data_sources.base import split_candle_file_name
+
+
+# Размер блока для векторного расчёта EMA
+EMA_CHUNK = 128
+
+EMA_SPANS = (20, 50, 200)
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+SWING_WINDOW = 3  # Свинг - экстремум среди SWING_WINDOW свечей слева и справа
+RANGE_BARS = 50  # Окно для диапазона и волатильности
+
+
+@lru_cache(maxsize=32)
+def _decay_matrix(alpha, size):
+    """Нижнетреугольная матрица L[i, j] = (1 - alpha) ** (i - j) для j <= i."""
+    exponents = np.subtract.outer(np.arange(size), np.arange(size))
+    return np.tril((1 - alpha) ** np.maximum(exponents, 0))
+
+
+def ema(values, alpha, prev=None):
+    """
+    Экспоненциальное среднее, посчитанное блоками без цикла по свечам:
+    y[i] = alpha * sum((1 - alpha) ** (i - j) * x[j]) + (1 - alpha) ** (i + 1) * prev.
+    :param values: Массив значений.
+    :param alpha: Коэффициент сглаживания.
+    :param prev: Значение EMA перед первым элементом, по умолчанию - первое значение ряда.
+    :return: Массив EMA той же длины.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.empty_like(values)
+    if not len(values):
+        return result
+    if prev is None:
+        prev = values[0]
+
+    for start in range(0, len(values), EMA_CHUNK):
+        chunk = values[start:start + EMA_CHUNK]
+        size = len(chunk)
+        decay = (1 - alpha) ** np.arange(1, size + 1)
+        result[start:start + size] = alpha * (_decay_matrix(alpha, size) @ chunk) + decay * prev
+        prev = result[start + size - 1]
+    return result
+
+
+def true_range(high, low, close, prev_close=None):
+    """Истинный диапазон свечей."""
+    previous = np.concatenate(([close[0] if prev_close is None else prev_close], close[:-1]))
+    return np.maximum(high - low, np.maximum(np.abs(high - previous), np.abs(low - previous)))
+
+
+def swing_points(high, low, window=SWING_WINDOW):
+    """
+    Индексы свинг-хаев и свинг-лоу: свеча - экстремум среди window свечей с каждой стороны.
+    Последние window свечей не проверяются: для них ещё нет правой части окна.
+    """
+    size = 2 * window + 1
+    if len(high) < size:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    highs = sliding_window_view(high, size)
+    lows = sliding_window_view(low, size)
+    swing_highs = np.flatnonzero(highs.argmax(axis=1) == window) + window
+    swing_lows = np.flatnonzero(lows.argmin(axis=1) == window) + window
+    return swing_highs, swing_lows
+
+
+class SeriesState:
+    """Состояние индикаторов ряда на последней закрытой свече."""
+
+    def __init__(self):
+        self.last_time = None
+        self.close = None
+        self.ema = {}
+        self.avg_gain = None
+        self.avg_loss = None
+        self.atr = None
+
+    def copy(self):
+        state = SeriesState()
+        state.__dict__.update(self.__dict__)
+        state.ema = dict(self.ema)
+        return state
+
+
+def advance(state, time, high, low, close):
+    """
+    Продвигает состояние индикаторов по новым свечам.
+    :return: Новое состояние и словарь рядов индикаторов по этим свечам.
+    """
+    state = state.copy()
+    series = {}
+    for span in EMA_SPANS:
+        series[f"ema{span}"] = ema(close, 2 / (span + 1), state.ema.get(span))
+        state.ema[span] = series[f"ema{span}"][-1]
+
+    previous_close = close[0] if state.close is None else state.close
+    change = np.diff(close, prepend=previous_close)
+    gain = ema(np.maximum(change, 0), 1 / RSI_PERIOD, state.avg_gain)
+    loss = ema(np.maximum(-change, 0), 1 / RSI_PERIOD, state.avg_loss)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        series["rsi"] = np.where(loss > 0, 100 - 100 / (1 + gain / loss), 100.0)
+    state.avg_gain, state.avg_loss = gain[-1], loss[-1]
+
+    series["atr"] = ema(true_range(high, low, close, state.close), 1 / ATR_PERIOD, state.atr)
+    state.atr = series["atr"][-1]
+
+    state.close = close[-1]
+    state.last_time = int(time[-1])
+    return state, series
+
+
+class FeatureEngine:
+    """
+    Расчёт индикаторов и структурных признаков по свечам из CandleStore.
+    Состояние индикаторов хранится по закрытым свечам каждого ряда, поэтому при новом тике
+    считаются только новые свечи; последняя (формирующаяся) свеча каждый раз досчитывается
+    от состояния, но в него не записывается.
+    """
+
+    def __init__(self, store):
+        """
+        :param store: CandleStore.
+        """
+        self.store = store
+        self._states = {}
+
+    def compute(self, coin, timeframe):
+        """
+        Возвращает признаки ряда на последней свече или None, если данных нет.
+        """
+        frame = self.store.read(coin, timeframe)
+        if frame is None or len(frame) < 2:
+            return None
+        time, high, low, close = frame["time"], frame["high"], frame["low"], frame["close"]
+
+        # Досчитываем состояние по закрытым свечам (все, кроме последней)
+        state = self._states.get((coin, timeframe), SeriesState())
+        start = 0 if state.last_time is None else int(np.searchsorted(time, state.last_time, side="right"))
+        if start and time[start - 1] != state.last_time:
+            # Ряд в хранилище переписан заново - считаем с начала
+            state, start = SeriesState(), 0
+        if start < len(frame) - 1:
+            state, _ = advance(state, time[start:-1], high[start:-1], low[start:-1], close[start:-1])
+            self._states[(coin, timeframe)] = state
+
+        # Последняя свеча считается от сохранённого состояния
+        current, series = advance(state, time[-1:], high[-1:], low[-1:], close[-1:])
+        price = float(close[-1])
+
+        window_high = high[-RANGE_BARS:]
+        window_low = low[-RANGE_BARS:]
+        returns = np.diff(np.log(close[-RANGE_BARS - 1:]))
+        swing_highs, swing_lows = swing_points(high[-RANGE_BARS * 4:], low[-RANGE_BARS * 4:])
+        offset = len(frame) - min(len(frame), RANGE_BARS * 4)
+
+        ema_fast, ema_slow = current.ema[EMA_SPANS[0]], current.ema[EMA_SPANS[1]]
+        if price > ema_slow and ema_fast > ema_slow:
+            trend = "вверх"
+        elif price < ema_slow and ema_fast < ema_slow:
+            trend = "вниз"
+        else:
+            trend = "боковик"
+
+        return {
+            "price": price,
+            "ema": dict(current.ema),
+            "rsi": float(series["rsi"][-1]),
+            "atr": float(series["atr"][-1]),
+            "range_high": float(window_high.max()),
+            "range_low": float(window_low.min()),
+            "volatility": float(returns.std()) if len(returns) else 0.0,
+            "swing_highs": [(float(high[offset + i]), len(frame) - 1 - offset - i) for i in swing_highs[-3:]],
+            "swing_lows": [(float(low[offset + i]), len(frame) - 1 - offset - i) for i in swing_lows[-3:]],
+            "trend": trend,
+            "bars": len(frame),
+        }
+
+    def summary(self, csv_file_names):
+        """
+        Текстовая сводка признаков для промпта по файлам запроса (например, M15/H1/H4 одной монеты).
+        :return: Текст сводки или пустая строка, если данных нет.
+        """
+        lines = []
+        trends = []
+        for file_name in csv_file_names:
+            coin, timeframe = split_candle_file_name(file_name)
+            features = self.compute(coin, timeframe)
+            if features is None:
+                continue
+            trends.append((timeframe, features["trend"]))
+            price = features["price"]
+            emas = ", ".join(f"EMA{span} {value:.6g}" for span, value in features["ema"].items())
+            swings_high = "; ".join(f"{value:.6g} ({bars} св. назад)" for value, bars in features["swing_highs"])
+            swings_low = "; ".join(f"{value:.6g} ({bars} св. назад)" for value, bars in features["swing_lows"])
+            lines.append(
+                f"{timeframe} {coin}: цена {price:.6g}; {emas}; RSI{RSI_PERIOD} {features['rsi']:.1f}; "
+                f"ATR{ATR_PERIOD} {features['atr']:.6g} ({features['atr'] / price * 100:.2f}%); "
+                f"диапазон {RANGE_BARS} свечей {features['range_low']:.6g}-{features['range_high']:.6g}; "
+                f"волатильность {features['volatility'] * 100:.2f}% на свечу; "
+                f"свинг-хаи: {swings_high or 'нет'}; свинг-лоу: {swings_low or 'нет'}; тренд {features['trend']}")
+
+        if not lines:
+            return ""
+        directions = {trend for _, trend in trends}
+        alignment = directions.pop() if len(directions) == 1 else "смешанная"
+        lines.append("Согласованность таймфреймов: "
+                     + ", ".join(f"{timeframe} {trend}" for timeframe, trend in trends)
+                     + f" -> {alignment}")
+        return "Сводка индикаторов:\n" + "\n".join(lines)
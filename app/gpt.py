@@ -1,18 +1,102 @@
 from pathlib import Path
+import asyncio
+import logging
 import openai
 from app.csv_utils import csvs_to_text, get_last_high_low
+from app.candles import TIMEFRAME_SECONDS
+from app.data_sources.base import split_candle_file_name
+from app.metrics import metrics
+
+
+SYSTEM_PROMPT = "Выступи в роли профессионального трейдера-аналитика"
 
 
 class CSVAnalyzerGPT:
-    def __init__(self, api_key):
-        self.client = openai.OpenAI(api_key=api_key)
+    # Ошибки, после которых запрос имеет смысл повторить
+    RETRY_ERRORS = (openai.RateLimitError, openai.APITimeoutError,
+                    openai.APIConnectionError, openai.InternalServerError, asyncio.TimeoutError)
+
+    def __init__(self, api_key, store=None, concurrency=6, timeout=600, retries=4, cache=None,
+                 compact=False, token_budgets=None, features=None, features_max_row=None,
+                 client=None):
+        """
+        :param api_key: Ключ OpenAI API.
+        :param store: CandleStore, из которого берутся свечи вместо CSV.
+        :param concurrency: Максимум одновременных запросов к модели.
+        :param timeout: Таймаут одного запроса в секундах.
+        :param retries: Число попыток на запрос.
+        :param cache: ResponseCache перед API, в режиме replay запросы к API не выполняются.
+        :param compact: Передавать свечи в компактном виде (app/prompt_encoding.py).
+        :param token_budgets: Словарь {модель: бюджет токенов на данные}.
+        :param features: FeatureEngine, сводка индикаторов добавляется перед свечами.
+        :param features_max_row: Максимум строк свечей на файл, когда в промпте есть сводка.
+        :param client: Клиент с интерфейсом AsyncOpenAI (например, заглушка для бэктеста),
+            по умолчанию создаётся AsyncOpenAI.
+        """
+        self.features = features
+        self.features_max_row = features_max_row
+        self.compact = compact
+        self.token_budgets = token_budgets or {}
+        self.api_key = api_key
+        self.client = client  # Создаётся при первом запросе, в режиме replay не нужен
+        self.cache = cache
+        self.store = store
+        self.timeout = timeout
+        self.retries = retries
+        self._semaphore = asyncio.Semaphore(concurrency)
         # Фиксированная директория
         self.downloads_dir = Path("/root/scripts/AI-Signal-Bot/app/downloads")
 
-    def ask_gpt_about_csvs(self, csv_file_names, question, model_name, max_row):
-        # Используем функцию из csv_utils.py
-        print(2)
-        csv_text = csvs_to_text(csv_file_names, self.downloads_dir, max_row)
+    async def ask_gpt_about_csvs(self, csv_file_names, question, model_name, max_row, dump_path=None):
+        # Сборка промпта (индикаторы, чтение свечей) и обращения к кэшу в SQLite - в потоке:
+        # параллельные анализы тика не ждут друг друга в цикле событий
+        prompt, csv_text = await asyncio.to_thread(
+            self._build_prompt, csv_file_names, question, model_name, max_row, dump_path)
+        metrics.observe("prompt_chars", len(prompt), model=model_name)
+
+        cache_key = replay_key = None
+        if self.cache is not None:
+            cache_key, replay_key, cached = await asyncio.to_thread(
+                self._cache_lookup, csv_file_names, question, model_name, csv_text)
+            if cached is not None:
+                logging.info(f"Ответ {model_name} взят из кэша.")
+                metrics.inc("llm_cache_hits_total", model=model_name)
+                return cached
+
+        messages = [
+            {"role": "system",
+                "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ]
+        response = await self._create_with_retries(model_name, messages)
+        answer = response.choices[0].message.content
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, model=model_name, kind="prompt")
+            metrics.inc("llm_tokens_total", usage.completion_tokens or 0, model=model_name, kind="completion")
+
+        if cache_key is not None:
+            _, timeframe = split_candle_file_name(csv_file_names[0])
+            await asyncio.to_thread(
+                self.cache.put, cache_key, model_name, answer, TIMEFRAME_SECONDS.get(timeframe, 900),
+                replay_key=replay_key)
+        return answer
+
+    def _build_prompt(self, csv_file_names, question, model_name, max_row, dump_path):
+        """
+        Собирает промпт из сводки индикаторов и свечей.
+        :return: Кортеж (промпт, текст данных).
+        """
+        summary = self.features.summary(csv_file_names) if self.features is not None else ""
+        if summary and self.features_max_row:
+            # Индикаторы уже посчитаны по всей истории, сырых свечей достаточно меньше
+            max_row = min(max_row, self.features_max_row)
+        # Используем функцию из csv_utils.py, одинаковые данные в одном тике берутся из кэша
+        with metrics.span("prompt_build"):
+            csv_text = csvs_to_text(csv_file_names, self.downloads_dir, max_row, self.store, dump_path,
+                                    compact=self.compact, token_budget=self.token_budgets.get(model_name))
+        if summary:
+            csv_text = f"{summary}\n\n{csv_text}"
         # high_value, low_value = get_last_high_low(
         #     csv_file_names[0], self.downloads_dir)
         # print(high_value, low_value)
@@ -24,15 +108,51 @@ class CSVAnalyzerGPT:
         Исходя из этих данных ответь на следующий вопрос: {question}":
         
         """
+        return prompt, csv_text
+
+    def _cache_lookup(self, csv_file_names, question, model_name, csv_text):
+        """
+        Ищет ответ в кэше.
+        :return: Кортеж (ключ, ключ повтора, ответ или None).
+        """
+        cache_key = self.cache.make_key(model_name, SYSTEM_PROMPT, question, csv_text)
+        replay_key = self._replay_key(csv_file_names, question, model_name)
+        return cache_key, replay_key, self.cache.get(cache_key, replay_key)
 
-        response = self.client.chat.completions.create(
-            model=model_name,  # или "gpt-3.5-turbo"
-            messages=[
-                {"role": "system",
-                    "content": "Выступи в роли профессионального трейдера-аналитика"},
-                {"role": "user", "content": prompt},
-            ],
-            # reasoning_effort="high"
-        )
+    def _replay_key(self, csv_file_names, question, model_name):
+        """
+        Ключ повтора ответа в бэктесте: время последней свечи основного (первого) таймфрейма
+        в хранилище. В бою это формирующаяся свеча, в бэктесте - та же свеча, уже закрытая.
+        :return: Ключ или None, если свечи берутся не из хранилища.
+        """
+        if self.store is None:
+            return None
+        coin, timeframe = split_candle_file_name(csv_file_names[0])
+        frame = self.store.read(coin, timeframe, 1)
+        if frame is None or not len(frame):
+            return None
+        return self.cache.make_replay_key(model_name, question, csv_file_names, int(frame["time"][-1]))
 
-        return response.choices[0].message.content
+    async def _create_with_retries(self, model_name, messages):
+        """Отправляет запрос с ограничением параллельности, таймаутом и экспоненциальной паузой между попытками."""
+        if self.client is None:
+            self.client = openai.AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        for attempt in range(1, self.retries + 1):
+            try:
+                async with self._semaphore:
+                    with metrics.span("llm_request", model=model_name):
+                        return await asyncio.wait_for(
+                            self.client.chat.completions.create(
+                                model=model_name,  # или "gpt-3.5-turbo"
+                                messages=messages,
+                                # reasoning_effort="high"
+                            ),
+                            self.timeout,
+                        )
+            except self.RETRY_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                delay = min(2 ** attempt, 60)
+                logging.warning(
+                    f"Попытка {attempt}: ошибка запроса к {model_name} ({type(e).__name__}), повтор через {delay} с.")
+                await asyncio.sleep(delay)
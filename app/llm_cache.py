@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+
+class ResponseCache:
+    """
+    Постоянный кэш ответов модели в SQLite.
+    Ключ - хэш (модель, системный промпт, вопрос, данные), поэтому повторный запуск тика
+    с теми же входными данными (после падения бота или ошибки отправки) не оплачивает запрос заново.
+    Записи живут не дольше текущей свечи и вытесняются по количеству, начиная со старых.
+
+    Режимы:
+    - "live": кэш перед API, промах - запрос к модели и запись ответа;
+    - "replay": только записанные ответы без учёта срока жизни, промах - ошибка
+      (для прогона всего конвейера без API и для бэктеста). Кроме точного ключа ответ ищется
+      по ключу повтора (модель, вопрос, файлы, время последней свечи основного таймфрейма):
+      в бою промпт содержит формирующуюся свечу, а в бэктесте та же свеча уже закрыта,
+      поэтому тексты промптов не совпадают;
+    - "off": кэш не используется.
+    """
+
+    MODES = ("live", "replay", "off")
+
+    def __init__(self, db_path, mode="live", max_entries=5000):
+        """
+        :param db_path: Путь к файлу кэша.
+        :param mode: Режим работы: "live", "replay" или "off".
+        :param max_entries: Максимум записей, лишние удаляются начиная со старых.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Неизвестный режим кэша ответов: {mode}")
+        self.db_path = db_path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        # Кэш вызывается из потоков (asyncio.to_thread): одно обращение к соединению за раз
+        self._lock = threading.Lock()
+        if mode != "off":
+            self._connect()
+
+    def _connect(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                response TEXT,
+                created_at REAL,
+                expires_at REAL,
+                replay_key TEXT
+            );
+        """)
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(responses);")]
+        if "replay_key" not in columns:  # Кэш, созданный до появления ключа повтора
+            self.connection.execute("ALTER TABLE responses ADD COLUMN replay_key TEXT;")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_replay_key ON responses (replay_key);")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses (created_at);")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(model_name, system_prompt, question, data_context):
+        """Хэш входных данных запроса."""
+        payload = json.dumps([model_name, system_prompt, question, data_context], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_replay_key(model_name, question, file_names, bar_time):
+        """
+        Хэш запроса без текста данных: модель, вопрос (задача), файлы (монета и таймфреймы)
+        и время открытия последней свечи основного таймфрейма.
+        """
+        payload = json.dumps([model_name, question, list(file_names), int(bar_time)], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key, replay_key=None):
+        """
+        Возвращает записанный ответ или None.
+        В режиме "replay" срок жизни не проверяется, ответ ищется и по replay_key,
+        а промах вызывает LookupError.
+        """
+        if self.mode == "off":
+            return None
+
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT response, expires_at FROM responses WHERE key = ?;", (key,)).fetchone()
+            if row is None and self.mode == "replay" and replay_key is not None:
+                row = self.connection.execute(
+                    "SELECT response, expires_at FROM responses WHERE replay_key = ? "
+                    "ORDER BY created_at DESC LIMIT 1;", (replay_key,)).fetchone()
+        if row and (self.mode == "replay" or row[1] > time.time()):
+            self.hits += 1
+            return row[0]
+
+        self.misses += 1
+        if self.mode == "replay":
+            raise LookupError(f"Ответ для ключа {key[:12]}… не записан, режим replay.")
+        return None
+
+    def put(self, key, model_name, response, period, replay_key=None):
+        """
+        Записывает ответ.
+        :param period: Длительность свечи в секундах, запись истекает в конце текущей свечи.
+        :param replay_key: Ключ повтора для бэктеста (make_replay_key).
+        """
+        if self.mode != "live":
+            return
+
+        now = time.time()
+        # Ответ актуален до закрытия текущей свечи: следующая свеча - уже другие данные
+        expires_at = (now // period + 1) * period if period else now
+        with self._lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created_at, expires_at, replay_key) "
+                "VALUES (?, ?, ?, ?, ?, ?);",
+                (key, model_name, response, now, expires_at, replay_key))
+            self._evict()
+
+    def _evict(self):
+        """Удаляет самые старые записи сверх max_entries."""
+        count = self.connection.execute("SELECT COUNT(*) FROM responses;").fetchone()[0]
+        if count > self.max_entries:
+            self.connection.execute("""
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY created_at LIMIT ?
+                );
+            """, (count - self.max_entries,))
+            logging.info(f"Из кэша ответов удалено {count - self.max_entries} старых записей.")
+
+    def close(self):
+        if self.connection:
+            with self._lock:
+                self.connection.close()
+            self.connection = None
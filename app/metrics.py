@@ -0,0 +1,254 @@
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from aiohttp import web
+
+
+# Метки, которые наследуют все замеры внутри блока labels(...), например coin и strategy
+_labels = contextvars.ContextVar("metric_labels", default={})
+
+PREFIX = "signalbot_"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _max_name(name):
+    """Имя gauge с максимумом замера: stage_seconds -> stage_max_seconds, prompt_chars -> prompt_chars_max."""
+    if name.endswith("_seconds"):
+        return name[:-len("_seconds")] + "_max_seconds"
+    return name + "_max"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Замеры работы бота.
+    - span(name, **labels): длительность блока кода (загрузка браузера, выгрузка, запрос к модели,
+      операция с базой, отправка в Telegram). Метки блока labels(...) добавляются ко всем
+      замерам внутри него, в том числе в задачах, созданных внутри.
+    - observe(name, value, **labels): значение, например размер промпта.
+    - inc(name, value, **labels): счётчик, например токены модели.
+    - add_gauge(name, func): показатель, который вычисляется при чтении (память процесса, Chromium).
+    Всё доступно в формате Prometheus (render) и как сводка по тику (tick_summary).
+    """
+
+    def __init__(self, slowest=10, tick_spans=10000):
+        """
+        :param slowest: Сколько самых долгих замеров тика включать в сводку.
+        :param tick_spans: Сколько последних замеров хранить для сводки по тику. Сводку строит
+            только процесс с планировщиком, в воркерах старые замеры вытесняются.
+        """
+        self.slowest = slowest
+        self._summaries = {}  # {(имя, метки): [count, sum, max]}
+        self._counters = {}  # {(имя, метки): значение}
+        self._gauges = {}  # {имя: функция}
+        self._tick_spans = deque(maxlen=tick_spans)  # Замеры с прошлой сводки по тику
+        self._lock = threading.Lock()
+        self.last_tick = None
+
+    @contextmanager
+    def labels(self, **labels):
+        """Добавляет метки ко всем замерам внутри блока."""
+        token = _labels.set({**_labels.get(), **labels})
+        try:
+            yield
+        finally:
+            _labels.reset(token)
+
+    def _key(self, name, labels):
+        merged = {**_labels.get(), **labels}
+        return name, tuple(sorted((key, str(value)) for key, value in merged.items()))
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Замеряет длительность блока, ошибки внутри блока считаются отдельно."""
+        key = self._key(name, labels)
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            labels_key = tuple(sorted(key[1] + (("span", name),)))
+            self._observe(("span_seconds", labels_key), duration)
+            with self._lock:
+                if error:
+                    errors_key = ("span_errors_total", labels_key)
+                    self._counters[errors_key] = self._counters.get(errors_key, 0) + 1
+                self._tick_spans.append((name, dict(key[1]), duration, error))
+
+    def observe(self, name, value, **labels):
+        self._observe(self._key(name, labels), value)
+
+    def _observe(self, key, value):
+        with self._lock:
+            stats = self._summaries.get(key)
+            if stats is None:
+                self._summaries[key] = [1, value, value]
+            else:
+                stats[0] += 1
+                stats[1] += value
+                stats[2] = max(stats[2], value)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_gauge(self, name, func):
+        """Показатель, значение которого вычисляет func() при каждом чтении."""
+        self._gauges[name] = func
+
+    def gauges(self):
+        values = {}
+        for name, func in self._gauges.items():
+            try:
+                values[name] = func()
+            except Exception as e:
+                logging.error(f"Ошибка при вычислении показателя {name}: {e}")
+        return values
+
+    def render(self):
+        """Все показатели в текстовом формате Prometheus."""
+        lines = []
+        with self._lock:
+            summaries = sorted(self._summaries.items())
+            counters = sorted(self._counters.items())
+
+        declared = set()
+        for (name, labels), (count, total, maximum) in summaries:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} summary")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {total:.6f}")
+        # В summary допустимы только квантили, _sum и _count: максимум - отдельный gauge
+        for (name, labels), (count, total, maximum) in summaries:
+            max_name = _max_name(name)
+            if max_name not in declared:
+                declared.add(max_name)
+                lines.append(f"# TYPE {PREFIX}{max_name} gauge")
+            lines.append(f"{PREFIX}{max_name}{_format_labels(labels)} {maximum:.6f}")
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+            lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        for name, value in self.gauges().items():
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.append(f"{PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def tick_summary(self, tick):
+        """
+        Сводка по тику: задержка старта, этапы, замеры с прошлой сводки по именам,
+        самые долгие замеры с метками и текущие показатели.
+        :param tick: Запись тика из Scheduler.
+        :return: Словарь, пригодный для JSON.
+        """
+        self.observe("tick_lag_seconds", tick["lag"])
+        self.observe("tick_seconds", tick["duration"])
+        for name, result in tick["stages"].items():
+            self.observe("stage_seconds", result["duration"], stage=name)
+            self.inc("stage_total", stage=name, status=result["status"])
+        with self._lock:
+            spans = list(self._tick_spans)
+            self._tick_spans.clear()
+
+        by_name = {}
+        for name, labels, duration, error in spans:
+            stats = by_name.setdefault(name, {"count": 0, "seconds": 0.0, "max": 0.0, "errors": 0})
+            stats["count"] += 1
+            stats["seconds"] += duration
+            stats["max"] = max(stats["max"], duration)
+            stats["errors"] += error
+        for stats in by_name.values():
+            stats["seconds"] = round(stats["seconds"], 3)
+            stats["max"] = round(stats["max"], 3)
+
+        slowest = sorted(spans, key=lambda span: span[2], reverse=True)[:self.slowest]
+        summary = {
+            "due": tick["due"],
+            "scheduled_at": tick["scheduled_at"],
+            "lag": round(tick["lag"], 3),
+            "duration": round(tick["duration"], 3),
+            "stages": {name: {"status": result["status"], "seconds": round(result["duration"], 3)}
+                       for name, result in tick["stages"].items()},
+            "spans": by_name,
+            "slowest": [{"span": name, "seconds": round(duration, 3), **labels}
+                        for name, labels, duration, _ in slowest],
+            "gauges": self.gauges(),
+        }
+        self.last_tick = summary
+        return summary
+
+
+class MetricsServer:
+    """
+    HTTP-сервер показателей на localhost:
+    /metrics - формат Prometheus, /tick - JSON-сводка последнего тика.
+    Сводка каждого тика также дописывается строкой JSON в tick_log.
+    """
+
+    def __init__(self, metrics, host="127.0.0.1", port=9108, tick_log=None):
+        """
+        :param metrics: Metrics.
+        :param host: Адрес, по умолчанию только локальный.
+        :param port: Порт, 0 - сервер не запускается.
+        :param tick_log: Файл JSON Lines для сводок по тикам, по умолчанию не пишется.
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.tick_log = tick_log
+        self._runner = None
+
+    async def start(self):
+        if not self.port or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        app.router.add_get("/tick", self._handle_tick)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logging.info(f"Показатели доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self.metrics.render(), content_type="text/plain", charset="utf-8")
+
+    async def _handle_tick(self, request):
+        return web.json_response(self.metrics.last_tick or {})
+
+    def on_tick(self, tick):
+        """Обработчик завершения тика для Scheduler.add_listener."""
+        summary = self.metrics.tick_summary(tick)
+        if self.tick_log:
+            try:
+                with open(self.tick_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logging.error(f"Не удалось записать сводку тика: {e}")
+
+
+# Общий экземпляр для всего бота
+metrics = Metrics()
@@ -0,0 +1,255 @@
+import os
+import time
+import asyncio
+import sqlite3
+import logging
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError)
+from app.metrics import metrics
+
+
+# Максимальная длина сообщения Telegram
+MAX_MESSAGE_LENGTH = 4096
+# Разделитель сообщений, объединённых в одно
+COALESCE_SEPARATOR = "\n\n"
+
+
+def coalesce(texts, max_length=MAX_MESSAGE_LENGTH):
+    """
+    Объединяет тексты подряд в одно сообщение, пока оно укладывается в max_length.
+    Текст длиннее max_length отправляется отдельно и обрезается.
+    :param texts: Список текстов по порядку.
+    :return: Кортеж (текст сообщения, сколько текстов в него вошло).
+    """
+    message = texts[0][:max_length]
+    count = 1
+    for text in texts[1:]:
+        if len(message) + len(COALESCE_SEPARATOR) + len(text) > max_length:
+            break
+        message += COALESCE_SEPARATOR + text
+        count += 1
+    return message, count
+
+
+class Notifier:
+    """
+    Очередь исходящих сообщений Telegram.
+    Вызывающий код только ставит сообщение в очередь (enqueue) и продолжает работу, отправкой
+    занимается фоновая задача:
+    - в один чат отправляется не чаще одного сообщения в chat_interval секунд, во все чаты
+      вместе - не больше global_rate сообщений в секунду (ограничения Telegram для ботов:
+      около 20 сообщений в минуту в группу или канал и 30 в секунду всего);
+    - сообщения, накопившиеся для одного чата (например, сигналы всех монет за тик),
+      объединяются в одно;
+    - при 429 отправка в чат откладывается на retry_after из ответа, при ошибках сервера и сети
+      повторяется с экспоненциальной задержкой, остальные ошибки API не повторяются;
+    - неотправленные сообщения хранятся в SQLite и отправляются после перезапуска.
+    """
+
+    def __init__(self, bot, outbox_path, chat_interval=3.0, global_rate=25, max_attempts=8,
+                 max_backoff=300):
+        """
+        :param bot: aiogram Bot.
+        :param outbox_path: Путь к файлу очереди неотправленных сообщений.
+        :param chat_interval: Минимальный интервал между сообщениями в один чат, секунды.
+        :param global_rate: Максимум сообщений в секунду во все чаты.
+        :param max_attempts: Сколько раз повторять отправку при ошибках сервера и сети.
+        :param max_backoff: Максимальная задержка перед повтором, секунды.
+        """
+        self.bot = bot
+        self.outbox_path = outbox_path
+        self.chat_interval = chat_interval
+        self.global_rate = global_rate
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.connection = None
+        self._chat_ready_at = {}  # {чат: время, раньше которого в чат не отправляем}
+        self._last_send = 0.0
+        self._wakeup = None
+        self._task = None
+
+    def _connect(self):
+        directory = os.path.dirname(self.outbox_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(self.outbox_path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT,
+                text TEXT,
+                created_at REAL,
+                attempts INTEGER DEFAULT 0,
+                next_try REAL DEFAULT 0
+            );
+        """)
+        self.connection.commit()
+
+    async def start(self):
+        """Открывает очередь и запускает отправку, включая сообщения, оставшиеся с прошлого запуска."""
+        if self._task is not None:
+            return
+        if self.connection is None:
+            self._connect()
+        pending = self.pending()
+        if pending:
+            logging.info(f"В очереди отправки {pending} сообщений с прошлого запуска.")
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout=10):
+        """
+        Останавливает отправку, дав до timeout секунд на отправку очереди.
+        Неотправленные сообщения остаются в очереди до следующего запуска.
+        """
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.connection.close()
+        self.connection = None
+        logging.info(
+            f"Отправка сообщений: отправлено {self.sent}, объединено {self.coalesced}, "
+            f"не доставлено {self.dropped}.")
+
+    def enqueue(self, chat_id, text):
+        """Ставит сообщение в очередь отправки."""
+        self.enqueue_many([(chat_id, text)])
+
+    def enqueue_many(self, messages):
+        """
+        Ставит сообщения в очередь одной транзакцией.
+        :param messages: Список (чат, текст).
+        """
+        rows = []
+        now = time.time()
+        for chat_id, text in messages:
+            # Неуказанный RR*_CHANEL_ID иначе попал бы в очередь как чат 'None'
+            if chat_id is None or chat_id == "":
+                logging.warning(f"Сообщение без чата не поставлено в очередь: {text[:100]}")
+                continue
+            rows.append((str(chat_id), text, now))
+        if not rows:
+            return
+        if self.connection is None:
+            self._connect()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO outbox (chat_id, text, created_at) VALUES (?, ?, ?);", rows)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self):
+        """Число сообщений в очереди."""
+        return self.connection.execute("SELECT COUNT(*) FROM outbox;").fetchone()[0]
+
+    async def _run(self):
+        errors = 0
+        while True:
+            self._wakeup.clear()
+            try:
+                delay = await self._send_ready()
+                errors = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Ошибка очереди (например, SQLite) не должна останавливать отправку навсегда
+                errors += 1
+                delay = min(2 ** errors, self.max_backoff)
+                logging.error(f"Ошибка отправки сообщений из очереди: {e}, повтор через {delay} с.")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send_ready(self):
+        """
+        Отправляет по одному (объединённому) сообщению в каждый чат, в который уже можно писать.
+        :return: Через сколько секунд проверить очередь снова (None - ждать новых сообщений).
+        """
+        now = time.time()
+        rows = self.connection.execute(
+            "SELECT id, chat_id, text, attempts, next_try FROM outbox ORDER BY id;").fetchall()
+        chats = {}
+        for row in rows:
+            chats.setdefault(row[1], []).append(row)
+
+        wake_at = None
+        for chat_id, chat_rows in chats.items():
+            ready_at = max(self._chat_ready_at.get(chat_id, 0), chat_rows[0][4])
+            if ready_at > now:
+                wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                continue
+            await self._send(chat_id, chat_rows)
+            now = time.time()
+            ready_at = self._chat_ready_at.get(chat_id, 0)
+            wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+        return None if wake_at is None else max(wake_at - time.time(), 0)
+
+    async def _send(self, chat_id, rows):
+        text, count = coalesce([row[2] for row in rows])
+        ids = [row[0] for row in rows[:count]]
+        attempts = rows[0][3]
+
+        # Общий лимит на все чаты
+        pause = self._last_send + 1 / self.global_rate - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        self._last_send = time.monotonic()
+
+        try:
+            with metrics.span("telegram_send"):
+                await self.bot.send_message(chat_id=chat_id, text=text)
+        except TelegramRetryAfter as e:
+            logging.warning(f"Telegram ограничил отправку в {chat_id}, повтор через {e.retry_after} с.")
+            self._chat_ready_at[chat_id] = time.time() + e.retry_after
+            return
+        except (TelegramServerError, TelegramNetworkError) as e:
+            self._retry_later(chat_id, ids, count, attempts, e)
+            return
+        except TelegramAPIError as e:
+            logging.error(f"Сообщение в {chat_id} отклонено Telegram: {e}")
+            self._delete(ids)
+            self.dropped += count
+            return
+        except Exception as e:
+            # Ошибка вне API Telegram (например, проверки параметров) повторяется как ошибка сервера,
+            # чтобы сообщение не осталось в очереди навсегда
+            self._retry_later(chat_id, ids, count, attempts, e)
+            return
+
+        self._delete(ids)
+        self.sent += 1
+        self.coalesced += count - 1
+        metrics.inc("telegram_messages_total", count)
+        self._chat_ready_at[chat_id] = time.time() + self.chat_interval
+        logging.info(f"Сообщение успешно отправлено в Telegram-канал {chat_id} ({count} объединено).")
+
+    def _retry_later(self, chat_id, ids, count, attempts, error):
+        """Откладывает повтор с экспоненциальной задержкой, после max_attempts попыток удаляет сообщения."""
+        attempts += 1
+        if attempts >= self.max_attempts:
+            logging.error(f"Сообщение в {chat_id} не отправлено после {attempts} попыток: {error}")
+            self._delete(ids)
+            self.dropped += count
+            return
+        backoff = min(2 ** attempts, self.max_backoff)
+        logging.warning(f"Ошибка при отправке сообщения в {chat_id}: {error}, повтор через {backoff} с.")
+        with self.connection:
+            self.connection.execute(
+                "UPDATE outbox SET attempts = ?, next_try = ? WHERE id = ?;",
+                (attempts, time.time() + backoff, ids[0]))
+
+    def _delete(self, ids):
+        with self.connection:
+            self.connection.executemany("DELETE FROM outbox WHERE id = ?;", [(id_,) for id_ in ids])
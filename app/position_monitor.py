@@ -0,0 +1,167 @@
+import logging
+from collections import defaultdict
+import numpy as np
+
+
+SHORT_SIGNALS = ("шорт", "short")
+
+# Исход позиции
+OUTCOME_NONE = 0
+OUTCOME_TP = 1
+OUTCOME_SL = -1
+
+
+def is_short(signal):
+    return signal in SHORT_SIGNALS
+
+
+def calc_pnl(short, entry, exit_price, take_profit):
+    """
+    PnL закрытой позиции в процентах, те же формулы, что и раньше в pnl_update.
+    Работает и с числами, и с массивами NumPy.
+    :param short: Признак шорта.
+    :param entry: Цена входа.
+    :param exit_price: Цена выхода (TP или SL).
+    :param take_profit: True - закрыта по тейк-профиту, False - по стоп-лоссу.
+    :return: PnL, положительный для тейк-профита и отрицательный для стоп-лосса.
+    """
+    entry = np.asarray(entry, dtype=np.float64)
+    exit_price = np.asarray(exit_price, dtype=np.float64)
+    # Лонг по тейк-профиту считается от цены входа, остальные случаи - от цены выхода
+    from_entry = np.logical_and(np.logical_not(short), take_profit)
+    pnl = np.where(from_entry, (exit_price - entry) / entry, (entry - exit_price) / exit_price)
+    pnl = np.round(pnl * 100, 3)
+    pnl = np.where(take_profit, np.abs(pnl), -np.abs(pnl))
+    return float(pnl) if pnl.ndim == 0 else pnl
+
+
+def first_hits(high, low, starts, short, take_profit, stop_loss):
+    """
+    Для каждой позиции находит первую свечу, на которой сработал TP или SL.
+    Позиции сравниваются со всеми свечами сразу (матрица позиции x свечи), без цикла по свечам.
+    Если TP и SL задеты на одной свече, считается, что первым сработал SL.
+    :param high: Массив high свечей.
+    :param low: Массив low свечей.
+    :param starts: Индекс первой свечи, которую нужно проверять, для каждой позиции.
+    :param short: Массив признаков шорта.
+    :param take_profit: Массив уровней TP.
+    :param stop_loss: Массив уровней SL.
+    :return: Кортеж (исходы OUTCOME_*, индексы свечей срабатывания, -1 если не сработало).
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    outcomes = np.full(len(starts), OUTCOME_NONE)
+    indexes = np.full(len(starts), -1)
+    if not len(starts) or int(starts.min()) >= len(high):
+        return outcomes, indexes  # Нет позиций или после входа ещё нет свечей
+
+    first = int(starts.min())
+    high = np.asarray(high[first:], dtype=np.float64)[None, :]
+    low = np.asarray(low[first:], dtype=np.float64)[None, :]
+    short = np.asarray(short, dtype=bool)[:, None]
+    take_profit = np.asarray(take_profit, dtype=np.float64)[:, None]
+    stop_loss = np.asarray(stop_loss, dtype=np.float64)[:, None]
+    valid = np.arange(first, first + high.shape[1])[None, :] >= starts[:, None]
+
+    # Сравнения строгие, как и в прежней проверке по последней свече
+    tp_hit = np.where(short, low < take_profit, high > take_profit) & valid
+    sl_hit = np.where(short, high > stop_loss, low < stop_loss) & valid
+
+    never = high.shape[1]
+    first_tp = np.where(tp_hit.any(axis=1), tp_hit.argmax(axis=1), never)
+    first_sl = np.where(sl_hit.any(axis=1), sl_hit.argmax(axis=1), never)
+
+    sl_first = (first_sl <= first_tp) & (first_sl < never)
+    tp_first = (first_tp < first_sl)
+    outcomes[sl_first] = OUTCOME_SL
+    outcomes[tp_first] = OUTCOME_TP
+    indexes[sl_first] = first_sl[sl_first] + first
+    indexes[tp_first] = first_tp[tp_first] + first
+    return outcomes, indexes
+
+
+class PositionMonitor:
+    """
+    Проверка всех открытых позиций по истории свечей из CandleStore.
+    Открытые позиции всех стратегий читаются одним проходом по таблицам, позиции одной монеты
+    проверяются по всем свечам с момента входа сразу, а закрытия записываются одной транзакцией.
+    Поэтому свечи между тиками и пропуски после перезапуска не теряются.
+    """
+
+    def __init__(self, db, store, table_names, bar_timeframe="M15"):
+        """
+        :param db: Запущенный AsyncDatabase.
+        :param store: CandleStore.
+        :param table_names: Таблицы стратегий.
+        :param bar_timeframe: Таймфрейм свечей для проверки, если он есть в хранилище;
+            иначе используется таймфрейм позиции.
+        """
+        self.db = db
+        self.store = store
+        self.table_names = table_names
+        self.bar_timeframe = bar_timeframe
+
+    def _bars(self, coin, timeframe):
+        """Свечи для проверки: сначала мелкий таймфрейм, затем таймфрейм позиции."""
+        for candidate in (self.bar_timeframe, timeframe):
+            frame = self.store.read(coin, candidate) if candidate else None
+            if frame is not None and len(frame):
+                return candidate, frame
+        return None, None
+
+    async def check(self):
+        """
+        Проверяет открытые позиции и закрывает сработавшие.
+        :return: Список закрытых позиций (словари позиции с ключами outcome, exit_price, pnl, closed_bar_time).
+        """
+        positions = await self.db.get_open_positions(self.table_names)
+        if not positions:
+            return []
+
+        groups = defaultdict(list)
+        for position in positions:
+            groups[(position["coin_name"], position["timeframe"])].append(position)
+
+        bar_groups = defaultdict(list)
+        frames = {}
+        for (coin, timeframe), group in groups.items():
+            bar_timeframe, frame = self._bars(coin, timeframe)
+            if frame is None:
+                logging.warning(f"Нет свечей {coin} для проверки {len(group)} открытых позиций.")
+                continue
+            frames[(coin, bar_timeframe)] = frame
+            bar_groups[(coin, bar_timeframe)].extend(group)
+
+        closed = []
+        for key, group in bar_groups.items():
+            frame = frames[key]
+            times = frame["time"]
+            # Проверяем свечи, открывшиеся после входа; для старых позиций без времени
+            # открытия - только последнюю свечу, как раньше
+            starts = [
+                np.searchsorted(times, position["opened_at"], side="right")
+                if position.get("opened_at") else len(times) - 1
+                for position in group
+            ]
+            short = np.array([is_short(position["signal"]) for position in group])
+            take_profit = np.array([position["TP"] for position in group], dtype=np.float64)
+            stop_loss = np.array([position["SL"] for position in group], dtype=np.float64)
+            outcomes, indexes = first_hits(frame["high"], frame["low"], starts, short, take_profit, stop_loss)
+
+            for position, outcome, index, position_short in zip(group, outcomes, indexes, short):
+                if outcome == OUTCOME_NONE:
+                    continue
+                is_tp = outcome == OUTCOME_TP
+                exit_price = position["TP"] if is_tp else position["SL"]
+                closed.append(dict(
+                    position,
+                    outcome=int(outcome),
+                    exit_price=exit_price,
+                    pnl=calc_pnl(position_short, position["open"], exit_price, is_tp),
+                    closed_bar_time=int(times[index]),
+                ))
+
+        if closed:
+            await self.db.close_positions(
+                [(position["table"], position["id"], position["pnl"]) for position in closed])
+            logging.info(f"Закрыто {len(closed)} из {len(positions)} открытых позиций.")
+        return closed
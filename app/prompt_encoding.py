@@ -0,0 +1,149 @@
+import logging
+from datetime import datetime, timezone
+import numpy as np
+
+
+# Короткие имена основных колонок
+COLUMN_ALIASES = {"open": "o", "high": "h", "low": "l", "close": "c", "Volume": "v", "volume": "v"}
+
+# Колонки, которые считаются ценовыми, если их значения близки к цене закрытия
+PRICE_COLUMNS = ("open", "high", "low", "close")
+
+# Грубая оценка: числа и знаки препинания дают около 3 символов на токен
+CHARS_PER_TOKEN = 3.0
+
+
+def estimate_tokens(text):
+    """Оценивает число токенов в тексте без обращения к токенизатору."""
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def infer_tick_size(values, max_decimals=8, significant_digits=7):
+    """
+    Определяет шаг цены по данным: наименьшее число знаков после запятой,
+    при котором все значения остаются точными, но не мельче significant_digits значащих цифр.
+    """
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return 1.0
+    magnitude = int(np.floor(np.log10(np.max(np.abs(values)) or 1)))
+    max_decimals = min(max_decimals, max(0, significant_digits - 1 - magnitude))
+    for decimals in range(max_decimals + 1):
+        scaled = values * 10 ** decimals
+        if np.all(np.abs(scaled - np.round(scaled)) < 1e-9 * np.maximum(1, np.abs(scaled))):
+            return 10.0 ** -decimals
+    return 10.0 ** -max_decimals
+
+
+def _decimals(step):
+    return max(0, int(round(-np.log10(step))))
+
+
+def _format_column(values, decimals):
+    """Форматирует колонку с фиксированным числом знаков, nan - пустая ячейка."""
+    formatted = np.char.mod(f"%.{decimals}f", np.nan_to_num(values))
+    formatted[~np.isfinite(values)] = ""
+    return formatted
+
+
+def _significant_decimals(values, digits=4):
+    """Число знаков после запятой, чтобы сохранить digits значащих цифр у типичного значения."""
+    finite = np.abs(values[np.isfinite(values)])
+    if not len(finite) or not np.median(finite):
+        return 0
+    return max(0, digits - 1 - int(np.floor(np.log10(np.median(finite)))))
+
+
+def _format_step(seconds):
+    if seconds % 86400 == 0:
+        return f"{seconds // 86400}d"
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    return f"{seconds // 60}m"
+
+
+def encode_frame(frame, title, tick_size=None):
+    """
+    Компактное текстовое представление свечей для промпта.
+    - пустые, постоянные и повторяющиеся колонки отбрасываются;
+    - OHLC и близкие к цене индикаторы округляются до шага цены, остальные - до 4 значащих цифр;
+    - время не передаётся в каждой строке: указывается начало и шаг, при пропусках свечей
+      добавляется колонка dt с интервалом от предыдущей свечи в минутах;
+    - строки - значения через запятую без обёрток.
+    :param frame: CandleFrame.
+    :param title: Заголовок блока, например 'M15_BTC'.
+    :param tick_size: Шаг цены, по умолчанию определяется по данным.
+    :return: Текст блока.
+    """
+    if not len(frame):
+        return f"{title}: нет данных"
+
+    close = frame["close"]
+    tick_size = tick_size or infer_tick_size(close)
+    price_level = np.nanmedian(np.abs(close)) or 1.0
+
+    names, columns = [], []
+    seen = []
+    for name, values in frame.columns.items():
+        if name == "time":
+            continue
+        values = np.asarray(values, dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        if name not in PRICE_COLUMNS:
+            if not len(finite) or np.all(finite == finite[0]):
+                continue  # Пустая или постоянная колонка
+            if any(np.array_equal(values, other, equal_nan=True) for other in seen):
+                continue  # Колонка повторяет другую
+        seen.append(values)
+
+        is_price = name in PRICE_COLUMNS or (
+            len(finite) and 0.5 < np.median(np.abs(finite)) / price_level < 2)
+        if is_price:
+            decimals = _decimals(tick_size)
+            values = np.round(values / tick_size) * tick_size
+        else:
+            decimals = _significant_decimals(values)
+        names.append(COLUMN_ALIASES.get(name, name))
+        columns.append(_format_column(values, decimals))
+
+    times = np.asarray(frame["time"], dtype=np.int64)
+    steps = np.diff(times)
+    step = int(np.median(steps)) if len(steps) else 0
+    if len(steps) and np.any(steps != step):
+        names.insert(0, "dt")
+        columns.insert(0, np.concatenate(([0], steps // 60)).astype(str))
+
+    start = datetime.fromtimestamp(int(times[0]), timezone.utc).strftime("%Y-%m-%dT%H:%MZ")
+    header = (f"{title}: {len(frame)} свечей с {start}"
+              + (f", шаг {_format_step(step)}" if step else "")
+              + f", шаг цены {tick_size:g}")
+    rows = [",".join(row) for row in zip(*columns)]
+    return "\n".join([header, ",".join(names)] + rows)
+
+
+def fit_rows(build_text, max_row, token_budget, min_row=20):
+    """
+    Подбирает наибольшее число строк, при котором текст укладывается в бюджет токенов.
+    :param build_text: Функция rows -> текст.
+    :param max_row: Верхняя граница числа строк.
+    :param token_budget: Бюджет токенов на данные.
+    :param min_row: Нижняя граница, меньше не урезаем даже при превышении бюджета.
+    :return: Кортеж (число строк, текст).
+    """
+    text = build_text(max_row)
+    if not token_budget or estimate_tokens(text) <= token_budget:
+        return max_row, text
+
+    low, high = min_row, max_row
+    best_rows, best_text = min_row, build_text(min_row)
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = build_text(middle)
+        if estimate_tokens(candidate) <= token_budget:
+            best_rows, best_text = middle, candidate
+            low = middle + 1
+        else:
+            high = middle - 1
+    logging.info(
+        f"Данные урезаны до {best_rows} строк на файл, чтобы уложиться в {token_budget} токенов.")
+    return best_rows, best_text
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+
+class CandleTrigger:
+    """
+    Срабатывание, привязанное к закрытию свечи: каждые period секунд со сдвигом offset
+    относительно границы свечи в часовом поясе tz (для D1 граница - полночь в tz).
+    Например, period=900, offset=-120 - за 2 минуты до закрытия каждой 15-минутной свечи.
+    """
+
+    def __init__(self, period, offset=0, tz=None):
+        """
+        :param period: Период в секундах (длительность свечи).
+        :param offset: Сдвиг относительно закрытия свечи в секундах.
+        :param tz: Часовой пояс, в котором выравниваются свечи.
+        """
+        self.period = period
+        self.offset = offset
+        self.tz = tz
+
+    def _utc_offset(self, timestamp):
+        if self.tz is None:
+            return 0
+        return datetime.fromtimestamp(timestamp, self.tz).utcoffset().total_seconds()
+
+    def next_fire(self, after):
+        """Ближайшее время срабатывания (unix) строго после after."""
+        utc_offset = self._utc_offset(after)
+        local = after + utc_offset - self.offset
+        return (local // self.period + 1) * self.period + self.offset - utc_offset
+
+
+class Stage:
+    """Этап тика: корутина func(context), зависимости и дедлайн в секундах."""
+
+    def __init__(self, name, func, deps=(), deadline=None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.deadline = deadline
+
+
+async def run_stages(stages, context):
+    """
+    Выполняет граф этапов: каждый этап запускается, как только завершились его зависимости,
+    независимые этапы идут параллельно. Этап, не уложившийся в дедлайн, отменяется;
+    этапы, зависящие от неуспешного, пропускаются.
+    :param stages: Список Stage.
+    :param context: Общий словарь, через который этапы передают данные друг другу.
+    :return: Словарь {этап: {'status': 'ok'|'failed'|'timeout'|'skipped', 'duration': секунды}}.
+    """
+    results = {}
+    tasks = {}
+
+    async def run(stage):
+        if stage.deps:
+            await asyncio.gather(*(tasks[name] for name in stage.deps))
+        failed = [name for name in stage.deps if results[name]["status"] != "ok"]
+        if failed:
+            results[stage.name] = {"status": "skipped", "duration": 0.0}
+            logging.warning(f"Этап {stage.name} пропущен: не выполнены {', '.join(failed)}.")
+            return
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(stage.func(context), stage.deadline)
+            status = "ok"
+        except asyncio.TimeoutError:
+            status = "timeout"
+            logging.error(f"Этап {stage.name} не уложился в {stage.deadline} с.")
+        except Exception as e:
+            status = "failed"
+            logging.error(f"Ошибка на этапе {stage.name}: {e}")
+        results[stage.name] = {"status": status, "duration": time.perf_counter() - started}
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+    await asyncio.gather(*tasks.values())
+    return results
+
+
+def stages_budget(stages):
+    """
+    Наибольшая длительность графа этапов по их дедлайнам: сумма дедлайнов на самом длинном
+    пути по зависимостям.
+    :return: Секунды или None, если у какого-то этапа нет дедлайна.
+    """
+    by_name = {stage.name: stage for stage in stages}
+    ends = {}
+
+    def end(stage):
+        if stage.name not in ends:
+            deps = [end(by_name[name]) for name in stage.deps]
+            if stage.deadline is None or None in deps:
+                ends[stage.name] = None
+            else:
+                ends[stage.name] = max(deps, default=0) + stage.deadline
+        return ends[stage.name]
+
+    budgets = [end(stage) for stage in stages]
+    return None if None in budgets else max(budgets, default=0)
+
+
+class Scheduler:
+    """
+    Планировщик тиков.
+    Время следующего срабатывания вычисляется от часов, а не отсчитывается паузами, поэтому
+    не накапливает сдвиг. Срабатывания разных расписаний в одну и ту же секунду (например,
+    15-минутного и часового в :58) объединяются в один тик. Если предыдущий тик ещё идёт,
+    новый не запускается, а пропуск записывается в лог и в счётчик skipped.
+    """
+
+    def __init__(self, triggers, build_stages, history=100, max_lag=60):
+        """
+        :param triggers: Словарь {имя расписания: CandleTrigger}.
+        :param build_stages: Функция (имена сработавших расписаний) -> список Stage для тика.
+        :param history: Сколько последних тиков хранить в ticks.
+        :param max_lag: Срабатывания, опоздавшие больше чем на max_lag секунд (например, после
+            засыпания машины), не догоняются, а пропускаются.
+        """
+        self.triggers = triggers
+        self.build_stages = build_stages
+        self.max_lag = max_lag
+        self.ticks = deque(maxlen=history)
+        self.skipped = 0
+        self._running = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Подписывает callback(tick) на завершение каждого тика."""
+        self._listeners.append(callback)
+
+    def check_budget(self, stages=None, margin=60):
+        """
+        Проверяет, что тик, израсходовавший дедлайны всех этапов, заканчивается до следующего
+        срабатывания: иначе следующий тик пропускается.
+        :param stages: Граф этапов, по умолчанию - тик, в котором сработали все расписания.
+        :param margin: Запас до следующего срабатывания, секунды.
+        :return: Бюджет тика в секундах.
+        :raises ValueError: Если бюджет не укладывается в интервал или у этапа нет дедлайна.
+        """
+        interval = min(trigger.period for trigger in self.triggers.values())
+        if stages is None:
+            stages = self.build_stages(sorted(self.triggers))
+        budget = stages_budget(stages)
+        if budget is None:
+            raise ValueError("У каждого этапа тика должен быть дедлайн.")
+        if budget > interval - margin:
+            raise ValueError(
+                f"Сумма дедлайнов этапов {budget} с больше интервала между тиками {interval} с "
+                f"за вычетом запаса {margin} с.")
+        return budget
+
+    def next_fire(self, after):
+        """Время ближайшего срабатывания и имена расписаний, которые сработают в это время."""
+        fires = {name: trigger.next_fire(after) for name, trigger in self.triggers.items()}
+        fire_at = min(fires.values())
+        return fire_at, sorted(name for name, value in fires.items() if value == fire_at)
+
+    async def run(self):
+        """Основной цикл планировщика."""
+        last_fire = time.time()
+        while True:
+            fire_at, due = self.next_fire(max(last_fire, time.time() - self.max_lag))
+            await asyncio.sleep(max(fire_at - time.time(), 0))
+            last_fire = fire_at
+
+            if self._running is not None and not self._running.done():
+                self.skipped += 1
+                logging.warning(
+                    f"Тик {', '.join(due)} в {datetime.fromtimestamp(fire_at):%H:%M} пропущен: "
+                    f"предыдущий тик ещё выполняется.")
+                continue
+            self._running = asyncio.create_task(self.run_tick(due, fire_at))
+
+    async def run_tick(self, due, scheduled_at):
+        """Выполняет один тик и записывает его задержку старта, длительность и этапы."""
+        started_at = time.time()
+        lag = started_at - scheduled_at
+        logging.info(f"Тик {', '.join(due)}: старт с задержкой {lag * 1000:.0f} мс.")
+
+        context = {"due": due, "scheduled_at": scheduled_at}
+        stages = await run_stages(self.build_stages(due), context)
+
+        tick = {
+            "due": due,
+            "scheduled_at": scheduled_at,
+            "lag": lag,
+            "duration": time.time() - started_at,
+            "stages": stages,
+        }
+        self.ticks.append(tick)
+        logging.info(
+            f"Тик {', '.join(due)} завершён за {tick['duration']:.1f} с: "
+            + ", ".join(f"{name} {result['status']} {result['duration']:.1f} с"
+                        for name, result in stages.items()))
+        for callback in self._listeners:
+            try:
+                callback(tick)
+            except Exception as e:
+                logging.error(f"Ошибка обработчика тика: {e}")
+        return tick
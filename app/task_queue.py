@@ -0,0 +1,338 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from collections import namedtuple
+from app.metrics import metrics
+
+
+# Задача из очереди: id, тема, данные (JSON-совместимые) и число неудачных попыток до этой
+Task = namedtuple("Task", ["id", "topic", "payload", "attempts"])
+
+
+class MemoryQueue:
+    """
+    Очередь задач в памяти процесса: для запуска всех ролей в одном процессе и для проверки.
+    Задачи не переживают перезапуск.
+    """
+
+    def __init__(self):
+        self._queues = {}
+        self._handles = set()
+
+    def _queue(self, topic):
+        if topic not in self._queues:
+            self._queues[topic] = asyncio.Queue()
+        return self._queues[topic]
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        for handle in self._handles:
+            handle.cancel()
+        self._handles.clear()
+
+    async def put(self, topic, payload):
+        self._queue(topic).put_nowait(Task(uuid.uuid4().hex, topic, payload, 0))
+
+    async def get(self, topic, timeout=None):
+        """
+        Возвращает следующую задачу темы.
+        :param timeout: Сколько ждать задачу, секунды.
+        :return: Task или None, если задач не было.
+        """
+        try:
+            return await asyncio.wait_for(self._queue(topic).get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, task):
+        pass
+
+    async def retry(self, task, delay):
+        """Возвращает задачу в очередь через delay секунд."""
+        handle = asyncio.get_running_loop().call_later(
+            delay, self._requeue, task._replace(attempts=task.attempts + 1))
+        self._handles.add(handle)
+
+    def _requeue(self, task):
+        self._handles = {handle for handle in self._handles if not handle.cancelled()}
+        self._queue(task.topic).put_nowait(task)
+
+    async def size(self, topic):
+        return self._queue(topic).qsize()
+
+
+class SQLiteQueue:
+    """
+    Очередь задач в файле SQLite: роли в разных процессах одной машины.
+    Выданная задача арендуется на lease секунд: если воркер упал и не подтвердил её,
+    по истечении аренды задачу получит другой воркер.
+    """
+
+    def __init__(self, path, lease=900, poll_interval=0.5):
+        """
+        :param path: Путь к файлу очереди.
+        :param lease: Время аренды задачи, секунды (больше самого долгого обработчика).
+        :param poll_interval: Интервал опроса пустой очереди, секунды.
+        """
+        self.path = path
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                     isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL;")
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                topic TEXT,
+                payload TEXT,
+                attempts INTEGER DEFAULT 0,
+                available_at REAL DEFAULT 0,
+                leased_until REAL DEFAULT 0
+            );
+        """)
+        connection.execute("CREATE INDEX IF NOT EXISTS idx_tasks_topic ON tasks (topic, id);")
+        return connection
+
+    async def start(self):
+        if self.connection is None:
+            self.connection = await asyncio.to_thread(self._connect)
+
+    async def close(self):
+        if self.connection is not None:
+            with self._lock:
+                self.connection.close()
+            self.connection = None
+
+    async def _execute(self, func, *args):
+        """Выполняет func(connection, *args) в отдельном потоке, одно обращение к файлу за раз."""
+        await self.start()
+
+        def run():
+            with self._lock:
+                return func(self.connection, *args)
+
+        return await asyncio.to_thread(run)
+
+    async def put(self, topic, payload):
+        await self._execute(
+            lambda connection: connection.execute(
+                "INSERT INTO tasks (topic, payload) VALUES (?, ?);",
+                (topic, json.dumps(payload, ensure_ascii=False))))
+
+    def _claim(self, connection, topic):
+        now = time.time()
+        # BEGIN IMMEDIATE: выбор и аренда задачи не пересекаются с другими процессами
+        connection.execute("BEGIN IMMEDIATE;")
+        try:
+            row = connection.execute(
+                "SELECT id, payload, attempts FROM tasks "
+                "WHERE topic = ? AND available_at <= ? AND leased_until <= ? ORDER BY id LIMIT 1;",
+                (topic, now, now)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE tasks SET leased_until = ? WHERE id = ?;",
+                                   (now + self.lease, row[0]))
+            connection.execute("COMMIT;")
+        except Exception:
+            connection.execute("ROLLBACK;")
+            raise
+        if row is None:
+            return None
+        return Task(row[0], topic, json.loads(row[1]), row[2])
+
+    async def get(self, topic, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            task = await self._execute(self._claim, topic)
+            if task is not None:
+                return task
+            if deadline is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def ack(self, task):
+        await self._execute(
+            lambda connection: connection.execute("DELETE FROM tasks WHERE id = ?;", (task.id,)))
+
+    async def retry(self, task, delay):
+        await self._execute(
+            lambda connection: connection.execute(
+                "UPDATE tasks SET attempts = attempts + 1, available_at = ?, leased_until = 0 "
+                "WHERE id = ?;", (time.time() + delay, task.id)))
+
+    async def size(self, topic):
+        return await self._execute(
+            lambda connection: connection.execute(
+                "SELECT COUNT(*) FROM tasks WHERE topic = ?;", (topic,)).fetchone()[0])
+
+
+# Перенос задач с истёкшей арендой и отложенных задач в очередь и выдача следующей задачи
+# одним атомарным вызовом. KEYS: очередь, аренды, отложенные; ARGV: сейчас, конец аренды.
+REDIS_CLAIM_SCRIPT = """
+for _, message in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])) do
+    redis.call('ZREM', KEYS[2], message)
+    redis.call('RPUSH', KEYS[1], message)
+end
+for _, message in ipairs(redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1])) do
+    redis.call('ZREM', KEYS[3], message)
+    redis.call('LPUSH', KEYS[1], message)
+end
+local message = redis.call('RPOP', KEYS[1])
+if message then
+    redis.call('ZADD', KEYS[2], ARGV[2], message)
+end
+return message
+"""
+
+
+class RedisQueue:
+    """
+    Очередь задач в Redis: роли на разных машинах.
+    Задачи темы - список <prefix>:<тема>; выданная задача лежит в ZSET аренд до подтверждения,
+    по истечении аренды возвращается в начало очереди. Отложенные повторы - в ZSET с временем
+    готовности.
+    """
+
+    def __init__(self, url, lease=900, poll_interval=0.5, prefix="signalbot:tasks"):
+        """
+        :param url: Адрес Redis, например redis://localhost:6379/0.
+        :param lease: Время аренды задачи, секунды (больше самого долгого обработчика).
+        :param poll_interval: Интервал опроса пустой очереди, секунды.
+        :param prefix: Префикс ключей.
+        """
+        self.url = url
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.client = None
+        self._claim = None
+
+    def _keys(self, topic):
+        return [f"{self.prefix}:{topic}", f"{self.prefix}:{topic}:leased",
+                f"{self.prefix}:{topic}:delayed"]
+
+    async def start(self):
+        if self.client is None:
+            import redis.asyncio as redis  # Нужен только для очереди в Redis
+            self.client = redis.from_url(self.url)
+            self._claim = self.client.register_script(REDIS_CLAIM_SCRIPT)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    @staticmethod
+    def _encode(task):
+        return json.dumps({"id": task.id, "payload": task.payload, "attempts": task.attempts},
+                          ensure_ascii=False)
+
+    async def put(self, topic, payload):
+        await self.start()
+        await self.client.lpush(self._keys(topic)[0],
+                                self._encode(Task(uuid.uuid4().hex, topic, payload, 0)))
+
+    async def get(self, topic, timeout=None):
+        await self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.time()
+            message = await self._claim(keys=self._keys(topic), args=[now, now + self.lease])
+            if message is not None:
+                data = json.loads(message)
+                # Исходная строка нужна, чтобы снять аренду
+                return Task((data["id"], message), topic, data["payload"], data["attempts"])
+            if deadline is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+    async def ack(self, task):
+        await self.client.zrem(self._keys(task.topic)[1], task.id[1])
+
+    async def retry(self, task, delay):
+        _, leased, delayed = self._keys(task.topic)
+        retried = Task(task.id[0], task.topic, task.payload, task.attempts + 1)
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(leased, task.id[1])
+            pipe.zadd(delayed, {self._encode(retried): time.time() + delay})
+            await pipe.execute()
+
+    async def size(self, topic):
+        await self.start()
+        queued, leased, delayed = self._keys(topic)
+        return (await self.client.llen(queued) + await self.client.zcard(leased)
+                + await self.client.zcard(delayed))
+
+
+def create_queue(url, lease=900):
+    """
+    Создаёт очередь по адресу:
+    memory:// - в памяти процесса, sqlite:///путь/к/файлу.db - файл SQLite,
+    redis://хост:порт/база - Redis.
+    :param lease: Время аренды задачи для SQLite и Redis, секунды.
+    """
+    if url.startswith("memory://"):
+        return MemoryQueue()
+    if url.startswith("sqlite://"):
+        return SQLiteQueue(url[len("sqlite://"):], lease=lease)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisQueue(url, lease=lease)
+    raise ValueError(f"Неизвестный адрес очереди задач: {url}")
+
+
+async def run_worker(queue, topic, handler, concurrency=1, max_attempts=3, retry_delay=30):
+    """
+    Обрабатывает задачи темы, пока не будет отменена.
+    Задача подтверждается после успешной обработки; при ошибке повторяется через retry_delay
+    секунд, после max_attempts попыток отбрасывается.
+    :param handler: Корутина handler(payload).
+    :param concurrency: Сколько задач темы обрабатывается одновременно.
+    """
+
+    async def loop():
+        while True:
+            task = await queue.get(topic, timeout=5)
+            if task is None:
+                continue
+            try:
+                with metrics.span("task", topic=topic):
+                    await handler(task.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if task.attempts + 1 >= max_attempts:
+                    logging.error(f"Задача {topic} отброшена после {max_attempts} попыток: {e}")
+                    metrics.inc("tasks_total", topic=topic, status="dropped")
+                    await queue.ack(task)
+                else:
+                    logging.warning(f"Ошибка задачи {topic} (попытка {task.attempts + 1}): {e}, "
+                                    f"повтор через {retry_delay} с.")
+                    metrics.inc("tasks_total", topic=topic, status="retried")
+                    await queue.retry(task, retry_delay)
+            else:
+                metrics.inc("tasks_total", topic=topic, status="ok")
+                await queue.ack(task)
+
+    logging.info(f"Воркер {topic} запущен ({concurrency} одновременно).")
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
@@ -1,6 +1,18 @@
 import re
 
 
+def extract_answer_text(answer):
+    """
+    Извлекает из ответа модели текст, заключённый в {}.
+    :return: Найденные фрагменты, объединённые переводом строки, или None.
+    """
+    matches = re.findall(r"\{([^}]+)\}", answer)
+    if not matches:
+        return None
+    # Объединяем все найденные фрагменты в одну строку
+    return "\n".join(matches)
+
+
 def extract_signal_info(text, timeframe, coin_name, RR_name):
     text = text.replace('"', '')
     # Регулярные выражения для извлечения данных
@@ -0,0 +1,106 @@
+import time
+from collections import deque
+from app.position_monitor import is_short
+
+
+class TradingSnapshot:
+    """
+    Состояние сделок в памяти для команд бота: открытые позиции, агрегаты PnL
+    по (таблица, таймфрейм, монета) и последние закрытия.
+    Загружается из базы один раз при запуске, дальше обновляется подписчиком на записи
+    AsyncDatabase (insert_data, update_status_and_pnl, close_positions), поэтому команды
+    в чате не обращаются к базе.
+    """
+
+    def __init__(self, recent_size=20):
+        """
+        :param recent_size: Сколько последних закрытий хранить.
+        """
+        self.open_positions = {}  # {(таблица, id): позиция}
+        self.stats = {}  # {(таблица, таймфрейм, монета): {'trades', 'wins', 'total_pnl'}}
+        self.recent_closes = deque(maxlen=recent_size)
+        self.updated_at = None
+
+    async def load(self, db, table_names):
+        """
+        Загрузка из базы: при запуске и, в режиме воркеров, периодически - позиции закрывает
+        процесс загрузки, а не процесс бота.
+        """
+        self.open_positions = {
+            (position["table"], position["id"]): position
+            for position in await db.get_open_positions(table_names)
+        }
+        self.stats = {
+            (row["table"], row["timeframe"], row["coin_name"]):
+                {"trades": row["trades"], "wins": row["wins"], "total_pnl": row["total_pnl"]}
+            for row in await db.get_stats()
+        }
+        self.recent_closes = deque(
+            await db.get_recent_closes(table_names, self.recent_closes.maxlen),
+            maxlen=self.recent_closes.maxlen)
+        self.updated_at = time.time()
+
+    def on_write(self, method, args, result):
+        """Обработчик успешной записи AsyncDatabase."""
+        if method == "insert_data":
+            table_name, data = args
+            if data.get("status") == 1:
+                self.open_positions[(table_name, result)] = dict(data, id=result, table=table_name)
+        elif method == "close_positions":
+            for table_name, position_id, pnl in args[0]:
+                position = self.open_positions.pop((table_name, position_id), None)
+                if position is not None:
+                    self._add_close(position, pnl)
+        elif method == "update_status_and_pnl":
+            table_name, timeframe, pnl, coin_name = args
+            for key, position in list(self.open_positions.items()):
+                if key[0] == table_name and position["timeframe"] == timeframe \
+                        and position["coin_name"] == coin_name:
+                    del self.open_positions[key]
+                    self._add_close(position, pnl)
+        else:
+            return
+        self.updated_at = time.time()
+
+    def _add_close(self, position, pnl):
+        key = (position["table"], position["timeframe"], position["coin_name"])
+        stats = self.stats.setdefault(key, {"trades": 0, "wins": 0, "total_pnl": 0.0})
+        stats["trades"] += 1
+        stats["wins"] += 1 if pnl > 0 else 0
+        stats["total_pnl"] += pnl
+        self.recent_closes.appendleft(dict(position, pnl=pnl, closed_at=time.time()))
+
+    def positions_text(self):
+        """Текст ответа на /positions."""
+        if not self.open_positions:
+            return "Открытых позиций нет."
+        lines = ["Открытые позиции:"]
+        for (table_name, _), position in sorted(self.open_positions.items(), key=lambda item: str(item[0])):
+            direction = "шорт" if is_short(position["signal"]) else "лонг"
+            lines.append(
+                f"{table_name} #{position['coin_name']} {position['timeframe']}: {direction}, "
+                f"вход {position['open']}, SL {position['SL']}, TP {position['TP']}")
+        return "\n".join(lines)
+
+    def stats_text(self):
+        """Текст ответа на /stats: PnL по стратегиям, монетам и таймфреймам и последние закрытия."""
+        if not self.stats:
+            return "Закрытых сделок пока нет."
+        lines = ["PnL по стратегиям:"]
+        for table_name in sorted({key[0] for key in self.stats}):
+            rows = {key: value for key, value in self.stats.items() if key[0] == table_name}
+            total = sum(value["total_pnl"] for value in rows.values())
+            lines.append(f"\n{table_name}: {round(total, 3)}%")
+            for (_, timeframe, coin_name), value in sorted(rows.items()):
+                win_rate = value["wins"] / value["trades"] * 100 if value["trades"] else 0
+                lines.append(
+                    f"  #{coin_name} {timeframe}: {round(value['total_pnl'], 3)}%, "
+                    f"сделок {value['trades']}, винрейт {win_rate:.0f}%")
+
+        if self.recent_closes:
+            lines.append("\nПоследние закрытия:")
+            for position in list(self.recent_closes)[:10]:
+                lines.append(
+                    f"  {position['table']} #{position['coin_name']} {position['timeframe']}: "
+                    f"{position['pnl']}%")
+        return "\n".join(lines)
@@ -1,15 +1,48 @@
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import os
+import time
 import json
 import asyncio
 import logging
+from app.dom_lookup import ElementLookup
+from app.metrics import metrics
+
+
+CHART_URL = "https://ru.tradingview.com/chart/dBNU59NG/"
+
+# Состояние графика после переключения: выбранная кнопка таймфрейма отмечена (aria-checked или
+# aria-pressed), а заголовок вкладки начинается с тикера символа (например 'BTCUSDT.P 97 000 ▲ ...').
+# Загрузка страницы при переключении в одностраничном приложении не повторяется, поэтому
+# load_state/networkidle об этом ничего не говорит.
+CHART_STATE_SCRIPT = """
+([timeframeButton, symbol]) => {
+    const selected = [...document.querySelectorAll(timeframeButton)].some((el) =>
+        el.offsetParent !== null
+        && (el.getAttribute("aria-checked") === "true" || el.getAttribute("aria-pressed") === "true"));
+    return selected && (!symbol || document.title.includes(symbol));
+}
+"""
+
+# Таймауты шагов выгрузки в миллисекундах
+STEP_TIMEOUTS = {
+    "button": 10000,  # кнопка символа или таймфрейма стала видимой
+    "chart": 10000,  # график переключился на выбранные символ и таймфрейм
+    "menu_button": 10000,  # кнопка 'Управление графиками' стала видимой
+    "menu": 5000,  # открылось меню
+    "dialog": 10000,  # отрисовался диалог экспорта
+    "time_format": 2000,  # выбор формата времени в диалоге (в некоторых вариантах диалога его нет)
+    "download": 120000,  # началась загрузка файла
+}
 
 
 class TradingViewButtonClicker:
-    def __init__(self, user_data_dir, downloads_dir, cookies_file):
+    def __init__(self, user_data_dir, downloads_dir, cookies_file, chart_url=CHART_URL, step_timeouts=None):
         self.user_data_dir = user_data_dir
         self.downloads_dir = downloads_dir
         self.cookies_file = cookies_file
+        self.chart_url = chart_url
+        self.step_timeouts = {**STEP_TIMEOUTS, **(step_timeouts or {})}
+        self.lookup = ElementLookup()  # Кэш селекторов пунктов меню по вкладкам
         os.makedirs(self.downloads_dir, exist_ok=True)
 
         if not os.path.exists(self.cookies_file):
@@ -17,6 +50,8 @@ class TradingViewButtonClicker:
                 f"Файл с куки не найден: {self.cookies_file}")
 
         self.pages = []  # Список для хранения вкладок
+        self.browser = None
+        self.playwright = None
 
     def _load_cookies(self):
         """Загружает и исправляет куки перед их добавлением в Playwright."""
@@ -45,26 +80,42 @@ class TradingViewButtonClicker:
 
     async def open_browser(self):
         """Открывает браузер с нужными параметрами и сохраняет контекст."""
-        self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch_persistent_context(
-            user_data_dir=self.user_data_dir,
-            headless=True,
-            args=["--no-sandbox", "--disable-dev-shm-usage",
-                  "--disable-extensions"],
-            downloads_path=self.downloads_dir
-        )
+        with metrics.span("browser_launch"):
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch_persistent_context(
+                user_data_dir=self.user_data_dir,
+                headless=True,
+                args=["--no-sandbox", "--disable-dev-shm-usage",
+                      "--disable-extensions"],
+                downloads_path=self.downloads_dir
+            )
         logging.info("Браузер успешно открыт.")
 
-    async def open_tabs(self):
-        """Открывает две вкладки с одинаковыми URL и загружает куки в каждую."""
-        cookies = self._load_cookies()
+    async def open_tabs(self, count=9):
+        """Открывает указанное количество вкладок с графиком, куки загружаются в контекст один раз."""
+        await self.browser.add_cookies(self._load_cookies())
 
-        # Открываем две вкладки
-        for _ in range(9):
+        for _ in range(count):
+            self.pages.append(await self.open_tab())
+
+    async def open_tab(self):
+        """Открывает одну вкладку с графиком и возвращает её."""
+        with metrics.span("tab_load"):
             page = await self.browser.new_page()
-            await page.context.add_cookies(cookies)
-            await page.goto("https://ru.tradingview.com/chart/dBNU59NG/", wait_until="domcontentloaded")
-            self.pages.append(page)
+            await page.goto(self.chart_url, wait_until="domcontentloaded")
+        return page
+
+    async def is_page_alive(self, page, timeout=5):
+        """Проверяет, что вкладка не закрыта и отвечает на выполнение скрипта."""
+        if page.is_closed():
+            return False
+        try:
+            ready_state = await asyncio.wait_for(
+                page.evaluate("document.readyState"), timeout)
+        except Exception as e:
+            logging.warning(f"Вкладка не отвечает: {e}")
+            return False
+        return ready_state in ("interactive", "complete")
 
     async def close_browser(self):
         """Закрывает браузер и останавливает Playwright."""
@@ -72,6 +123,9 @@ class TradingViewButtonClicker:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
+        self.pages = []
+        self.browser = None
+        self.playwright = None
 
     async def click_cell_button(self, page):
         """Нажимает на элемент с классами cell-RsFlttSS и flexCell-RsFlttSS в указанной вкладке."""
@@ -89,16 +143,19 @@ class TradingViewButtonClicker:
         logging.error(
             "Элемент cell-RsFlttSS.flexCell-RsFlttSS не удалось нажать после 3 попыток.")
 
-    async def click_button(self, page, button_params):
-        """Нажимает на одну из кнопок '15 минут', если она видима и доступна в указанной вкладке."""
-        await asyncio.sleep(2)
-        button_selector = button_params
-        buttons = await page.query_selector_all(button_selector)
-        for button in buttons:
-            if await button.is_visible() and await button.is_enabled():
-                await asyncio.sleep(2)
-                await button.click()
-                return
+    async def click_button(self, page, button_params, timings=None, step="button"):
+        """
+        Дожидается, пока кнопка станет видимой, и нажимает на неё в указанной вкладке.
+        :param button_params: CSS-селектор кнопки.
+        :param timings: Словарь, в который добавляется время ожидания шага.
+        :param step: Имя шага для таймаута и статистики.
+        """
+        timeout = self.step_timeouts.get(step, self.step_timeouts["button"])
+        button = page.locator(f"{button_params} >> visible=true").first
+        await self._wait_step(timings, step, button.wait_for(
+            state="visible", timeout=timeout))
+        await button.click(timeout=timeout)
+        return button
 
     # async def click_15_min_button(self, page):
     #     """Нажимает на одну из кнопок '15 минут', если она видима и доступна в указанной вкладке."""
@@ -142,117 +199,92 @@ class TradingViewButtonClicker:
     #             return
 
     async def click_download(self, page, file_name):
-        """Нажимает на одну из кнопок для загрузки, затем на несколько спанов с текстами 'Экспорт данных графика…' и других в указанной вкладке."""
+        """
+        Выгружает данные графика: открывает меню 'Управление графиками', диалог 'Экспорт данных графика…',
+        выбирает формат времени и сохраняет файл. Каждый шаг ждёт своего условия готовности, а не фиксированную паузу.
+        :return: Словарь {шаг: секунды ожидания}.
+        """
         button_selector = "button[data-tooltip='Управление графиками'][aria-label='Управление графиками'][aria-haspopup='menu']"
-        span_selector = "span"
-        buttons = await page.query_selector_all(button_selector)
-
-        for button in buttons:
-            if await button.is_visible() and await button.is_enabled():
-                await button.click()
-
-                spans = await page.query_selector_all(span_selector)
-                for span in spans:
-                    if "Экспорт данных графика…" in await span.inner_text():
-                        if await span.is_visible() and await span.is_enabled():
-                            await span.click()
-                            await asyncio.sleep(2)
-                            break
-
-                spans = await page.query_selector_all(span_selector)
-                for span in spans:
-                    if "Временной шаг UNIX" in await span.inner_text():
-                        if await span.is_visible() and await span.is_enabled():
-                            await span.click()
-                            await asyncio.sleep(2)
-                            break
-
-                spans = await page.query_selector_all(span_selector)
-                for span in spans:
-                    if "Время в формате ISO" in await span.inner_text():
-                        if await span.is_visible() and await span.is_enabled():
-                            await span.click()
-                            await asyncio.sleep(2)
-                            break
-
-                spans = await page.query_selector_all(span_selector)
-                for span in spans:
-                    if "Экспорт" in await span.inner_text():
-                        await asyncio.sleep(1)
-                        if await span.is_visible() and await span.is_enabled():
-                            try:
-                                async with page.expect_download(timeout=120000) as download_info:
-                                    await span.click()  # Клик по элементу, который инициирует скачивание
-
-                                download = await download_info.value
-                                await download.save_as(os.path.join(self.downloads_dir, file_name))
-                                logging.info(
-                                    f"Файл был загружен и сохранен как '{file_name}'")
-                            except Exception as e:
-                                logging.error(
-                                    f"Ошибка при загрузке файла: {e}")
-                            break
-
-    async def perform_actions_in_tab_15_min(self, tab_index):
-        """Выполняет действия в выбранной вкладке по индексу."""
-        if tab_index == 0:
-            page = self.pages[tab_index]
-            await self.click_button(page, "button[aria-label='15 минут'][role='radio']")
-            await self.click_download(page, 'M15_BTC.csv')
-        elif tab_index == 1:
-            page = self.pages[tab_index]
-            await self.click_button(page, "button[aria-label='1 час'][role='radio']")
-            await self.click_download(page, 'H1_BTC.csv')
-        elif tab_index == 2:
-            page = self.pages[tab_index]
-            await self.click_button(page, "button[data-tooltip='4 часа']")
-            await self.click_download(page, 'H4_BTC.csv')
-        elif tab_index == 3:
-            page = self.pages[tab_index]
-            await self.click_button(page, "div[data-symbol-short='ETHUSDT.P']")
-            await self.click_button(page, "button[aria-label='15 минут'][role='radio']")
-            await self.click_download(page, 'M15_ETH.csv')
-        elif tab_index == 4:
-            page = self.pages[tab_index]
-            await self.click_button(page, "div[data-symbol-short='ETHUSDT.P']")
-            await self.click_button(page, "button[aria-label='1 час'][role='radio']")
-            await self.click_download(page, 'H1_ETH.csv')
-        elif tab_index == 5:
-            page = self.pages[tab_index]
-            await self.click_button(page, "div[data-symbol-short='ETHUSDT.P']")
-            await self.click_button(page, "button[data-tooltip='4 часа']")
-            await self.click_download(page, 'H4_ETH.csv')
-        elif tab_index == 6:
-            page = self.pages[tab_index]
-            await self.click_button(page, "div[data-symbol-short='SOLUSDT.P']")
-            await self.click_button(page, "button[aria-label='15 минут'][role='radio']")
-            await self.click_download(page, 'M15_SOL.csv')
-        elif tab_index == 7:
-            page = self.pages[tab_index]
-            await self.click_button(page, "div[data-symbol-short='SOLUSDT.P']")
-            await self.click_button(page, "button[aria-label='1 час'][role='radio']")
-            await self.click_download(page, 'H1_SOL.csv')
-        elif tab_index == 8:
-            page = self.pages[tab_index]
-            await self.click_button(page, "div[data-symbol-short='SOLUSDT.P']")
-            await self.click_button(page, "button[data-tooltip='4 часа']")
-            await self.click_download(page, 'H4_SOL.csv')
-        else:
-            logging.error(f"Вкладка с индексом {tab_index} не существует.")
-
-    async def perform_actions_in_tab_1_hour(self, tab_index):
-        """Выполняет действия в выбранной вкладке по индексу."""
-        if tab_index == 0:
-            page = self.pages[tab_index]
-            await self.click_1_hour_button(page)
-            await self.click_download(page, 'H1.csv')
-        elif tab_index == 1:
-            page = self.pages[tab_index]
-            await self.click_4_hour_button(page)
-            await self.click_download(page, 'H4.csv')
-        elif tab_index == 2:
-            page = self.pages[tab_index]
-            await self.click_1_day_button(page)
-            await self.click_download(page, 'D1.csv')
-        else:
-            logging.error(f"Вкладка с индексом {tab_index} не существует.")
+        timings = {}
+        try:
+            await self.click_button(page, button_selector, timings, "menu_button")
+
+            # Меню открылось
+            await self._click_text(page, "Экспорт данных графика…", timings, "menu")
+            # Диалог экспорта отрисовался
+            export_button = await self._wait_step(timings, "dialog", self.lookup.find_by_text(
+                page, "Экспорт", exact=True, timeout=self.step_timeouts["dialog"]))
+            # Формат времени выбирается, если диалог его предлагает: разбор понимает оба формата
+            await self._click_optional_text(page, "Временной шаг UNIX", timings, "time_format")
+            await self._click_optional_text(page, "Время в формате ISO", timings, "time_format")
+
+            # Загрузка началась
+            async with page.expect_download(timeout=self.step_timeouts["download"]) as download_info:
+                await export_button.click(timeout=self.step_timeouts["dialog"])
+            download = await self._wait_step(timings, "download", download_info.value)
+
+            await self._wait_step(timings, "save", download.save_as(
+                os.path.join(self.downloads_dir, file_name)))
+        except Exception:
+            # Закрываем меню или диалог, чтобы вкладку можно было переиспользовать
+            await page.keyboard.press("Escape")
+            raise
+
+        logging.info(
+            f"Файл был загружен и сохранен как '{file_name}' ("
+            + ", ".join(f"{step} {seconds:.2f} с" for step, seconds in timings.items()) + ")")
+        return timings
+
+    async def _click_text(self, page, text, timings, step):
+        """Дожидается видимого span с указанным текстом и нажимает на него."""
+        span = await self._wait_step(timings, step, self.lookup.find_by_text(
+            page, text, timeout=self.step_timeouts[step]))
+        await span.click(timeout=self.step_timeouts[step])
+
+    async def _click_optional_text(self, page, text, timings, step):
+        """
+        Как _click_text, но отсутствие элемента не считается ошибкой.
+        :return: True, если элемент найден и нажат.
+        """
+        try:
+            await self._click_text(page, text, timings, step)
+            return True
+        except (TimeoutError, PlaywrightTimeoutError):
+            logging.info(f"'{text}' нет в диалоге, пропускаем.")
+            return False
+
+    async def _wait_step(self, timings, step, awaitable):
+        """Ожидает условие готовности шага и добавляет время ожидания в timings."""
+        started = time.monotonic()
+        try:
+            return await awaitable
+        except PlaywrightTimeoutError as e:
+            raise TimeoutError(f"Шаг '{step}' не дождался готовности страницы: {e}") from e
+        finally:
+            if timings is not None:
+                timings[step] = timings.get(step, 0) + time.monotonic() - started
+
+    async def _wait_chart_settled(self, page, task, symbol, timings):
+        """
+        Ждёт, пока график переключится на символ и таймфрейм задачи, иначе выгрузка сохранила бы
+        предыдущий ряд под именем файла задачи.
+        :param symbol: Тикер символа (data-symbol-short) или None, если символ не переключался.
+        """
+        await self._wait_step(timings, "chart", page.wait_for_function(
+            CHART_STATE_SCRIPT, arg=[task.timeframe_button, symbol], timeout=self.step_timeouts["chart"]))
+
+    async def export_task(self, page, task):
+        """
+        Выполняет одну выгрузку из плана в указанной вкладке.
+        :param page: Вкладка браузера.
+        :param task: ExportTask с селектором символа, кнопкой таймфрейма и именем файла.
+        """
+        timings = {}
+        symbol = None
+        if task.symbol_selector:
+            symbol_button = await self.click_button(page, task.symbol_selector, timings, "button")
+            symbol = await symbol_button.get_attribute("data-symbol-short")
+        await self.click_button(page, task.timeframe_button, timings, "button")
+        await self._wait_chart_settled(page, task, symbol, timings)
+        timings.update(await self.click_download(page, task.file_name))
+        return timings
@@ -0,0 +1,38 @@
+"""
+Бенчмарк чтения хвоста выгрузки: чтение с конца файла против readlines() всего файла.
+
+Запуск:
+    python -m benchmarks.bench_csv_tail
+"""
+import os
+import tempfile
+from pathlib import Path
+from app.csv_utils import read_tail_lines, get_last_high_low
+from benchmarks.synthetic import write_tradingview_export
+from benchmarks.timing import measure
+
+
+def read_tail_readlines(file_path, max_row):
+    """Прежний способ: читаем весь файл и берём последние строки."""
+    with open(file_path, mode="r", encoding="utf-8") as file:
+        first_line = file.readline()
+        lines = file.readlines()
+    return first_line, lines[-max_row:]
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'строк':>9} {'МБ':>7} {'readlines, мс':>14} {'с конца, мс':>12} {'last bar, мс':>13}")
+        for rows in (1_000, 10_000, 100_000, 300_000):
+            file_path = Path(tmp_dir) / f"M15_{rows}.csv"
+            write_tradingview_export(file_path, rows)
+            size_mb = os.path.getsize(file_path) / 2 ** 20
+
+            slow = measure(read_tail_readlines, file_path, 200, repeat=20)
+            fast = measure(read_tail_lines, file_path, 200, repeat=20)
+            last_bar = measure(get_last_high_low, file_path.name, Path(tmp_dir), repeat=20)
+            print(f"{rows:>9} {size_mb:>7.1f} {slow:>14.2f} {fast:>12.3f} {last_bar:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Бенчмарк расчёта индикаторов: векторный EMA против цикла по свечам
+и полный пересчёт FeatureEngine против инкрементального обновления на новый тик
+по всем рядам тика (монеты × таймфреймы).
+
+Запуск:
+    python -m benchmarks.bench_features
+    python -m benchmarks.bench_features --coins BTC,ETH,SOL,XRP --timeframes M15,H1,H4,D1
+"""
+import argparse
+import tempfile
+import numpy as np
+from app.candles import CandleFrame, TIMEFRAME_SECONDS
+from app.candle_store import CandleStore
+from app.features import FeatureEngine, ema
+from benchmarks.synthetic import generate_candles
+from benchmarks.timing import measure
+
+
+def ema_loop(values, alpha):
+    """Прежний способ: рекуррентный расчёт в цикле Python."""
+    result = np.empty_like(values)
+    prev = values[0]
+    for index, value in enumerate(values):
+        prev = alpha * value + (1 - alpha) * prev
+        result[index] = prev
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк EMA и FeatureEngine.")
+    parser.add_argument("--coins", default="BTC,ETH,SOL",
+                        help="Монеты через запятую (EXPORT_COINS из config.py).")
+    parser.add_argument("--timeframes", default="M15,H1,H4",
+                        help="Таймфреймы через запятую (EXPORT_TIMEFRAMES_15_MIN из config.py).")
+    parser.add_argument("--rows", type=int, default=50_000, help="Свечей в каждом ряду.")
+    args = parser.parse_args()
+
+    print(f"{'свечей':>9} {'EMA цикл, мс':>13} {'EMA вектор, мс':>15} {'расхождение':>12}")
+    for rows in (1_000, 10_000, 100_000, 1_000_000):
+        close = generate_candles(rows)["close"]
+        slow = measure(ema_loop, close, 2 / 51, repeat=1 if rows > 100_000 else 5)
+        fast = measure(ema, close, 2 / 51)
+        error = np.max(np.abs(ema(close, 2 / 51) - ema_loop(close, 2 / 51)) / close)
+        print(f"{rows:>9} {slow:>13.2f} {fast:>15.2f} {error:>12.1e}")
+
+    # Тик считает признаки для всех монет и таймфреймов плана выгрузки, а не для одного ряда
+    series = [(coin, timeframe) for coin in args.coins.split(",")
+              for timeframe in args.timeframes.split(",")]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = CandleStore(tmp_dir)
+        rows = args.rows
+        next_bars = {}
+        for seed, (coin, timeframe) in enumerate(series):
+            candles = generate_candles(
+                rows + 1, step_seconds=TIMEFRAME_SECONDS[timeframe], seed=seed)
+            store.ingest(CandleFrame({name: values[:rows] for name, values in candles.items()}),
+                         coin, timeframe)
+            next_bars[(coin, timeframe)] = CandleFrame(
+                {name: values[-2:] for name, values in candles.items()})
+
+        def full():
+            engine = FeatureEngine(store)
+            for coin, timeframe in series:
+                engine.compute(coin, timeframe)
+
+        engine = FeatureEngine(store)
+        for coin, timeframe in series:
+            engine.compute(coin, timeframe)
+        for (coin, timeframe), frame in next_bars.items():
+            store.ingest(frame, coin, timeframe)
+
+        def incremental():
+            for coin, timeframe in series:
+                engine.compute(coin, timeframe)
+
+        full_ms, incremental_ms = measure(full), measure(incremental)
+        print(f"\nFeatureEngine, {len(series)} рядов ({args.coins} × {args.timeframes}) "
+              f"по {rows} свечей:")
+        print(f"  полный пересчёт: {full_ms:.2f} мс на тик ({full_ms / len(series):.2f} мс на ряд)")
+        print(f"  новый тик от сохранённого состояния: {incremental_ms:.2f} мс на тик "
+              f"({incremental_ms / len(series):.2f} мс на ряд)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Сквозной бенчмарк выгрузки тика на локальной странице tools/fake_tradingview.py.
+Настоящий TradingViewButtonClicker (open_browser, open_tabs, export_task с click_download)
+выполняет план выгрузки при разном числе вкладок: видно время запуска браузера, открытия
+вкладок, первого цикла (селекторы ещё не в кэше) и следующих циклов, и как время тика
+масштабируется с числом вкладок. Задержки страницы фиксированы, поэтому прогоны повторяемы.
+
+Нужен установленный Chromium для Playwright (python -m playwright install chromium).
+
+Запуск:
+    python -m benchmarks.bench_tick_e2e --tabs 1,3,9 --cycles 3
+    python -m benchmarks.bench_tick_e2e --tabs 9 --dialog-delay 1500 --json tick.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from aiohttp import web
+from app.candles import CandleFrame
+from app.export_plan import build_export_plan, run_export_plan
+from app.tradingview import TradingViewButtonClicker
+from tools.fake_tradingview import (
+    create_app, add_delay_arguments, delays_from_args, symbol_selector, TIMEFRAME_BUTTONS)
+
+
+async def start_server(app):
+    """Запускает страницу на свободном порту localhost и возвращает (runner, url)."""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/chart/"
+
+
+def check_downloads(downloads_dir, plan, started):
+    """Число файлов плана, которые выгружены в этом цикле и читаются как свечи."""
+    valid = 0
+    for task in plan:
+        file_path = os.path.join(downloads_dir, task.file_name)
+        if not os.path.exists(file_path) or os.path.getmtime(file_path) < started:
+            continue
+        try:
+            if len(CandleFrame.from_csv(file_path)):
+                valid += 1
+        except Exception as e:
+            logging.error(f"Выгрузка {task.file_name} не читается: {e}")
+    return valid
+
+
+async def run_tabs(url, tabs, coins, timeframes, cycles, work_dir):
+    """Один прогон: запуск браузера, открытие вкладок и cycles циклов выгрузки."""
+    downloads_dir = os.path.join(work_dir, f"downloads_{tabs}")
+    cookies_file = os.path.join(work_dir, "cookies.json")
+    with open(cookies_file, "w") as f:
+        json.dump([], f)
+
+    clicker = TradingViewButtonClicker(
+        os.path.join(work_dir, f"profile_{tabs}"), downloads_dir, cookies_file, chart_url=url)
+    plan = build_export_plan(coins, timeframes, {coin: symbol_selector(coin) for coin in coins},
+                             TIMEFRAME_BUTTONS)
+    result = {"tabs": tabs, "files": len(plan), "cycles": []}
+    try:
+        started = time.perf_counter()
+        await clicker.open_browser()
+        result["browser_launch"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await clicker.open_tabs(tabs)
+        result["open_tabs"] = time.perf_counter() - started
+
+        for _ in range(cycles):
+            cycle_started = time.time()
+            started = time.perf_counter()
+            await run_export_plan(clicker, plan)
+            elapsed = time.perf_counter() - started
+            result["cycles"].append({
+                "seconds": elapsed,
+                "valid_files": check_downloads(downloads_dir, plan, cycle_started),
+            })
+    finally:
+        await clicker.close_browser()
+    result["lookup"] = dict(clicker.lookup.stats)
+    return result
+
+
+def print_results(results):
+    print(f"{'вкладок':>7} {'файлов':>6} {'браузер, с':>10} {'вкладки, с':>10} "
+          f"{'1-й цикл, с':>11} {'следующие, с':>12} {'с/файл':>7} {'ок':>5}")
+    for result in results:
+        cycles = result["cycles"]
+        first = cycles[0]["seconds"]
+        rest = [cycle["seconds"] for cycle in cycles[1:]]
+        steady = min(rest) if rest else first
+        valid = min(cycle["valid_files"] for cycle in cycles)
+        print(f"{result['tabs']:>7} {result['files']:>6} {result['browser_launch']:>10.2f} "
+              f"{result['open_tabs']:>10.2f} {first:>11.2f} {steady:>12.2f} "
+              f"{steady / result['files']:>7.2f} {valid:>2}/{result['files']:<2}")
+
+
+async def main_async(args):
+    coins = args.coins.split(",")
+    timeframes = args.timeframes.split(",")
+    runner, url = await start_server(
+        create_app(coins, args.rows, delays_from_args(args), args.jitter))
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            for tabs in [int(value) for value in args.tabs.split(",")]:
+                results.append(await run_tabs(url, tabs, coins, timeframes, args.cycles, work_dir))
+                print(f"{tabs} вкладок готово.", file=sys.stderr)
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк выгрузки на локальной странице.")
+    parser.add_argument("--tabs", default="1,3,9", help="Числа вкладок через запятую.")
+    parser.add_argument("--cycles", type=int, default=3, help="Циклов выгрузки на каждое число вкладок.")
+    parser.add_argument("--coins", default="BTC,ETH,SOL")
+    parser.add_argument("--timeframes", default="M15,H1,H4")
+    parser.add_argument("--rows", type=int, default=500, help="Свечей в выгрузке.")
+    parser.add_argument("--json", help="Файл для записи результатов.")
+    parser.add_argument("--verbose", action="store_true", help="Логи кликера и плана выгрузки.")
+    add_delay_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s - %(levelname)s - %(message)s")
+    results = asyncio.run(main_async(args))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"delays": delays_from_args(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Набор бенчмарков горячих путей: csv_utils (csvs_to_text, get_last_high_low),
+text_utils (разбор ответов модели) и DatabaseManager (вставка с коммитом на каждый вызов
+и одной транзакцией, поиск открытой позиции, закрытие, агрегаты) на таблицах с 10^5+ сделок.
+
+Результаты записываются в JSON. С --baseline результаты сравниваются с сохранённым прогоном
+на той же машине: бенчмарк, который стал медленнее больше чем на --threshold, считается
+регрессией, и скрипт завершается с кодом 1.
+
+Запуск:
+    python -m benchmarks.suite --json baseline.json
+    python -m benchmarks.suite --baseline baseline.json --json current.json
+    python -m benchmarks.suite --quick  # до 100 000 строк и 20 000 сделок
+
+Для DatabaseManager нужен db_config.py с таблицей RR3, как для самого бота.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from app.csv_utils import csvs_to_text, get_last_high_low, context_cache
+from app.text_utils import extract_answer_text, extract_signal_info
+from benchmarks.synthetic import write_tradingview_export
+from benchmarks.timing import measure
+
+
+SIZES = (1_000, 10_000, 100_000, 1_000_000)
+QUICK_SIZES = (1_000, 10_000, 100_000)
+TIMEFRAMES = ("M15", "H1", "H4")
+COINS = ("BTC", "ETH", "SOL")
+
+
+def prepare_exports(data_dir, rows):
+    """
+    Выгрузки M15/H1/H4 одного размера в отдельной директории.
+    Уже созданные файлы переиспользуются: генерация 1 000 000 строк занимает десятки секунд.
+    """
+    directory = Path(data_dir) / str(rows)
+    directory.mkdir(parents=True, exist_ok=True)
+    source = directory / "M15_BTC.csv"
+    if not source.exists():
+        write_tradingview_export(source, rows)
+    for timeframe in TIMEFRAMES[1:]:
+        target = directory / f"{timeframe}_BTC.csv"
+        if not target.exists():
+            shutil.copyfile(source, target)
+    return directory, [f"{timeframe}_BTC.csv" for timeframe in TIMEFRAMES]
+
+
+def bench_csv(results, data_dir, sizes, max_row):
+    for rows in sizes:
+        directory, file_names = prepare_exports(data_dir, rows)
+        for compact in (False, True):
+            mode = "compact" if compact else "raw"
+            # Холодный: кэш текстовых блоков пуст, как при первом запросе тика
+            results[f"csvs_to_text/{mode}/cold/{rows}"] = {"ms": measure(
+                lambda: csvs_to_text(file_names, directory, max_row, compact=compact),
+                setup=context_cache.clear)}
+            # Тёплый: те же файлы в том же тике
+            csvs_to_text(file_names, directory, max_row, compact=compact)
+            results[f"csvs_to_text/{mode}/warm/{rows}"] = {"ms": measure(
+                lambda: csvs_to_text(file_names, directory, max_row, compact=compact), repeat=20)}
+        results[f"get_last_high_low/{rows}"] = {"ms": measure(
+            lambda: get_last_high_low(file_names[0], directory), repeat=20)}
+        print(f"csv_utils: {rows} строк готово.", file=sys.stderr)
+
+
+def generate_answers(count, seed=0):
+    """Ответы модели разной длины: сигналы лонг/шорт, пропуски сделки и ответы без {}."""
+    rng = random.Random(seed)
+    answers = []
+    for index in range(count):
+        price = rng.uniform(10, 100000)
+        reasoning = " ".join(rng.choice(["Цена", "EMA", "уровень", "объём", "пробой", "RSI", "ретест"])
+                             for _ in range(rng.randint(20, 400)))
+        kind = index % 10
+        if kind == 9:
+            answers.append(f"Данных недостаточно для сигнала. {reasoning}")
+            continue
+        signal = "нет сделки" if kind == 8 else rng.choice(["лонг", "шорт"])
+        answers.append(
+            f"Анализ рынка:\n{reasoning}\n\n{{\"Сигнал: {signal}\n"
+            f"Вход: {price:.2f}\nSL: {price * 0.99:.2f}\nTP: {price * 1.03:.2f}\n"
+            f"Обоснование: {reasoning[:500]}\"}}")
+    return answers
+
+
+def bench_text(results, answers_count):
+    answers = generate_answers(answers_count)
+
+    def parse_all():
+        for answer in answers:
+            text = extract_answer_text(answer)
+            if text:
+                extract_signal_info(text, "M15", "BTC", "3")
+
+    ms = measure(parse_all, repeat=3)
+    results[f"extract_signal_info/{answers_count}"] = {"ms": ms, "per_op_us": ms * 1000 / answers_count}
+    print("text_utils готово.", file=sys.stderr)
+
+
+def bench_db(results, trades, lookups=2000, per_call=10_000):
+    """
+    :param per_call: Сколько строк вставляется с коммитом на каждый вызов (не больше trades).
+    """
+    from db_config import TABLES
+    from app.db.database_manager import DatabaseManager
+
+    rng = random.Random(0)
+    table_name = "RR3"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        manager = DatabaseManager(db_path)
+        manager.connect()
+        manager.create_table(table_name, TABLES[table_name])
+
+        rows = [{
+            "timeframe": rng.choice(TIMEFRAMES), "coin_name": rng.choice(COINS),
+            "signal": rng.choice(["лонг", "шорт"]), "open": 100.0, "SL": 99.0, "TP": 103.0,
+            "status": 1, "pnl": 0, "opened_at": 1_700_000_000 + index * 900,
+        } for index in range(trades)]
+
+        # Как в боте: каждый вызов insert_data - отдельный коммит. Отдельная база, чтобы
+        # таблица для остальных замеров была того же размера
+        per_call_rows = rows[:per_call]
+        per_call_manager = DatabaseManager(os.path.join(tmp_dir, "per_call.db"))
+        per_call_manager.connect()
+        per_call_manager.create_table(table_name, TABLES[table_name])
+        started = time.perf_counter()
+        for row in per_call_rows:
+            per_call_manager.insert_data(table_name, row)
+        ms = (time.perf_counter() - started) * 1000
+        results[f"db/insert/per_call/{len(per_call_rows)}"] = {
+            "ms": ms, "per_op_us": ms * 1000 / len(per_call_rows)}
+        per_call_manager.close()
+
+        # Все вставки одной транзакцией - нижняя граница для пакетной записи
+        started = time.perf_counter()
+        with manager.transaction():
+            ids = [manager.insert_data(table_name, row) for row in rows]
+        ms = (time.perf_counter() - started) * 1000
+        results[f"db/insert/batched/{trades}"] = {"ms": ms, "per_op_us": ms * 1000 / trades}
+
+        # Почти все сделки закрыты, открыта одна на пару - как в рабочей базе
+        last_by_pair = {}
+        for index, row in enumerate(rows):
+            last_by_pair[(row["timeframe"], row["coin_name"])] = index
+        open_ids = set(last_by_pair.values())
+        closes = [(table_name, ids[index], rng.uniform(-1, 3))
+                  for index in range(len(ids)) if index not in open_ids]
+        started = time.perf_counter()
+        manager.close_positions(closes)
+        ms = (time.perf_counter() - started) * 1000
+        results[f"db/close_positions/{trades}"] = {"ms": ms, "per_op_us": ms * 1000 / len(closes)}
+
+        pairs = [(rng.choice(TIMEFRAMES), rng.choice(COINS)) for _ in range(lookups)]
+
+        def lookup_all():
+            for timeframe, coin_name in pairs:
+                manager.has_status_zero(table_name, timeframe, coin_name)
+
+        ms = measure(lookup_all)
+        results[f"db/has_status_zero/{trades}"] = {"ms": ms, "per_op_us": ms * 1000 / lookups}
+        results[f"db/get_open_positions/{trades}"] = {"ms": measure(
+            lambda: manager.get_open_positions([table_name]), repeat=20)}
+        results[f"db/get_total_pnl/{trades}"] = {"ms": measure(
+            lambda: manager.get_total_pnl(table_name), repeat=20)}
+        results[f"db/get_stats/{trades}"] = {"ms": measure(lambda: manager.get_stats(), repeat=20)}
+
+        # Пересчёт агрегатов по всей истории - при первом запуске на старой базе
+        def drop_stats():
+            with manager.transaction():
+                manager.cursor.execute(f"DELETE FROM {manager.STATS_TABLE};")
+
+        results[f"db/stats_rebuild/{trades}"] = {"ms": measure(
+            lambda: manager.create_table(table_name, TABLES[table_name]), repeat=3, setup=drop_stats)}
+        manager.close()
+    print("DatabaseManager готово.", file=sys.stderr)
+
+
+def compare(results, baseline, threshold):
+    """
+    Сравнивает результаты с базовыми.
+    :return: Список имён бенчмарков, замедлившихся больше чем на threshold.
+    """
+    regressions = []
+    print(f"{'бенчмарк':<44} {'база, мс':>11} {'сейчас, мс':>11} {'изменение':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<44} {'-':>11} {result['ms']:>11.3f} {'новый':>10}")
+            continue
+        change = result["ms"] / base["ms"] - 1 if base["ms"] else 0.0
+        mark = ""
+        if change > threshold:
+            regressions.append(name)
+            mark = "  РЕГРЕССИЯ"
+        print(f"{name:<44} {base['ms']:>11.3f} {result['ms']:>11.3f} {change * 100:>+9.1f}%{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки csv_utils, text_utils и DatabaseManager.")
+    parser.add_argument("--quick", action="store_true", help="Меньшие размеры для быстрой проверки.")
+    parser.add_argument("--sizes", help="Размеры выгрузок через запятую, например 1000,100000.")
+    parser.add_argument("--max-row", type=int, default=200, help="Строк на файл в csvs_to_text.")
+    parser.add_argument("--answers", type=int, default=None, help="Число ответов модели для разбора.")
+    parser.add_argument("--trades", type=int, default=None, help="Число сделок в таблице.")
+    parser.add_argument("--only", choices=["csv", "text", "db"], action="append",
+                        help="Запустить только указанные группы.")
+    parser.add_argument("--data-dir", help="Директория для синтетических выгрузок (переиспользуется).")
+    parser.add_argument("--json", help="Файл для записи результатов.")
+    parser.add_argument("--baseline", help="Файл с результатами для сравнения.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Допустимое замедление относительно базы (0.2 = 20%%).")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else (
+        QUICK_SIZES if args.quick else SIZES)
+    answers = args.answers or (2_000 if args.quick else 20_000)
+    trades = args.trades or (20_000 if args.quick else 100_000)
+    groups = args.only or ["csv", "text", "db"]
+
+    results = {}
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench_exports_")
+    try:
+        if "csv" in groups:
+            bench_csv(results, data_dir, sizes, args.max_row)
+        if "text" in groups:
+            bench_text(results, answers)
+        if "db" in groups:
+            bench_db(results, trades)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Регрессии: {', '.join(regressions)}")
+            sys.exit(1)
+    else:
+        for name, result in results.items():
+            extra = f" ({result['per_op_us']:.2f} мкс/оп)" if "per_op_us" in result else ""
+            print(f"{name:<44} {result['ms']:>11.3f} мс{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Генерация синтетических выгрузок в формате TradingView для бенчмарков."""
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+
+# Колонки, которые TradingView добавляет к OHLCV при включённых индикаторах
+INDICATOR_COLUMNS = ["Volume MA", "EMA", "RSI", "RSI-based MA", "Upper Bollinger Band",
+                     "Basis", "Lower Bollinger Band", "MACD", "Signal", "Histogram"]
+
+
+def generate_candles(rows, step_seconds=900, start_price=60000.0, seed=0):
+    """
+    Генерирует случайное блуждание цены.
+    :return: Словарь колонок {'time', 'open', 'high', 'low', 'close', 'Volume'} с массивами NumPy.
+    """
+    rng = np.random.default_rng(seed)
+    start = int(datetime(2020, 1, 1, tzinfo=timezone.utc).timestamp())
+    close = start_price * np.exp(np.cumsum(rng.normal(0, 0.002, rows)))
+    open_ = np.concatenate(([start_price], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.001, rows)) * close
+    return {
+        "time": start + np.arange(rows, dtype=np.int64) * step_seconds,
+        "open": open_,
+        "high": np.maximum(open_, close) + spread,
+        "low": np.minimum(open_, close) - spread,
+        "close": close,
+        "Volume": rng.uniform(10, 5000, rows),
+    }
+
+
+def tradingview_export_lines(rows, step_seconds=900, indicators=True, seed=0, iso_time=True, end=None):
+    """
+    Строки выгрузки 'Экспорт данных графика…', начиная с заголовка.
+    :param rows: Число свечей.
+    :param indicators: Добавлять ли колонки индикаторов.
+    :param iso_time: Время в формате ISO (по МСК), иначе 'Временной шаг UNIX'.
+    :param end: Время открытия последней свечи (unix), по умолчанию свечи начинаются с 2020-01-01.
+    """
+    candles = generate_candles(rows, step_seconds, seed=seed)
+    if end is not None:
+        candles["time"] += end - candles["time"][-1]
+    rng = np.random.default_rng(seed + 1)
+    moscow = timezone(timedelta(hours=3))
+    header = ["time", "open", "high", "low", "close", "Volume"]
+    if indicators:
+        header += INDICATOR_COLUMNS
+
+    yield ",".join(header) + "\n"
+    for index in range(rows):
+        timestamp = int(candles["time"][index])
+        time = datetime.fromtimestamp(timestamp, moscow).isoformat() if iso_time else str(timestamp)
+        values = [repr(float(candles[name][index])) for name in header[1:6]]
+        if indicators:
+            values += [repr(float(value)) for value in rng.normal(100, 10, len(INDICATOR_COLUMNS))]
+        yield time + "," + ",".join(values) + "\n"
+
+
+def write_tradingview_export(file_path, rows, step_seconds=900, indicators=True, seed=0):
+    """
+    Записывает выгрузку 'Экспорт данных графика…' со временем в формате ISO.
+    :param file_path: Путь к файлу.
+    :param rows: Число свечей.
+    :param indicators: Добавлять ли колонки индикаторов.
+    """
+    with open(file_path, mode="w", encoding="utf-8") as file:
+        file.writelines(tradingview_export_lines(rows, step_seconds, indicators, seed))
+    return file_path
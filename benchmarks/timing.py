@@ -0,0 +1,17 @@
+"""Общий замер времени для бенчмарков."""
+import time
+
+
+def measure(function, *args, repeat=5, setup=None):
+    """
+    Возвращает лучшее из repeat время выполнения function(*args) в миллисекундах.
+    :param setup: Функция, которая вызывается перед каждым замером и не входит в него.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
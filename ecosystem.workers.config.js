@@ -0,0 +1,42 @@
+// Режим воркеров: бот с планировщиком и воркеры ролей в отдельных процессах.
+// Все процессы используют одну очередь задач (QUEUE_URL), базу (DB_PATH) и хранилище свечей
+// (CANDLE_STORE_DIR); для воркеров на других машинах - очередь в Redis и общее хранилище.
+// Запуск вместо ecosystem.config.js: pm2 start ecosystem.workers.config.js
+const QUEUE_URL = "sqlite:///root/scripts/AI-Signal-Bot/data/tasks.db";
+
+function worker(name, role, metricsPort, extra) {
+    return {
+        name: name,
+        script: "./main.py",
+        args: role,
+        interpreter: "./.venv/bin/python3",
+        cwd: "/root/scripts/AI-Signal-Bot",
+        watch: false,
+        error_file: `/root/.pm2/logs/${name}-error.log`,
+        out_file: `/root/.pm2/logs/${name}-out.log`,
+        exec_mode: "fork",
+        env: {
+            NODE_ENV: "production",
+            QUEUE_URL: QUEUE_URL,
+            METRICS_PORT: metricsPort,
+        },
+        log_date_format: "YYYY-MM-DD HH:mm:ss",
+        max_size: "10M",
+        merge_logs: true,
+        autorestart: true,
+        ...extra,
+    };
+}
+
+module.exports = {
+    apps: [
+        // Telegram и планировщик: публикует задачи download
+        worker("AI-Signal-Bot", "bot", 9108, {autorestart: false}),
+        // Браузер или HTTP-источник: загрузка свечей, закрытие позиций, задачи analyze
+        worker("AI-Signal-Bot-download", "download", 9109),
+        // Запросы к модели: масштабируется числом экземпляров (METRICS_PORT только у первого)
+        worker("AI-Signal-Bot-analyze", "analyze", 9110, {instances: 2}),
+        // Отправка в Telegram: один экземпляр, чтобы соблюдались лимиты на чат
+        worker("AI-Signal-Bot-notify", "notify", 9111),
+    ],
+};
@@ -1,20 +1,33 @@
 import asyncio
+import argparse
+import time
 from aiogram import Bot, Dispatcher
-from datetime import datetime, timedelta
+from datetime import datetime
 import pytz  # Для работы с временными зонами
-from app.tradingview import TradingViewButtonClicker
+from app.browser_pool import BrowserPool, children_rss_mb, process_rss_mb
+from app.data_sources.base import CandleRequest
+from app.data_sources.tradingview_export import TradingViewExportSource
+from app.data_sources.http_feed import HttpFeedSource
+from app.candle_store import CandleStore
+from app.download_planner import DownloadPlanner
+from app.features import FeatureEngine
+from app.position_monitor import PositionMonitor, OUTCOME_TP
+from app.llm_cache import ResponseCache
 from app.gpt import CSVAnalyzerGPT
 import prompts
 import logging
-import re  # Импортируем модуль для работы с регулярными выражениями
 from dotenv import load_dotenv
 import os
 import config
-from app.text_utils import extract_signal_info
+from app.text_utils import extract_signal_info, extract_answer_text
 from db_config import DB_PATH, TABLES  # Импортируем константы
-from app.db.database_manager import DatabaseManager
-from app.csv_utils import get_last_high_low
-from pathlib import Path
+from app.db.async_database import AsyncDatabase
+from app.trading_snapshot import TradingSnapshot
+from app.scheduler import Scheduler, CandleTrigger, Stage, run_stages
+from app.bot_commands import create_router
+from app.notifier import Notifier
+from app.metrics import metrics, MetricsServer
+from app.task_queue import create_queue, run_worker
 
 
 # Загрузка переменных окружения из .env файла
@@ -31,180 +44,322 @@ MOSCOW_TZ = pytz.timezone("Europe/Moscow")
 # Инициализация бота и диспетчера
 bot = Bot(token=os.getenv('TELEGRAM_BOT_TOKEN'))
 dp = Dispatcher()
-
-
-async def run_every_15_minutes():
-    """Функция, которая выполняется каждые 15 минут в определённое время."""
-    try:
-        logging.info("Запуск задач каждые 15 минут...")
-        button_clicker = TradingViewButtonClicker(
-            config.USER_DATA_DIR,
-            config.DOWNLOADS_DIR, config.COOKIES_FILE
-        )
-
-        await button_clicker.open_browser()
-        await button_clicker.open_tabs()
-
-        tasks = []
-        for tab_index in range(len(button_clicker.pages)):
-            tasks.append(asyncio.create_task(
-                button_clicker.perform_actions_in_tab_15_min(tab_index)))
-
-        await asyncio.gather(*tasks)
-        logging.info("Задачи каждые 15 минут успешно выполнены.")
-
-    except FileNotFoundError as e:
-        logging.error(f"Файл не найден: {e}")
-    except Exception as e:
-        logging.error(f"Произошла ошибка: {e}")
-    finally:
-        if 'button_clicker' in locals():
-            await button_clicker.close_browser()
-            logging.info(
-                "Браузер закрыт после выгрузки задач каждые 15 минут.")
-
-
-async def run_every_hour():
-    """Функция, которая выполняется каждый час в определённое время."""
-    try:
-        logging.info("Запуск задач каждый час...")
-        button_clicker = TradingViewButtonClicker(
-            config.USER_DATA_DIR,
-            config.DOWNLOADS_DIR, config.COOKIES_FILE
-        )
-
-        await button_clicker.open_browser()
-        await button_clicker.open_tabs()
-
-        tasks = []
-        for tab_index in range(len(button_clicker.pages)):
-            tasks.append(asyncio.create_task(
-                button_clicker.perform_actions_in_tab_1_hour(tab_index)))
-
-        await asyncio.gather(*tasks)
-        logging.info("Задачи каждый час успешно выполнены.")
-
-    except FileNotFoundError as e:
-        logging.error(f"Файл не найден: {e}")
-    except Exception as e:
-        logging.error(f"Произошла ошибка: {e}")
-    finally:
-        if 'button_clicker' in locals():
-            await button_clicker.close_browser()
-            logging.info("Браузер закрыт после выгрузки задач каждый час.")
-
-
-def pnl_update(first_prise, second_prise, db_manager, db_name, file_name, pnl_status, coin_name):
-    text_to_send = ''
-    pnl = round(((first_prise - second_prise) / second_prise) * 100, 3)
-    # Если pnl_status равно False, делаем pnl отрицательным
-    if not pnl_status:
-        pnl = -abs(pnl)
-        db_manager.update_status_and_pnl(db_name, file_name, pnl, coin_name)
-        total_pnl = db_manager.get_total_pnl(db_name, file_name)
-        text_to_send = f'Сделка закрыта по стоп-лоссу. PNL {pnl}%\nКумулятивный PNL {round(float(total_pnl), 3)}%\n\n#{file_name}'
+# Очередь исходящих сообщений: отправка в фоне, с ограничением частоты и повторами
+notifier = Notifier(bot, config.NOTIFY_OUTBOX_PATH, chat_interval=config.NOTIFY_CHAT_INTERVAL_SECONDS,
+                    global_rate=config.NOTIFY_GLOBAL_RATE)
+
+
+def create_data_source():
+    """Создаёт источник свечей, выбранный в config.DATA_SOURCE."""
+    if config.DATA_SOURCE == "http":
+        return HttpFeedSource(
+            config.FEED_BASE_URL, config.FEED_SYMBOLS, config.DOWNLOADS_DIR,
+            connections=config.FEED_CONNECTIONS)
+
+    # Долгоживущий браузер, запускается один раз при старте бота
+    browser_pool = BrowserPool(
+        config.USER_DATA_DIR, config.DOWNLOADS_DIR, config.COOKIES_FILE,
+        tabs_count=config.BROWSER_TABS,
+        restart_every=config.BROWSER_RESTART_EVERY_CYCLES,
+        memory_limit_mb=config.BROWSER_MEMORY_LIMIT_MB,
+        tab_max_age=config.TAB_MAX_AGE_SECONDS,
+        chart_url=config.CHART_URL,
+        step_timeouts=config.EXPORT_STEP_TIMEOUTS,
+    )
+    return TradingViewExportSource(
+        browser_pool, config.SYMBOL_SELECTORS, config.TIMEFRAME_BUTTONS)
+
+
+data_source = create_data_source()
+# Очередь задач между ролями (бот с планировщиком, download, analyze, notify),
+# без QUEUE_URL весь тик выполняется в одном процессе
+QUEUE_URL = os.getenv("QUEUE_URL", config.QUEUE_URL)
+task_queue = create_queue(QUEUE_URL, lease=config.QUEUE_LEASE_SECONDS) if QUEUE_URL else None
+# Запись в базу - в отдельном потоке с групповым коммитом, чтение - через соединение только для чтения
+db = AsyncDatabase(DB_PATH, commit_window=config.DB_COMMIT_WINDOW_MS / 1000)
+# Позиции и PnL для команд бота хранятся в памяти и обновляются при записи в базу
+trading_snapshot = TradingSnapshot()
+db.add_listener(trading_snapshot.on_write)
+dp.include_router(create_router(trading_snapshot))
+candle_store = CandleStore(config.CANDLE_STORE_DIR)
+download_planner = DownloadPlanner(candle_store, config.DOWNLOAD_MAX_AGE_SECONDS)
+analyzer = CSVAnalyzerGPT(
+    api_key=os.getenv("API_KEY"), store=candle_store,
+    concurrency=config.LLM_CONCURRENCY, timeout=config.LLM_TIMEOUT, retries=config.LLM_RETRIES,
+    cache=ResponseCache(config.LLM_CACHE_PATH, mode=config.LLM_CACHE_MODE,
+                        max_entries=config.LLM_CACHE_MAX_ENTRIES),
+    compact=config.PROMPT_ENCODING == "compact", token_budgets=config.PROMPT_TOKEN_BUDGETS,
+    features=FeatureEngine(candle_store) if config.PROMPT_FEATURES else None,
+    features_max_row=config.PROMPT_FEATURES_MAX_ROW)
+
+# Свечи, которые нужны каждому расписанию
+CANDLE_REQUESTS_15_MIN = [CandleRequest(coin, timeframe, config.CANDLE_BARS)
+                          for coin in config.EXPORT_COINS for timeframe in config.EXPORT_TIMEFRAMES_15_MIN]
+CANDLE_REQUESTS_1_HOUR = [CandleRequest(coin, timeframe, config.CANDLE_BARS)
+                          for coin in config.EXPORT_COINS for timeframe in config.EXPORT_TIMEFRAMES_1_HOUR]
+
+
+# Свечи и анализы каждого расписания
+CANDLE_REQUESTS = {"15m": CANDLE_REQUESTS_15_MIN, "1h": CANDLE_REQUESTS_1_HOUR}
+
+
+async def download_stage(context):
+    """
+    Этап тика: загрузка свечей для всех сработавших расписаний одним проходом источника.
+    Каждая пара загружается один раз, свежие ряды берутся из хранилища.
+    """
+    plan = download_planner.plan(
+        [request for name in context["due"] for request in CANDLE_REQUESTS[name]])
+    context["frames"] = await data_source.fetch_many(plan.fetch) if plan.fetch else {}
+    logging.info(f"Загружено {len(context['frames'])} из {len(plan.fetch)} рядов свечей.")
+
+
+async def ingest_stage(context):
+    """Этап тика: запись свечей в хранилище (в отдельном потоке, чтобы не блокировать цикл событий)."""
+    await asyncio.to_thread(candle_store.ingest_frames, context["frames"])
+
+
+async def monitor_stage(context):
+    """
+    Этап тика: закрытие сработавших позиций до нового анализа.
+    Сообщения о закрытиях ставятся в очередь сразу: закрытие уже записано в базу,
+    и сообщение не должно потеряться, если анализ не уложится в дедлайн.
+    """
+    await deliver(await monitor_positions())
+
+
+async def analyze_stage(context):
+    """Этап тика: анализ всех пар сработавших расписаний."""
+    jobs = [job for name in context["due"] for job in SIGNAL_JOBS[name]]
+    context.setdefault("messages", []).extend(await analyze_all(jobs))
+
+
+async def notify_stage(context):
+    """
+    Этап тика: постановка всех сообщений тика в очередь отправки.
+    Сообщения одного канала за тик отправляются одним сообщением.
+    """
+    await deliver(context.get("messages", []))
+
+
+async def deliver(messages):
+    """
+    Передаёт сообщения на отправку: в режиме воркеров - задачей notify,
+    иначе - сразу в очередь отправки Notifier.
+    :param messages: Список (chat_id, текст).
+    """
+    if not messages:
+        return
+    if task_queue is not None:
+        await task_queue.put("notify", {"messages": messages})
     else:
-        pnl = abs(pnl)
-        db_manager.update_status_and_pnl(db_name, file_name, pnl, coin_name)
-        total_pnl = db_manager.get_total_pnl(db_name, file_name)
-        text_to_send = f'Сделка закрыта по тейк-профиту. PNL {pnl}%\nКумулятивный PNL {round(float(total_pnl), 3)}%\n\n#{file_name}'
-
-    return text_to_send
+        notifier.enqueue_many(messages)
+
+
+async def publish_tick_stage(context):
+    """Этап тика в режиме воркеров: задача download для воркера загрузки."""
+    await task_queue.put("download", {"due": context["due"], "scheduled_at": context["scheduled_at"]})
+
+
+async def publish_analysis_stage(context):
+    """Этап задачи download: по задаче analyze на каждую пару сработавших расписаний."""
+    for name in context["due"]:
+        for index in range(len(SIGNAL_JOBS[name])):
+            await task_queue.put(
+                "analyze", {"schedule": name, "index": index, "scheduled_at": context["scheduled_at"]})
+
+
+def build_tick_stages(due):
+    """
+    Граф этапов тика: download -> ingest -> monitor -> analyze -> notify.
+    Для 15-минутного и часового расписаний, сработавших вместе, строится один граф:
+    одна выгрузка свечей и один общий анализ.
+    В режиме воркеров планировщик только публикует задачу download.
+    """
+    deadlines = config.STAGE_DEADLINES
+    if task_queue is not None:
+        return [Stage("publish", publish_tick_stage, deadline=deadlines.get("notify"))]
+    return [
+        Stage("download", download_stage, deadline=deadlines.get("download")),
+        Stage("ingest", ingest_stage, deps=["download"], deadline=deadlines.get("ingest")),
+        Stage("monitor", monitor_stage, deps=["ingest"], deadline=deadlines.get("monitor")),
+        Stage("analyze", analyze_stage, deps=["monitor"], deadline=deadlines.get("analyze")),
+        Stage("notify", notify_stage, deps=["analyze"], deadline=deadlines.get("notify")),
+    ]
+
+
+def build_download_stages():
+    """
+    Граф задачи download у воркера загрузки: download -> ingest -> monitor -> publish.
+    Анализ пар выполняют воркеры analyze, каждая пара - отдельной задачей.
+    """
+    deadlines = config.STAGE_DEADLINES
+    return [
+        Stage("download", download_stage, deadline=deadlines.get("download")),
+        Stage("ingest", ingest_stage, deps=["download"], deadline=deadlines.get("ingest")),
+        Stage("monitor", monitor_stage, deps=["ingest"], deadline=deadlines.get("monitor")),
+        Stage("publish", publish_analysis_stage, deps=["monitor"], deadline=deadlines.get("notify")),
+    ]
+
+
+async def handle_download(payload):
+    """Задача download: загрузка свечей тика, закрытие позиций и публикация задач analyze."""
+    results = await run_stages(build_download_stages(), dict(payload))
+    failed = [name for name, result in results.items() if result["status"] != "ok"]
+    if failed:
+        # Повтор не нужен: к повтору свечи устареют, следующий тик загрузит их заново
+        logging.error(f"Задача download {payload['due']}: этапы {', '.join(failed)} не выполнены.")
+
+
+async def handle_analyze(payload):
+    """Задача analyze: анализ одной пары (монета, стратегия) и отправка сигнала задачей notify."""
+    delay = time.time() - payload["scheduled_at"]
+    if delay > config.ANALYZE_MAX_DELAY_SECONDS:
+        # Тик давно прошёл (воркеры не успевали или задача пережила перезапуск)
+        logging.warning(f"Задача analyze {payload['schedule']}#{payload['index']} "
+                        f"устарела на {delay:.0f} с, пропущена.")
+        return
+    await deliver(await analyze_job(SIGNAL_JOBS[payload["schedule"]][payload["index"]]))
+
+
+async def handle_notify(payload):
+    """Задача notify: сообщения в очередь отправки Notifier."""
+    notifier.enqueue_many([tuple(message) for message in payload["messages"]])
+
+
+# Обработчики задач ролей-воркеров
+TASK_HANDLERS = {"download": handle_download, "analyze": handle_analyze, "notify": handle_notify}
+
+
+def close_message(position, total_pnl):
+    """Текст сообщения о закрытии позиции."""
+    reason = "тейк-профиту" if position["outcome"] == OUTCOME_TP else "стоп-лоссу"
+    return (f'Сделка закрыта по {reason}. PNL {position["pnl"]}%\n'
+            f'Кумулятивный PNL {round(float(total_pnl), 3)}%\n\n#{position["timeframe"]}')
+
+
+async def monitor_positions():
+    """
+    Проверяет все открытые позиции всех стратегий по свечам с момента входа.
+    :return: Сообщения о закрытых позициях, список (chat_id, текст).
+    """
+    messages = []
+    closed = await PositionMonitor(db, candle_store, list(TABLES), config.MONITOR_TIMEFRAME).check()
+    for position in closed:
+        total_pnl = await db.get_total_pnl(position["table"], position["timeframe"])
+        messages.append((POSITION_CHANNELS.get(position["table"]), close_message(position, total_pnl)))
+    return messages
 
 
 async def signal_and_send_message(file_names, prompt, model_name, chanel_id, max_row, coin_name, db_name):
-    """Третья функция, которая выполняется после первой или второй."""
+    """
+    Анализ пары (монета, стратегия) и запись нового сигнала в базу.
+    :return: Сообщения для отправки, список (chat_id, текст); отправляет их этап notify.
+    """
+    messages = []
     timeframe = file_names[0].split("_")[0]
     RR_name = db_name.replace(db_name, "3")
-    db_manager = DatabaseManager(DB_PATH)
-    db_manager.connect()
-    position_open = db_manager.has_status_zero(
+    position_open = await db.has_status_zero(
         db_name, timeframe, coin_name)
     if not position_open:
-        analyzer = CSVAnalyzerGPT(api_key=os.getenv("API_KEY"))
-        answer = analyzer.ask_gpt_about_csvs(
-            file_names, prompt, model_name, max_row)
+        dump_path = None
+        if config.PROMPT_DUMP_DIR:
+            os.makedirs(config.PROMPT_DUMP_DIR, exist_ok=True)
+            dump_path = os.path.join(
+                config.PROMPT_DUMP_DIR, f"{db_name}_{timeframe}_{coin_name}.txt")
+        answer = await analyzer.ask_gpt_about_csvs(
+            file_names, prompt, model_name, max_row, dump_path)
 
         logging.info(answer)
         # Извлекаем текст, заключённый в {}
-        matches = re.findall(r"\{([^}]+)\}", answer)
-        if matches:
-            # Объединяем все найденные фрагменты в одну строку
-            format_text = "\n".join(matches)
+        format_text = extract_answer_text(answer)
+        if format_text:
             try:
                 text_to_send, db_data = extract_signal_info(
                     format_text, timeframe, coin_name, RR_name)
                 if db_data['signal'] != None:
-                    db_manager.insert_data(db_name, db_data)
-                    await bot.send_message(chat_id=chanel_id, text=text_to_send)
-                    logging.info(
-                        "Сообщение успешно отправлено в Telegram-канал.")
+                    db_data['opened_at'] = int(time.time())
+                    await db.insert_data(db_name, db_data)
+                    messages.append((chanel_id, text_to_send))
 
             except Exception as e:
-                logging.error(f"Ошибка при отправке сообщения в Telegram: {e}")
-        else:
-            format_text = None
+                logging.error(f"Ошибка при записи сигнала {db_name} {coin_name}: {e}")
     else:
-        # print(position_open)
-        high_value, low_value = get_last_high_low(
-            file_names[0], Path("/root/scripts/AI-Signal-Bot/app/downloads"))
-        # print(high_value, low_value)
-        if position_open['signal'] == "шорт" or position_open['signal'] == "short":
-            if position_open['TP'] > low_value:
-                text_to_send = pnl_update(position_open['open'], position_open['TP'],
-                                          db_manager, db_name, timeframe, True, coin_name)
-                await bot.send_message(chat_id=chanel_id, text=text_to_send)
-            if position_open['SL'] < high_value:
-                text_to_send = pnl_update(position_open['open'], position_open['SL'],
-                                          db_manager, db_name, timeframe, False, coin_name)
-                await bot.send_message(chat_id=chanel_id, text=text_to_send)
-        else:
-            if position_open['TP'] < high_value:
-                text_to_send = pnl_update(position_open['TP'], position_open['open'],
-                                          db_manager, db_name, timeframe, True, coin_name)
-                await bot.send_message(chat_id=chanel_id, text=text_to_send)
-            if position_open['SL'] > low_value:
-                text_to_send = pnl_update(position_open['open'], position_open['SL'],
-                                          db_manager, db_name, timeframe, False, coin_name)
-                await bot.send_message(chat_id=chanel_id, text=text_to_send)
+        # Позиция проверяется в monitor_positions() по свечам с момента входа
+        logging.info(f"{db_name} {timeframe} {coin_name}: позиция открыта, анализ пропущен.")
 
     logging.info("Третья функция завершена.")
-
-
-async def scheduler():
-    """Планировщик задач."""
-    while True:
-        now = datetime.now(MOSCOW_TZ)  # Текущее время по МСК
-        minute = now.minute
-        hour = now.hour
-
-        # Запуск каждые 15 минут (в :13, :28, :43, :58)
-        if minute in {12, 28, 43, 58}:
-            await run_every_15_minutes()  # Запуск первой функции
-            # Запуск третьей функции после первой
-            await signal_and_send_message(["M15_BTC.csv", "H1_BTC.csv", "H4_BTC.csv"], prompts.prompt_M15_RR3, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR3')
-            await signal_and_send_message(["M15_ETH.csv", "H1_ETH.csv", "H4_ETH.csv"], prompts.prompt_M15_RR3, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR3')
-            await signal_and_send_message(["M15_SOL.csv", "H1_SOL.csv", "H4_SOL.csv"], prompts.prompt_M15_RR3, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR3')
-            await signal_and_send_message(["M15_BTC.csv", "H1_BTC.csv", "H4_BTC.csv"], prompts.prompt_H1_RR3, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR5')
-            await signal_and_send_message(["M15_ETH.csv", "H1_ETH.csv", "H4_ETH.csv"], prompts.prompt_H1_RR3, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR5')
-            await signal_and_send_message(["M15_SOL.csv", "H1_SOL.csv", "H4_SOL.csv"], prompts.prompt_H1_RR3, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR5')
-            # await signal_and_send_message(["M15.csv", "H1.csv", "H4.csv"], prompts.prompt_M15, "o3-mini", os.getenv("O3_MINI_CHANEL_ID"), config.O3_MINI_MAX_ROW)
-
-        # Запуск каждый час в :58
-        if minute == 58:
-            await run_every_hour()  # Запуск второй функции
-            await signal_and_send_message(["H1_BTC.csv", "H4_BTC.csv", "D1_BTC.csv"], prompts.prompt_M15_RR5, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR3')
-            await signal_and_send_message(["H1_ETH.csv", "H4_ETH.csv", "D1_ETH.csv"], prompts.prompt_M15_RR5, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR3')
-            await signal_and_send_message(["H1_SOL.csv", "H4_SOL.csv", "D1_SOL.csv"], prompts.prompt_M15_RR5, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR3')
-            await signal_and_send_message(["H1_BTC.csv", "H4_BTC.csv", "D1_BTC.csv"], prompts.prompt_H1_RR5, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR5')
-            await signal_and_send_message(["H1_ETH.csv", "H4_ETH.csv", "D1_ETH.csv"], prompts.prompt_H1_RR5, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR5')
-            await signal_and_send_message(["H1_SOL.csv", "H4_SOL.csv", "D1_SOL.csv"], prompts.prompt_H1_RR5, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR5')
-            # await signal_and_send_message(["H1.csv", "H4.csv", "D1.csv"], prompts.prompt_H1, "o3-mini", os.getenv("O3_MINI_CHANEL_ID"), config.O3_MINI_MAX_ROW)
-
-        # Ожидание до следующей минуты
-        next_minute = (now + timedelta(minutes=1)
-                       ).replace(second=0, microsecond=0)
-        await asyncio.sleep((next_minute - now).total_seconds())
+    return messages
+
+
+# Каналы, в которые отправляются сообщения о закрытии позиций каждой стратегии
+POSITION_CHANNELS = {"RR3": os.getenv("RR3_CHANEL_ID"), "RR5": os.getenv("RR5_CHANEL_ID")}
+
+# Аргументы signal_and_send_message для каждой пары (монета, стратегия)
+SIGNAL_JOBS_15_MIN = [
+    (["M15_BTC.csv", "H1_BTC.csv", "H4_BTC.csv"], prompts.prompt_M15_RR3, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR3'),
+    (["M15_ETH.csv", "H1_ETH.csv", "H4_ETH.csv"], prompts.prompt_M15_RR3, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR3'),
+    (["M15_SOL.csv", "H1_SOL.csv", "H4_SOL.csv"], prompts.prompt_M15_RR3, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR3'),
+    (["M15_BTC.csv", "H1_BTC.csv", "H4_BTC.csv"], prompts.prompt_H1_RR3, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR5'),
+    (["M15_ETH.csv", "H1_ETH.csv", "H4_ETH.csv"], prompts.prompt_H1_RR3, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR5'),
+    (["M15_SOL.csv", "H1_SOL.csv", "H4_SOL.csv"], prompts.prompt_H1_RR3, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR5'),
+]
+SIGNAL_JOBS_1_HOUR = [
+    (["H1_BTC.csv", "H4_BTC.csv", "D1_BTC.csv"], prompts.prompt_M15_RR5, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR3'),
+    (["H1_ETH.csv", "H4_ETH.csv", "D1_ETH.csv"], prompts.prompt_M15_RR5, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR3'),
+    (["H1_SOL.csv", "H4_SOL.csv", "D1_SOL.csv"], prompts.prompt_M15_RR5, "o1", os.getenv("RR3_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR3'),
+    (["H1_BTC.csv", "H4_BTC.csv", "D1_BTC.csv"], prompts.prompt_H1_RR5, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'BTC', 'RR5'),
+    (["H1_ETH.csv", "H4_ETH.csv", "D1_ETH.csv"], prompts.prompt_H1_RR5, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'ETH', 'RR5'),
+    (["H1_SOL.csv", "H4_SOL.csv", "D1_SOL.csv"], prompts.prompt_H1_RR5, "o1", os.getenv("RR5_CHANEL_ID"), config.O1_MAX_ROW, 'SOL', 'RR5'),
+]
+SIGNAL_JOBS = {"15m": SIGNAL_JOBS_15_MIN, "1h": SIGNAL_JOBS_1_HOUR}
+
+
+async def analyze_all(jobs):
+    """
+    Запускает анализ всех пар (монета, стратегия) одновременно.
+    Число одновременных запросов к модели ограничивает CSVAnalyzerGPT,
+    поэтому тик длится примерно как самый долгий запрос, а не как их сумма.
+    :return: Сообщения всех пар для отправки.
+    """
+    started = datetime.now()
+    messages = []
+    results = await asyncio.gather(*(analyze_job(job) for job in jobs), return_exceptions=True)
+    for job, result in zip(jobs, results):
+        if isinstance(result, Exception):
+            logging.error(f"Ошибка при анализе {job[5]} {job[6]}: {result}")
+        else:
+            messages.extend(result)
+    logging.info(
+        f"Анализ {len(jobs)} пар завершён за {(datetime.now() - started).total_seconds():.1f} с.")
+    return messages
+
+
+async def analyze_job(job):
+    """Анализ одной пары: все замеры (промпт, запрос к модели, база) помечаются стратегией и монетой."""
+    with metrics.labels(strategy=job[6], coin=job[5], timeframe=job[0][0].split("_")[0]):
+        return await signal_and_send_message(*job)
+
+
+# Расписания: за SCHEDULE_OFFSET_SECONDS до закрытия 15-минутной и часовой свечи по МСК
+scheduler = Scheduler(
+    {
+        "15m": CandleTrigger(900, config.SCHEDULE_OFFSET_SECONDS, MOSCOW_TZ),
+        "1h": CandleTrigger(3600, config.SCHEDULE_OFFSET_SECONDS, MOSCOW_TZ),
+    },
+    build_tick_stages,
+)
+
+# Показатели: /metrics в формате Prometheus и JSON-сводка каждого тика
+# METRICS_PORT в окружении - свой порт для каждого воркера на одной машине
+metrics_server = MetricsServer(metrics, port=int(os.getenv("METRICS_PORT", config.METRICS_PORT)),
+                               tick_log=config.METRICS_TICK_LOG or None)
+scheduler.add_listener(metrics_server.on_tick)
+metrics.add_gauge("process_rss_mb", process_rss_mb)
+metrics.add_gauge("chromium_rss_mb", children_rss_mb)
+metrics.add_gauge("ticks_skipped", lambda: scheduler.skipped)
+metrics.add_gauge("download_hit_ratio", download_planner.hit_ratio)
+metrics.add_gauge("outbox_pending", lambda: notifier.pending() if notifier.connection else 0)
 
 
 # async def main():
@@ -223,19 +378,63 @@ async def scheduler():
 # if __name__ == "__main__":
 #     asyncio.run(main())
 
-async def on_startup():
-    """Функция, которая выполняется при запуске бота."""
-    logging.info("Бот запущен.")
-    # Инициализация и подключение к базе данных
-    db_manager = DatabaseManager(DB_PATH)
-    db_manager.connect()
+# Роли процесса: bot - Telegram и планировщик, остальные - воркеры задач одноимённой темы
+ROLES = ("bot", "download", "analyze", "notify")
 
-    # Создание таблиц, если они не существуют
-    for table_name, columns in TABLES.items():
-        db_manager.create_table(table_name, columns)
 
-    db_manager.close()
-    asyncio.create_task(scheduler())  # Запуск планировщика задач
+async def refresh_snapshot():
+    """
+    В режиме воркеров позиции записывают другие процессы, поэтому состояние для команд бота
+    периодически перечитывается из базы.
+    """
+    while True:
+        await asyncio.sleep(config.SNAPSHOT_REFRESH_SECONDS)
+        try:
+            await trading_snapshot.load(db, list(TABLES))
+        except Exception as e:
+            logging.error(f"Не удалось обновить позиции из базы: {e}")
+
+
+async def on_startup(roles):
+    """
+    Функция, которая выполняется при запуске бота.
+    :param roles: Роли процесса, без очереди задач - все роли.
+    """
+    logging.info(f"Бот запущен, роли: {', '.join(sorted(roles))}.")
+    if roles & {"bot", "download", "analyze"}:
+        # Подключение к базе данных: соединения открыты до остановки бота
+        await db.start()
+
+        # Создание таблиц, если они не существуют
+        for table_name, columns in TABLES.items():
+            await db.create_table(table_name, columns)
+    if "bot" in roles:
+        await trading_snapshot.load(db, list(TABLES))
+    if task_queue is None or "notify" in roles:
+        await notifier.start()  # Отправка сообщений, оставшихся с прошлого запуска
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        # Несколько воркеров одной роли на одной машине: показатели отдаёт первый
+        logging.error(f"Не удалось запустить сервер показателей: {e}")
+
+    if task_queue is None or "download" in roles:
+        try:
+            await data_source.start()  # Прогреваем браузер или пул соединений заранее
+        except Exception as e:
+            logging.error(f"Не удалось запустить источник свечей: {e}")
+
+    if "bot" in roles:
+        asyncio.create_task(scheduler.run())  # Запуск планировщика задач
+    if task_queue is not None:
+        await task_queue.start()
+        for role in roles - {"bot"}:
+            asyncio.create_task(run_worker(
+                task_queue, role, TASK_HANDLERS[role],
+                concurrency=config.WORKER_CONCURRENCY.get(role, 1),
+                max_attempts=config.TASK_MAX_ATTEMPTS))
+        if "bot" in roles and roles != set(ROLES):
+            asyncio.create_task(refresh_snapshot())
 
 
 async def on_shutdown():
@@ -244,15 +443,53 @@ async def on_shutdown():
     await bot.close()
 
 
-async def main():
-    """Основная функция, которая запускает бота и планировщик."""
-    await on_startup()  # Выполняем startup-логику
-    await dp.start_polling(bot)  # Запускаем бота в режиме long-polling
+async def main(roles):
+    """Основная функция, которая запускает бота, планировщик и воркеры ролей процесса."""
+    await on_startup(roles)  # Выполняем startup-логику
+    try:
+        if "bot" in roles:
+            await dp.start_polling(bot)  # Запускаем бота в режиме long-polling
+        else:
+            await asyncio.Event().wait()  # Воркеры работают до остановки процесса
+    finally:
+        if task_queue is not None:
+            await task_queue.close()
+        await data_source.stop()
+        await notifier.stop()
+        await metrics_server.stop()
+        await db.close()
+
+
+def check_tick_budget(roles):
+    """Отказывает в запуске, если дедлайны этапов (STAGE_DEADLINES) не укладываются в тик."""
+    try:
+        if "bot" in roles:
+            budget = scheduler.check_budget()
+            logging.info(f"Бюджет тика по дедлайнам этапов: {budget} с.")
+        if task_queue is not None and "download" in roles:
+            scheduler.check_budget(build_download_stages())
+    except ValueError as e:
+        raise SystemExit(f"STAGE_DEADLINES: {e}")
+
+
+def parse_roles():
+    """Роли процесса из командной строки, по умолчанию - все."""
+    parser = argparse.ArgumentParser(description="AI-Signal-Bot")
+    parser.add_argument(
+        "roles", nargs="*", choices=ROLES,
+        help="Роли процесса (нужен QUEUE_URL): bot - Telegram и планировщик, download - загрузка "
+             "свечей и закрытие позиций, analyze - анализ пар, notify - отправка сообщений.")
+    roles = set(parser.parse_args().roles or ROLES)
+    if task_queue is None and roles != set(ROLES):
+        parser.error("Отдельные роли запускаются только с очередью задач (QUEUE_URL).")
+    return roles
 
 
 if __name__ == "__main__":
+    roles = parse_roles()
+    check_tick_budget(roles)
     try:
-        asyncio.run(main())
+        asyncio.run(main(roles))
     except KeyboardInterrupt:
         logging.info("Бот остановлен вручную.")
     finally:
@@ -0,0 +1,51 @@
+import asyncio
+import sqlite3
+import pytest
+
+pytest.importorskip("db_config")
+
+from app.db import async_database, database_manager  # noqa: E402
+from app.db.async_database import AsyncDatabase  # noqa: E402
+
+CHILD_COLUMNS = {"id": "INTEGER PRIMARY KEY AUTOINCREMENT", "parent_id": "INTEGER"}
+
+
+@pytest.fixture
+def failing_commits(monkeypatch):
+    """
+    Соединение записи с отложенным внешним ключом: вставка строки без родителя
+    проходит, а коммит её транзакции падает.
+    """
+    connect = database_manager.DatabaseManager.connect
+
+    def connect_with_foreign_keys(self):
+        connect(self)
+        if self.read_only:
+            return
+        self.connection.execute("PRAGMA foreign_keys=ON;")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS parent (id INTEGER PRIMARY KEY);")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS child (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "parent_id INTEGER REFERENCES parent (id) DEFERRABLE INITIALLY DEFERRED);")
+        self.connection.execute("INSERT OR IGNORE INTO parent (id) VALUES (1);")
+        self.connection.commit()
+
+    monkeypatch.setattr(async_database.DatabaseManager, "connect", connect_with_foreign_keys)
+    monkeypatch.setitem(database_manager.TABLES, "child", CHILD_COLUMNS)
+
+
+def test_failed_commit_does_not_block_later_writes(tmp_path, failing_commits):
+    async def run():
+        db = AsyncDatabase(str(tmp_path / "trades.db"), commit_window=0)
+        await db.start()
+        try:
+            with pytest.raises(sqlite3.IntegrityError):
+                await db.insert_data("child", {"parent_id": 999})
+            # Соединение записи не осталось внутри транзакции упавшего коммита
+            return await db.insert_data("child", {"parent_id": 1})
+        finally:
+            await db.close()
+
+    assert asyncio.run(run()) is not None
+    with sqlite3.connect(tmp_path / "trades.db") as connection:
+        assert connection.execute("SELECT parent_id FROM child;").fetchall() == [(1,)]
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import numpy as np
+from app.backtest import STRATEGIES, _replay
+from app.candle_store import CandleStore
+from app.candles import CandleFrame, TIMEFRAME_SECONDS
+from app.data_sources.base import candle_file_name
+from app.gpt import CSVAnalyzerGPT
+from app.llm_cache import ResponseCache
+
+
+# Свеча M15, которая формируется во время боевого тика (за 2 минуты до закрытия)
+FORMING_BAR = 1_700_000_000 // 14400 * 14400
+ANSWER = "{Сигнал: лонг, Вход: 100.50, SL: 99.00, TP: 105.00, RR: 1:3}"
+
+
+class RecordingClient:
+    """Замена AsyncOpenAI: всегда отвечает ANSWER и считает запросы."""
+
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=ANSWER))],
+                               usage=None)
+
+
+def candles(timeframe, last_open, count, close_shift=0.0):
+    period = TIMEFRAME_SECONDS[timeframe]
+    times = np.arange(last_open - (count - 1) * period, last_open + 1, period)
+    close = 100 + np.sin(np.arange(count) / 5)
+    close[-1] += close_shift
+    return CandleFrame({"time": times, "open": close - 0.1, "high": close + 0.5,
+                        "low": close - 0.5, "close": close})
+
+
+def fill_store(store, close_shift=0.0):
+    for timeframe in ("M15", "H1", "H4"):
+        store.ingest(candles(timeframe, FORMING_BAR, 120, close_shift if timeframe == "M15" else 0.0),
+                     "BTC", timeframe)
+
+
+def replay_params(tmp_path, cache_path):
+    return {
+        "store_dir": str(tmp_path / "store"), "llm": "replay", "cache_path": str(cache_path),
+        "strategies": {"RR3/M15": STRATEGIES["RR3/M15"]}, "max_row": 50, "compact": True,
+        "features": False, "features_max_row": 60, "bar_timeframe": "M15", "step": 900,
+        # Один тик бэктеста - закрытие формировавшейся свечи
+        "start": FORMING_BAR, "end": FORMING_BAR + 901,
+    }
+
+
+def test_recorded_response_is_replayed_after_bar_closes(tmp_path):
+    store = CandleStore(str(tmp_path / "store"))
+    fill_store(store)
+    cache_path = tmp_path / "responses.db"
+
+    # Боевой тик: промпт содержит формирующуюся свечу, ответ записывается в кэш
+    table, question, model_name, timeframes = STRATEGIES["RR3/M15"]
+    client = RecordingClient()
+    live = CSVAnalyzerGPT(api_key=None, store=store, client=client, compact=True,
+                          cache=ResponseCache(str(cache_path), mode="live"))
+    file_names = [candle_file_name("BTC", timeframe) for timeframe in timeframes]
+    assert asyncio.run(live.ask_gpt_about_csvs(file_names, question, model_name, 50)) == ANSWER
+    assert client.calls == 1
+    live.cache.close()
+
+    # Свеча закрылась с другой ценой: текст промпта в бэктесте уже другой
+    fill_store(store, close_shift=1.0)
+
+    trades = asyncio.run(_replay("BTC", replay_params(tmp_path, cache_path)))
+    assert len(trades) == 1
+    assert trades[0]["strategy"] == "RR3/M15"
+    assert trades[0]["opened_at"] == FORMING_BAR + 900
+    assert trades[0]["open"] == 100.5
+
+
+def test_replay_without_recording_skips_tick(tmp_path):
+    fill_store(CandleStore(str(tmp_path / "store")))
+    cache_path = tmp_path / "responses.db"
+    ResponseCache(str(cache_path), mode="live").close()
+
+    assert asyncio.run(_replay("BTC", replay_params(tmp_path, cache_path))) == []
+
+
+def test_prompt_and_cache_work_runs_off_event_loop(tmp_path, monkeypatch):
+    store = CandleStore(str(tmp_path / "store"))
+    fill_store(store)
+    cache = ResponseCache(str(tmp_path / "responses.db"), mode="live")
+    gpt = CSVAnalyzerGPT(api_key=None, store=store, client=RecordingClient(), compact=True, cache=cache)
+
+    threads = {}
+    for owner, name in ((gpt, "_build_prompt"), (cache, "get"), (cache, "put")):
+        original = getattr(owner, name)
+
+        def recording(*args, _original=original, _name=name, **kwargs):
+            threads[_name] = threading.get_ident()
+            return _original(*args, **kwargs)
+        monkeypatch.setattr(owner, name, recording)
+
+    async def run():
+        table, question, model_name, timeframes = STRATEGIES["RR3/M15"]
+        file_names = [candle_file_name("BTC", timeframe) for timeframe in timeframes]
+        await gpt.ask_gpt_about_csvs(file_names, question, model_name, 50)
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    cache.close()
+    assert set(threads) == {"_build_prompt", "get", "put"}
+    assert loop_thread not in threads.values()
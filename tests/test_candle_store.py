@@ -0,0 +1,45 @@
+import numpy as np
+from app.candle_store import CandleStore
+from app.candles import CandleFrame
+
+
+def candles(start, count, shift=0.0, **extra):
+    times = 1_700_000_000 + np.arange(start, start + count) * 900
+    close = 100.0 + np.arange(start, start + count) + shift
+    columns = {"time": times, "open": close - 0.5, "high": close + 1, "low": close - 1, "close": close}
+    columns.update({name: np.full(count, value) for name, value in extra.items()})
+    return CandleFrame(columns)
+
+
+def test_ingest_does_not_touch_mapped_files(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.ingest(candles(0, 100), "BTC", "M15")
+    mapped = store.read("BTC", "M15")["close"]
+
+    # Свечи 95-99 переписываются другими значениями, 100-104 дописываются
+    store.ingest(candles(95, 10, shift=1000), "BTC", "M15")
+
+    # Отображение старого файла не изменилось: читатель не видит наполовину записанный ряд
+    assert len(mapped) == 100
+    assert mapped[-1] == 199.0
+    frame = store.read("BTC", "M15")
+    assert len(frame) == 105
+    assert frame["close"][99] == 1199.0
+
+
+def test_changed_columns_keep_history(tmp_path):
+    store = CandleStore(str(tmp_path))
+    store.ingest(candles(0, 100), "BTC", "M15")
+    store.ingest(candles(95, 10, Volume=5.0), "BTC", "M15")
+
+    frame = store.read("BTC", "M15")
+    assert len(frame) == 105
+    assert np.array_equal(frame["close"], 100.0 + np.arange(105))
+    assert np.isnan(frame["Volume"][:95]).all()
+    assert (frame["Volume"][95:] == 5.0).all()
+
+    # Колонки нет в следующей выгрузке - для новых свечей она заполняется NaN
+    store.ingest(candles(105, 2), "BTC", "M15")
+    frame = store.read("BTC", "M15")
+    assert len(frame) == 107
+    assert np.isnan(frame["Volume"][-2:]).all()
@@ -0,0 +1,56 @@
+import asyncio
+import sqlite3
+import threading
+import pytest
+
+pytest.importorskip("db_config")
+
+from db_config import TABLES  # noqa: E402
+from app.db.async_database import AsyncDatabase  # noqa: E402
+from app.db.database_manager import DatabaseManager  # noqa: E402
+
+
+def test_concurrent_startup_rebuilds_stats_once(tmp_path):
+    db_path = str(tmp_path / "trades.db")
+    manager = DatabaseManager(db_path)
+    manager.connect()
+    manager.create_table("RR3", TABLES["RR3"])
+    with manager.transaction():
+        for index in range(50):
+            manager.insert_data("RR3", {"timeframe": "M15", "coin_name": "BTC", "signal": "лонг",
+                                        "status": 0, "pnl": 1.0 if index % 2 else -1.0})
+        # Как база, созданная до агрегатов
+        manager.cursor.execute("DELETE FROM pnl_stats;")
+    manager.close()
+
+    # Воркеры запускаются одновременно; пока один пишет, остальные ждут блокировку записи
+    barrier = threading.Barrier(8)
+    errors = []
+
+    async def on_startup():
+        db = AsyncDatabase(db_path, commit_window=0)
+        await db.start()
+        try:
+            barrier.wait()
+            for _ in range(5):
+                await db.create_table("RR3", TABLES["RR3"])
+        finally:
+            await db.close()
+
+    def start_worker():
+        try:
+            asyncio.run(on_startup())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=start_worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with sqlite3.connect(db_path) as connection:
+        assert connection.execute(
+            "SELECT trades, wins, total_pnl FROM pnl_stats WHERE table_name = 'RR3';").fetchall() \
+            == [(50, 25, 0.0)]
@@ -0,0 +1,58 @@
+import os
+import runpy
+import numpy as np
+import pytest
+from app.candle_store import CandleStore
+from app.candles import CandleFrame, TIMEFRAME_SECONDS
+from app.data_sources.base import CandleRequest
+from app.download_planner import DownloadPlanner
+
+
+CONFIG_EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.py.example")
+MAX_AGE = runpy.run_path(CONFIG_EXAMPLE)["DOWNLOAD_MAX_AGE_SECONDS"]
+
+# Начало суток (UTC) и тики за 2 минуты до закрытия свечей M15: :13, :28, :43, :58
+DAY = 1_700_000_000 // 86400 * 86400
+TICK = 900
+FIRST_TICK = DAY + 13 * 60
+DOWNLOAD_SECONDS = 60  # Ряд записывается в хранилище через минуту после начала тика
+BARS = 100
+
+
+def ingest(store, timeframe, fetched_at):
+    period = TIMEFRAME_SECONDS[timeframe]
+    last_open = fetched_at // period * period
+    times = np.arange(last_open - (BARS - 1) * period, last_open + 1, period)
+    close = np.full(BARS, 100.0)
+    store.ingest(CandleFrame({"time": times, "open": close, "high": close + 1,
+                              "low": close - 1, "close": close}), "BTC", timeframe, fetched_at)
+
+
+@pytest.mark.parametrize("timeframe", sorted(MAX_AGE))
+def test_second_tick_inside_window_skips_download(tmp_path, timeframe):
+    store = CandleStore(str(tmp_path))
+    planner = DownloadPlanner(store, MAX_AGE)
+    request = CandleRequest("BTC", timeframe, BARS)
+
+    assert planner.plan([request], now=FIRST_TICK).fetch == [request]
+    ingest(store, timeframe, FIRST_TICK + DOWNLOAD_SECONDS)
+
+    plan = planner.plan([request], now=FIRST_TICK + TICK)
+    assert plan.fetch == []
+    assert plan.fresh == [request]
+
+
+def test_h1_refreshed_for_hourly_tick_and_new_bar(tmp_path):
+    store = CandleStore(str(tmp_path))
+    planner = DownloadPlanner(store, MAX_AGE)
+    request = CandleRequest("BTC", "H1", BARS)
+    ingest(store, "H1", FIRST_TICK + DOWNLOAD_SECONDS)
+
+    fetched = [bool(planner.plan([request], now=FIRST_TICK + step * TICK).fetch)
+               for step in range(1, 4)]
+    # :28 и :43 - из хранилища, :58 - часовые задачи получают свежую незакрытую свечу
+    assert fetched == [False, False, True]
+
+    ingest(store, "H1", FIRST_TICK + 3 * TICK + DOWNLOAD_SECONDS)
+    # :13 следующего часа: закрылась свеча, загруженная до закрытия
+    assert planner.plan([request], now=FIRST_TICK + 4 * TICK).fetch == [request]
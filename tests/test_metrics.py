@@ -0,0 +1,25 @@
+from app.metrics import Metrics, PREFIX
+
+
+def test_render_keeps_summary_samples_to_count_and_sum():
+    metrics = Metrics()
+    metrics.observe("stage_seconds", 1.5, stage="download")
+    metrics.observe("stage_seconds", 0.5, stage="download")
+    metrics.observe("prompt_chars", 1000, model="o1")
+
+    types = {}
+    samples = []
+    for line in metrics.render().splitlines():
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split()
+            types[name] = kind
+        elif line:
+            samples.append(line.split("{")[0])
+
+    summaries = {name for name, kind in types.items() if kind == "summary"}
+    for sample in samples:
+        family = next((name for name in summaries if sample in (name + "_count", name + "_sum")), sample)
+        assert family in types, sample
+    assert types[PREFIX + "stage_max_seconds"] == "gauge"
+    assert types[PREFIX + "prompt_chars_max"] == "gauge"
+    assert f'{PREFIX}stage_max_seconds{{stage="download"}} 1.500000' in metrics.render()
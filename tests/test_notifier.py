@@ -0,0 +1,59 @@
+import asyncio
+from app.notifier import Notifier
+
+
+class FakeBot:
+    """Замена aiogram Bot: в чат 'bad' отправка падает с ошибкой вне API Telegram."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id == "bad":
+            raise ValueError("chat_id не прошёл проверку")
+        self.sent.append((chat_id, text))
+
+
+async def wait_until(condition, timeout=5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("Условие не выполнилось")
+
+
+def make_notifier(tmp_path, bot):
+    return Notifier(bot, str(tmp_path / "outbox.db"), chat_interval=0, global_rate=1000,
+                    max_attempts=2, max_backoff=0.01)
+
+
+def test_sender_survives_errors_outside_telegram_api(tmp_path):
+    bot = FakeBot()
+    notifier = make_notifier(tmp_path, bot)
+
+    async def run():
+        failures = []
+        send_ready = notifier._send_ready
+
+        async def failing_once():
+            if not failures:
+                failures.append(True)
+                raise RuntimeError("database is locked")
+            return await send_ready()
+
+        notifier._send_ready = failing_once
+        await notifier.start()
+        notifier.enqueue_many([("bad", "не уйдёт"), ("1", "сигнал")])
+        await wait_until(lambda: bot.sent and not notifier.pending())
+        await notifier.stop(timeout=0)
+
+    asyncio.run(run())
+    assert bot.sent == [("1", "сигнал")]
+    assert notifier.dropped == 1
+
+
+def test_messages_without_chat_are_skipped(tmp_path):
+    notifier = make_notifier(tmp_path, FakeBot())
+    notifier.enqueue_many([(None, "нет канала"), ("", "пустой канал"), (-100, "сигнал")])
+    rows = notifier.connection.execute("SELECT chat_id, text FROM outbox;").fetchall()
+    assert rows == [("-100", "сигнал")]
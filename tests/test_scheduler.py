@@ -0,0 +1,42 @@
+import os
+import runpy
+import pytest
+from app.scheduler import CandleTrigger, Scheduler, Stage, stages_budget
+
+CONFIG_EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "config.py.example")
+
+
+async def noop(context):
+    pass
+
+
+def chain(deadlines):
+    """Граф тика, как в main.py: download -> ingest -> monitor -> analyze -> notify."""
+    names = ["download", "ingest", "monitor", "analyze", "notify"]
+    return [Stage(name, noop, deps=names[index - 1:index], deadline=deadlines.get(name))
+            for index, name in enumerate(names)]
+
+
+def scheduler(deadlines):
+    return Scheduler({"15m": CandleTrigger(900, -120), "1h": CandleTrigger(3600, -120)},
+                     lambda due: chain(deadlines))
+
+
+def test_budget_is_longest_path():
+    stages = [Stage("a", noop, deadline=10), Stage("b", noop, deadline=30),
+              Stage("c", noop, deps=["a", "b"], deadline=5)]
+    assert stages_budget(stages) == 35
+    assert stages_budget(stages + [Stage("d", noop, deps=["c"])]) is None
+
+
+def test_example_deadlines_fit_into_tick():
+    deadlines = runpy.run_path(CONFIG_EXAMPLE)["STAGE_DEADLINES"]
+    assert scheduler(deadlines).check_budget() <= 900 - 60
+
+
+def test_budget_larger_than_tick_is_rejected():
+    deadlines = {"download": 420, "ingest": 60, "monitor": 60, "analyze": 780, "notify": 60}
+    with pytest.raises(ValueError):
+        scheduler(deadlines).check_budget()
+    with pytest.raises(ValueError):
+        scheduler({"download": 100}).check_budget()
@@ -0,0 +1,49 @@
+import asyncio
+import sqlite3
+import pytest
+
+pytest.importorskip("db_config")
+
+from db_config import TABLES  # noqa: E402
+from app.db.async_database import AsyncDatabase  # noqa: E402
+from app.trading_snapshot import TradingSnapshot  # noqa: E402
+
+
+def position(coin_name):
+    return {"timeframe": "M15", "coin_name": coin_name, "signal": "лонг", "open": 100.0,
+            "SL": 99.0, "TP": 103.0, "status": 1, "opened_at": 1_700_000_000}
+
+
+def test_recent_closes_are_loaded_from_database(tmp_path):
+    db_path = str(tmp_path / "trades.db")
+    # Таблица, созданная до колонки closed_at
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(
+            "CREATE TABLE RR3 (" + ", ".join(
+                f"{name} {kind}" for name, kind in TABLES["RR3"].items() if name != "closed_at") + ");")
+
+    async def run():
+        # Процесс загрузки закрывает позиции, процесс бота только читает базу
+        download = AsyncDatabase(db_path, commit_window=0)
+        await download.start()
+        await download.create_table("RR3", TABLES["RR3"])
+        btc = await download.insert_data("RR3", position("BTC"))
+        eth = await download.insert_data("RR3", position("ETH"))
+        await download.insert_data("RR3", position("SOL"))
+        await download.close_positions([("RR3", btc, 3.0)])
+        await download.close_positions([("RR3", eth, -1.0)])
+        await download.close()
+
+        bot = AsyncDatabase(db_path)
+        await bot.start()
+        snapshot = TradingSnapshot()
+        await snapshot.load(bot, ["RR3"])
+        await bot.close()
+        return snapshot
+
+    snapshot = asyncio.run(run())
+    closes = list(snapshot.recent_closes)
+    assert {close["coin_name"] for close in closes} == {"BTC", "ETH"}
+    assert all(close["closed_at"] for close in closes)
+    assert [close["coin_name"] for close in snapshot.open_positions.values()] == ["SOL"]
+    assert "Последние закрытия:" in snapshot.stats_text()
@@ -0,0 +1,270 @@
+"""
+Локальная замена страницы графика TradingView для прогона выгрузки без доступа к сайту.
+Страница повторяет то, на что опирается TradingViewButtonClicker: символы в списке наблюдения
+(div[data-symbol-short]), кнопки таймфреймов, кнопку 'Управление графиками', пункт меню
+'Экспорт данных графика…', выбор 'Временной шаг UNIX' / 'Время в формате ISO', кнопку 'Экспорт'
+и загрузку CSV-файла. Задержки отрисовки каждого шага настраиваются.
+Как на настоящем графике, отметка кнопки таймфрейма (aria-checked) и заголовок вкладки
+меняются только после загрузки ряда, а выгружается ряд, загруженный на график.
+
+Запуск:
+    python -m tools.fake_tradingview --port 8082 --menu-delay 300 --dialog-delay 800
+и в config.py:
+    CHART_URL = "http://127.0.0.1:8082/chart/"
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import zlib
+from aiohttp import web
+from app.candles import TIMEFRAME_SECONDS
+from benchmarks.synthetic import tradingview_export_lines
+
+
+# Кнопки таймфреймов с теми же атрибутами, что в TradingView (см. TIMEFRAME_BUTTONS в config.py)
+TIMEFRAME_ATTRIBUTES = {
+    "M15": {"aria-label": "15 минут", "data-tooltip": "15 минут", "role": "radio"},
+    "H1": {"aria-label": "1 час", "data-tooltip": "1 час", "role": "radio"},
+    "H4": {"aria-label": "4 часа", "data-tooltip": "4 часа", "role": "radio"},
+    "D1": {"aria-label": "1 день", "data-tooltip": "1 день", "role": "radio"},
+}
+
+# Селекторы для TradingViewButtonClicker, совпадающие с разметкой страницы
+TIMEFRAME_BUTTONS = {
+    "M15": "button[aria-label='15 минут'][role='radio']",
+    "H1": "button[aria-label='1 час'][role='radio']",
+    "H4": "button[data-tooltip='4 часа']",
+    "D1": "button[aria-label='1 день'][data-tooltip='1 день'][role='radio']",
+}
+
+
+def symbol_name(coin):
+    return f"{coin}USDT.P"
+
+
+def symbol_selector(coin):
+    """Селектор символа в списке наблюдения, как в SYMBOL_SELECTORS в config.py."""
+    return f"div[data-symbol-short='{symbol_name(coin)}']"
+
+
+# Задержки в миллисекундах
+DEFAULT_DELAYS = {
+    "page": 0,  # ответ сервера на загрузку страницы
+    "render": 300,  # отрисовка графика после загрузки
+    "chart": 200,  # догрузка данных после смены символа или таймфрейма (сетевой запрос)
+    "menu": 150,  # открытие меню 'Управление графиками'
+    "dialog": 400,  # отрисовка диалога экспорта
+    "options": 100,  # открытие списка форматов времени
+    "export": 300,  # подготовка файла после нажатия 'Экспорт' (на сервере)
+}
+
+PAGE_TEMPLATE = """<!doctype html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<title>Fake TradingView</title>
+<style>
+  body { font-family: sans-serif; margin: 0; }
+  .toolbar, .watchlist { display: flex; gap: 4px; padding: 4px; }
+  .watchlist { flex-direction: column; width: 160px; }
+  .hidden { display: none !important; }
+  .menu, .dialog { position: absolute; top: 40px; left: 200px; background: #fff;
+                   border: 1px solid #888; padding: 8px; display: flex; flex-direction: column; }
+  .menu span, .options span { padding: 4px; cursor: pointer; }
+  #chart { padding: 8px; }
+</style>
+</head>
+<body>
+<div id="app">Загрузка графика…</div>
+<script>const CONFIG = __CONFIG__;</script>
+<script>
+const state = { symbol: CONFIG.symbols[0], timeframe: "M15", iso: false, loaded: null };
+const jitter = (ms) => ms * (1 + CONFIG.jitter * (Math.random() * 2 - 1));
+const later = (ms, fn) => setTimeout(fn, jitter(ms));
+
+function element(tag, attrs, text) {
+  const el = document.createElement(tag);
+  for (const [name, value] of Object.entries(attrs || {})) el.setAttribute(name, value);
+  if (text) el.textContent = text;
+  return el;
+}
+
+function loadChart() {
+  // Как на настоящем графике: кнопка таймфрейма отмечается, а заголовок вкладки меняется только
+  // после загрузки ряда, поэтому выгрузка до этого момента сохранила бы предыдущий ряд
+  const requested = { symbol: state.symbol, timeframe: state.timeframe };
+  fetch(`/bars?symbol=${requested.symbol}&tf=${requested.timeframe}`)
+    .then((response) => response.json())
+    .then((data) => {
+      if (requested.symbol !== state.symbol || requested.timeframe !== state.timeframe) return;
+      document.getElementById("chart").textContent = `${data.symbol} ${data.timeframe}`;
+      for (const button of document.querySelectorAll("button[role='radio']")) {
+        button.setAttribute("aria-checked", button.dataset.timeframe === data.timeframe ? "true" : "false");
+      }
+      document.title = `${data.symbol} ${data.timeframe} — Fake TradingView`;
+      state.loaded = { ...requested };
+    });
+}
+
+function closePopups() {
+  for (const el of document.querySelectorAll(".menu, .dialog")) el.remove();
+}
+
+function openMenu() {
+  closePopups();
+  later(CONFIG.delays.menu, () => {
+    const menu = element("div", { class: "menu", role: "menu" });
+    menu.append(element("span", {}, "Сохранить макет"));
+    const item = element("span", {}, "Экспорт данных графика…");
+    item.addEventListener("click", openDialog);
+    menu.append(item);
+    document.body.append(menu);
+  });
+}
+
+function openDialog() {
+  closePopups();
+  state.iso = false;  // Диалог каждый раз открывается с форматом времени по умолчанию
+  later(CONFIG.delays.dialog, () => {
+    const dialog = element("div", { class: "dialog", role: "dialog" });
+    dialog.append(element("div", {}, "Экспорт данных графика"));
+    const select = element("span", { class: "select" }, "Временной шаг UNIX");
+    const options = element("div", { class: "options hidden" });
+    for (const [label, iso] of [["Временной шаг UNIX", false], ["Время в формате ISO", true]]) {
+      const option = element("span", {}, label);
+      option.addEventListener("click", () => {
+        state.iso = iso;
+        select.textContent = label;
+        options.classList.add("hidden");
+      });
+      options.append(option);
+    }
+    select.addEventListener("click", () => later(CONFIG.delays.options, () => options.classList.remove("hidden")));
+    const exportButton = element("button", {});
+    exportButton.append(element("span", {}, "Экспорт"));
+    exportButton.addEventListener("click", () => {
+      dialog.remove();
+      // Выгружается ряд, который уже загружен на график, а не последний выбранный
+      const loaded = state.loaded;
+      const link = element("a", {
+        href: `/export?symbol=${loaded.symbol}&tf=${loaded.timeframe}&iso=${state.iso ? 1 : 0}`,
+        download: `BINANCE_${loaded.symbol}, ${loaded.timeframe}.csv`,
+      });
+      document.body.append(link);
+      link.click();
+      link.remove();
+    });
+    const cancelButton = element("button", {});
+    cancelButton.append(element("span", {}, "Отмена"));
+    cancelButton.addEventListener("click", () => dialog.remove());
+    dialog.append(select, options, exportButton, cancelButton);
+    document.body.append(dialog);
+  });
+}
+
+function render() {
+  const app = document.getElementById("app");
+  app.textContent = "";
+  const toolbar = element("div", { class: "toolbar" });
+  for (const [timeframe, attrs] of Object.entries(CONFIG.timeframes)) {
+    const button = element("button", { ...attrs, "aria-checked": "false", "data-timeframe": timeframe },
+                           attrs["aria-label"]);
+    button.addEventListener("click", () => { state.timeframe = timeframe; loadChart(); });
+    toolbar.append(button);
+  }
+  const manage = element("button", {
+    "data-tooltip": "Управление графиками", "aria-label": "Управление графиками", "aria-haspopup": "menu",
+  }, "⋯");
+  manage.addEventListener("click", openMenu);
+  toolbar.append(manage);
+
+  const watchlist = element("div", { class: "watchlist" });
+  for (const symbol of CONFIG.symbols) {
+    const row = element("div", { "data-symbol-short": symbol }, symbol);
+    row.addEventListener("click", () => { state.symbol = symbol; loadChart(); });
+    watchlist.append(row);
+  }
+  app.append(toolbar, watchlist, element("div", { id: "chart" }));
+  loadChart();
+}
+
+document.addEventListener("keydown", (event) => { if (event.key === "Escape") closePopups(); });
+later(CONFIG.delays.render, render);
+</script>
+</body>
+</html>
+"""
+
+
+def create_app(coins=("BTC", "ETH", "SOL"), rows=500, delays=None, jitter=0.0):
+    """
+    Создаёт aiohttp-приложение с поддельной страницей графика.
+    :param coins: Монеты в списке наблюдения.
+    :param rows: Число свечей в выгрузке.
+    :param delays: Словарь задержек шагов в миллисекундах, см. DEFAULT_DELAYS.
+    :param jitter: Случайный разброс задержек, доля от значения (0.2 = ±20%).
+    """
+    delays = {**DEFAULT_DELAYS, **(delays or {})}
+    symbols = {symbol_name(coin): coin for coin in coins}
+    config = {"symbols": list(symbols), "timeframes": TIMEFRAME_ATTRIBUTES,
+              "delays": delays, "jitter": jitter}
+    page = PAGE_TEMPLATE.replace("__CONFIG__", json.dumps(config, ensure_ascii=False))
+
+    async def sleep(name):
+        delay = delays[name] * (1 + jitter * random.uniform(-1, 1))
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    async def chart(request):
+        await sleep("page")
+        return web.Response(text=page, content_type="text/html", charset="utf-8")
+
+    async def bars(request):
+        await sleep("chart")
+        return web.json_response({"symbol": request.query["symbol"], "timeframe": request.query["tf"]})
+
+    async def export(request):
+        symbol = request.query["symbol"]
+        timeframe = request.query["tf"]
+        if symbol not in symbols or timeframe not in TIMEFRAME_SECONDS:
+            return web.Response(status=404)
+        await sleep("export")
+        period = TIMEFRAME_SECONDS[timeframe]
+        text = "".join(tradingview_export_lines(
+            rows, period, seed=zlib.crc32(f"{symbol}{timeframe}".encode()),
+            iso_time=request.query.get("iso") == "1", end=int(time.time()) // period * period))
+        return web.Response(
+            text=text, content_type="text/csv", charset="utf-8",
+            headers={"Content-Disposition": f'attachment; filename="BINANCE_{symbol}, {timeframe}.csv"'})
+
+    app = web.Application()
+    app.router.add_get("/chart/", chart)
+    app.router.add_get("/bars", bars)
+    app.router.add_get("/export", export)
+    return app
+
+
+def add_delay_arguments(parser):
+    """Аргументы командной строки для задержек шагов (общие с бенчмарком)."""
+    for name, value in DEFAULT_DELAYS.items():
+        parser.add_argument(f"--{name}-delay", type=int, default=value,
+                            help=f"Задержка шага '{name}', мс (по умолчанию {value}).")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Разброс задержек, доля (0.2 = ±20%%).")
+
+
+def delays_from_args(args):
+    return {name: getattr(args, f"{name}_delay") for name in DEFAULT_DELAYS}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--coins", default="BTC,ETH,SOL", help="Монеты через запятую.")
+    parser.add_argument("--rows", type=int, default=500, help="Свечей в выгрузке.")
+    add_delay_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_app(args.coins.split(","), args.rows, delays_from_args(args), args.jitter),
+                host=args.host, port=args.port)
@@ -0,0 +1,66 @@
+"""
+Локальная заглушка API свечей для проверки HttpFeedSource без доступа к бирже.
+Отдаёт записанные свечи из файлов '<таймфрейм>_<монета>.csv' (выгрузки TradingView)
+в формате /fapi/v1/klines фьючерсов Binance.
+
+Запуск:
+    python -m tools.feed_stub_server --dir app/downloads --port 8081
+и в config.py:
+    DATA_SOURCE = "http"
+    FEED_BASE_URL = "http://127.0.0.1:8081"
+"""
+import argparse
+import os
+from aiohttp import web
+from app.candles import CandleFrame
+from app.data_sources.base import candle_file_name
+from app.data_sources.http_feed import FEED_INTERVALS
+
+
+INTERVAL_TIMEFRAMES = {interval: timeframe for timeframe, interval in FEED_INTERVALS.items()}
+
+
+def frame_to_klines(frame):
+    """Переводит CandleFrame в список свечей формата /fapi/v1/klines."""
+    volume = frame.columns.get("Volume", frame.columns.get("volume"))
+    klines = []
+    for index in range(len(frame)):
+        open_time = int(frame["time"][index]) * 1000
+        klines.append([
+            open_time,
+            str(frame["open"][index]),
+            str(frame["high"][index]),
+            str(frame["low"][index]),
+            str(frame["close"][index]),
+            str(volume[index]) if volume is not None else "0",
+            open_time,
+        ])
+    return klines
+
+
+def create_app(candles_dir, quote="USDT"):
+    """Создаёт aiohttp-приложение, отдающее свечи из candles_dir."""
+
+    async def klines(request):
+        symbol = request.query["symbol"]
+        timeframe = INTERVAL_TIMEFRAMES.get(request.query["interval"])
+        limit = int(request.query.get("limit", 500))
+        coin = symbol[:-len(quote)] if symbol.endswith(quote) else symbol
+        file_path = os.path.join(candles_dir, candle_file_name(coin, timeframe))
+        if timeframe is None or not os.path.exists(file_path):
+            return web.json_response({"code": -1121, "msg": "Invalid symbol."}, status=400)
+        frame = CandleFrame.from_csv(file_path).tail(limit)
+        return web.json_response(frame_to_klines(frame))
+
+    app = web.Application()
+    app.router.add_get("/fapi/v1/klines", klines)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dir", default="app/downloads", help="Директория с записанными свечами")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    web.run_app(create_app(args.dir), host=args.host, port=args.port)